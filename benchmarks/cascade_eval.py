@@ -0,0 +1,157 @@
+"""
+カスケード（前段の事前分布 → モデル）の評価
+テストデータを1件ずつ推論し、経路（前段のみ / モデル / モデル＋前段）ごとの件数・精度・レイテンシと、
+モデルを省略できた割合を、前段なし（モデルのみ）と比較する。
+
+テストデータにはファイル名がないため、--extension-rateの割合のサンプルには正解ラベルの
+拡張子を付けたファイル名を渡す（アップロードされたファイルの拡張子が正しい場合を模擬する）。
+
+使い方:
+    python -m benchmarks.cascade_eval --model-id lr_baseline_001 --max-samples 2000
+    python -m benchmarks.cascade_eval --model-id lr_baseline_001 --extension-rate 0.5 --blend-weight 0.3
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.inference_benchmark import load_target
+from src.config.config import Config
+from src.data.loader import DataLoaderFactory
+from src.web.cascade import CASCADE_PATHS, EXTENSION_LANGUAGES, FirstStage
+from src.web.inference import WebInference
+
+
+def language_extensions() -> Dict[str, str]:
+    """言語ごとの代表的な拡張子（EXTENSION_LANGUAGESで最初に出てくるもの）"""
+    extensions: Dict[str, str] = {}
+    for extension, language in EXTENSION_LANGUAGES.items():
+        extensions.setdefault(language, extension)
+    return extensions
+
+
+def _summary(correct: List[bool], seconds: List[float], total: int) -> Dict[str, Any]:
+    if not correct:
+        return {"count": 0, "share": 0.0, "accuracy": None, "p50_ms": None, "p95_ms": None, "mean_ms": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(correct),
+        "share": len(correct) / total,
+        "accuracy": float(np.mean(correct)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean())
+    }
+
+
+def evaluate(inference: WebInference, codes: List[str], labels: List[str],
+             filenames: List[Optional[str]]) -> Dict[str, Any]:
+    """1件ずつ推論し、全体と経路ごとの精度・レイテンシを集計する"""
+    correct: Dict[str, List[bool]] = {path: [] for path in CASCADE_PATHS}
+    seconds: Dict[str, List[float]] = {path: [] for path in CASCADE_PATHS}
+    for code, label, filename in zip(codes, labels, filenames):
+        start = time.perf_counter()
+        result = inference.predict_single_text(code, top_k=1, return_all_probabilities=False,
+                                               filename=filename)
+        elapsed = time.perf_counter() - start
+        path = result.get("cascade", {}).get("path", "model")
+        correct[path].append(result["success"] and result["predicted_language"] == label)
+        seconds[path].append(elapsed)
+
+    total = len(codes)
+    overall = _summary(sum(correct.values(), []), sum(seconds.values(), []), total)
+    return {
+        "overall": overall,
+        "skip_rate": len(correct["prior"]) / total,
+        "paths": {path: _summary(correct[path], seconds[path], total) for path in CASCADE_PATHS}
+    }
+
+
+def _print_result(name: str, result: Dict[str, Any]) -> None:
+    overall = result["overall"]
+    print(f"📊 {name}: 精度 {overall['accuracy']:.4f}  平均 {overall['mean_ms']:.2f}ms  "
+          f"p95 {overall['p95_ms']:.2f}ms  モデル省略 {result['skip_rate']:.1%}")
+    for path, summary in result["paths"].items():
+        if summary["count"]:
+            print(f"   {path:<8} {summary['count']:>6}件 ({summary['share']:.1%})  "
+                  f"精度 {summary['accuracy']:.4f}  p50 {summary['p50_ms']:.2f}ms  p95 {summary['p95_ms']:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the cheap first-stage cascade")
+    parser.add_argument('--model-id', default=None)
+    parser.add_argument('--artifact', default=None, help='登録していないモデルファイル（model_idの代わり）')
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--config', default='configs/default.yaml',
+                        help='min_samples_per_class（テストデータの分割）を読み込む設定ファイル')
+    parser.add_argument('--max-samples', type=int, default=None, help='テストデータを先頭N件に制限')
+    parser.add_argument('--extension-rate', type=float, default=0.0,
+                        help='正解ラベルの拡張子を付けたファイル名を渡すサンプルの割合')
+    parser.add_argument('--min-confidence', type=float, default=None,
+                        help='前段だけで判定する確信度（省略時はFirstStageの既定値）')
+    parser.add_argument('--blend-weight', type=float, default=0.0,
+                        help='モデルで推論した入力に混ぜる事前分布の割合')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='experiments/cascade_eval.json')
+    args = parser.parse_args()
+    if (args.model_id is None) == (args.artifact is None):
+        parser.error("Specify exactly one of --model-id or --artifact")
+
+    config = Config.from_yaml(args.config)
+    data_loader = DataLoaderFactory.create_loader(
+        config.data.dataset_name,
+        min_samples_per_class=config.data.min_samples_per_class
+    )
+    _, _, y_test, X_test = data_loader.load()
+    if args.max_samples:
+        y_test, X_test = y_test[:args.max_samples], X_test[:args.max_samples]
+
+    rng = random.Random(args.seed)
+    extensions = language_extensions()
+    filenames = [
+        f"sample{extensions[label]}" if label in extensions and rng.random() < args.extension_rate else None
+        for label in y_test
+    ]
+    print(f"📄 テストデータ {len(X_test)}件（拡張子付き {sum(name is not None for name in filenames)}件）")
+
+    model, preprocessor = load_target(args.model_id, args.artifact, args.registry)
+    first_stage_kwargs = {"blend_weight": args.blend_weight}
+    if args.min_confidence is not None:
+        first_stage_kwargs["min_confidence"] = args.min_confidence
+    first_stage = FirstStage(**first_stage_kwargs)
+
+    # ウォームアップ（初回呼び出しのコストを除く）
+    for inference in (WebInference(model, preprocessor), WebInference(model, preprocessor, first_stage=first_stage)):
+        inference.predict_batch(X_test[:8], top_k=1, return_all_probabilities=False)
+
+    baseline = evaluate(WebInference(model, preprocessor), X_test, y_test, filenames)
+    _print_result("モデルのみ", baseline)
+    cascade = evaluate(WebInference(model, preprocessor, first_stage=first_stage), X_test, y_test, filenames)
+    _print_result("カスケード", cascade)
+    speedup = baseline["overall"]["mean_ms"] / cascade["overall"]["mean_ms"]
+    print(f"🚀 平均レイテンシ {speedup:.2f}倍、精度の差 "
+          f"{cascade['overall']['accuracy'] - baseline['overall']['accuracy']:+.4f}")
+
+    output = {
+        "model_id": args.model_id,
+        "artifact": args.artifact,
+        "samples": len(X_test),
+        "extension_rate": args.extension_rate,
+        "min_confidence": first_stage.min_confidence,
+        "blend_weight": first_stage.blend_weight,
+        "baseline": baseline,
+        "cascade": cascade,
+        "mean_latency_speedup": speedup
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
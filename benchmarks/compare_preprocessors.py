@@ -0,0 +1,124 @@
+"""
+前処理方式の比較ベンチマーク
+デフォルト / lightweight / hashing の精度・モデルサイズ・transformスループットを比較
+
+使い方:
+    python -m benchmarks.compare_preprocessors --output experiments/preprocessor_comparison.json
+"""
+import argparse
+import io
+import json
+import time
+from typing import Any, Dict, List
+
+import joblib
+from sklearn.metrics import accuracy_score, f1_score
+
+from src.config.config import Config
+from src.data.loader import DataLoaderFactory
+from src.data.preprocessor import NaturalLanguagePreprocessor
+from src.models.classifier import ModelFactory
+
+
+# 比較する前処理設定（名前, NaturalLanguagePreprocessorの引数）
+SETTINGS = [
+    ("default", {}),
+    ("lightweight", {"lightweight": True}),
+    ("hashing_2^16", {"hashing": True, "n_features": 2 ** 16}),
+    ("hashing_2^17", {"hashing": True, "n_features": 2 ** 17}),
+    ("hashing_2^18", {"hashing": True, "n_features": 2 ** 18}),
+    ("hashing_2^17_no_idf", {"hashing": True, "n_features": 2 ** 17, "use_idf": False}),
+]
+
+
+def _dumped_size_mb(obj: Any) -> float:
+    """joblib.dumpした場合のサイズ（MB）"""
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def run_setting(name: str, kwargs: Dict[str, Any], model_type: str, model_params: Dict[str, Any],
+                X_train: List[str], y_train: List[str], X_test: List[str], y_test: List[str]) -> Dict[str, Any]:
+    """1つの前処理設定で学習・評価し、計測結果を返す"""
+    print(f"🔧 {name} を評価中...")
+    preprocessor = NaturalLanguagePreprocessor(**kwargs)
+
+    start = time.perf_counter()
+    X_train_vec = preprocessor.fit_transform(X_train)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X_test_vec = preprocessor.transform(X_test)
+    transform_time = time.perf_counter() - start
+
+    model = ModelFactory.create_model(model_type, **model_params)
+    start = time.perf_counter()
+    model.fit(X_train_vec, y_train)
+    train_time = time.perf_counter() - start
+
+    y_pred = model.predict(X_test_vec)
+    vectorizer_mb = _dumped_size_mb(preprocessor.vectorizer)
+    model_mb = _dumped_size_mb(model.model)
+
+    result = {
+        "name": name,
+        "settings": kwargs,
+        "n_features": int(X_train_vec.shape[1]),
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "f1_score": float(f1_score(y_test, y_pred, average='weighted')),
+        "vectorizer_size_mb": vectorizer_mb,
+        "model_size_mb": model_mb,
+        "total_size_mb": vectorizer_mb + model_mb,
+        "fit_transform_seconds": fit_time,
+        "train_seconds": train_time,
+        "transform_seconds": transform_time,
+        "transform_docs_per_second": len(X_test) / transform_time if transform_time > 0 else None
+    }
+    print(f"   精度: {result['accuracy']:.4f}  サイズ: {result['total_size_mb']:.1f}MB  "
+          f"transform: {result['transform_docs_per_second']:.0f} docs/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare preprocessing modes")
+    parser.add_argument('--config', default='configs/lightweight.yaml',
+                        help='モデル設定とmin_samples_per_classを読み込む設定ファイル')
+    parser.add_argument('--settings', nargs='*', default=None,
+                        help=f'比較する設定名（省略時は全て: {", ".join(name for name, _ in SETTINGS)}）')
+    parser.add_argument('--max-train-samples', type=int, default=None,
+                        help='訓練データを先頭N件に制限（短時間での比較用）')
+    parser.add_argument('--output', default='experiments/preprocessor_comparison.json')
+    args = parser.parse_args()
+
+    config = Config.from_yaml(args.config)
+    data_loader = DataLoaderFactory.create_loader(
+        config.data.dataset_name,
+        min_samples_per_class=config.data.min_samples_per_class
+    )
+    y_train, X_train, y_test, X_test = data_loader.load()
+    if args.max_train_samples:
+        X_train, y_train = X_train[:args.max_train_samples], y_train[:args.max_train_samples]
+
+    selected = [(name, kwargs) for name, kwargs in SETTINGS
+                if args.settings is None or name in args.settings]
+    results = [
+        run_setting(name, kwargs, config.model.model_type, config.model.parameters,
+                    X_train, y_train, X_test, y_test)
+        for name, kwargs in selected
+    ]
+
+    print("\n📊 比較結果")
+    print(f"{'設定':<22}{'精度':>8}{'F1':>8}{'サイズMB':>10}{'docs/s':>10}")
+    for r in results:
+        print(f"{r['name']:<22}{r['accuracy']:>8.4f}{r['f1_score']:>8.4f}"
+              f"{r['total_size_mb']:>10.1f}{r['transform_docs_per_second']:>10.0f}")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": args.config, "n_train": len(X_train), "n_test": len(X_test),
+                   "results": results}, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
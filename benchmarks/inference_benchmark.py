@@ -0,0 +1,240 @@
+"""
+推論のマイクロベンチマーク
+登録済みモデル（model_info.json）またはローカルのモデルファイルについて、
+コールドロード時間・メモリ、入力長ごとの単一推論レイテンシ、バッチスループットを計測する
+
+使い方:
+    python -m benchmarks.inference_benchmark --model-id lr_baseline_001
+    python -m benchmarks.inference_benchmark --artifact experiments/xxx/model.joblib \\
+        --baseline experiments/inference_benchmark.json   # 前回結果と比較（悪化していれば終了コード1）
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.memory import current_rss_bytes
+
+
+# 入力長のバケット（名前, 最小文字数, 最大文字数）
+LENGTH_BUCKETS = [
+    ("<256", 32, 256),
+    ("256-1K", 256, 1024),
+    ("1K-4K", 1024, 4096),
+    ("4K-16K", 4096, 16384),
+    ("16K-64K", 16384, 65536),
+]
+
+# 疑似コード片のテンプレート（{name}・{n}を置換して使う）
+SNIPPET_TEMPLATES = {
+    "Python": ["def {name}(x):", "    return x + {n}", "import os", "for i in range({n}):",
+               "    print({name}(i))", "class {name}Handler:", "    pass"],
+    "JavaScript": ["function {name}(x) {{", "  return x + {n};", "}}", "const {name}s = [];",
+                   "console.log({name}({n}));", "for (let i = 0; i < {n}; i++) {{ }}"],
+    "Go": ["package main", "import \"fmt\"", "func {name}(x int) int {{", "\treturn x + {n}", "}}",
+           "fmt.Println({name}({n}))"],
+    "Rust": ["fn {name}(x: i32) -> i32 {{", "    x + {n}", "}}", "let mut {name}s = Vec::new();",
+             "println!(\"{{}}\", {name}({n}));"],
+    "C": ["#include <stdio.h>", "int {name}(int x) {{", "    return x + {n};", "}}",
+          "printf(\"%d\\n\", {name}({n}));"],
+    "Ruby": ["def {name}(x)", "  x + {n}", "end", "puts {name}({n})", "{name}s = []"],
+}
+
+DEFAULT_BATCH_SIZES = [1, 8, 32, 128]
+
+# ベースラインからこの割合以上悪化したら回帰とみなす
+DEFAULT_MAX_REGRESSION = 0.2
+
+
+def synthetic_snippet(rng: random.Random, min_chars: int, max_chars: int) -> str:
+    """指定範囲の長さの疑似コード片を作る"""
+    target = rng.randint(min_chars, max_chars)
+    lines = SNIPPET_TEMPLATES[rng.choice(sorted(SNIPPET_TEMPLATES))]
+    parts: List[str] = []
+    length = 0
+    while length < target:
+        line = rng.choice(lines).format(name=f"fn{rng.randint(0, 9999)}", n=rng.randint(0, 999))
+        parts.append(line)
+        length += len(line) + 1
+    return "\n".join(parts)[:target]
+
+
+def load_target(model_id: Optional[str], artifact: Optional[str], registry: str) -> Tuple[Any, Any]:
+    """(モデル, 前処理器)を読み込む"""
+    from src.models.classifier import LogisticRegressionModel
+    from src.models.artifact import is_compact_artifact, load_compact_artifact
+
+    if model_id is not None:
+        from src.web.model_manager import ModelManager
+        return ModelManager(registry).get_model_and_preprocessor(model_id, wait=True)
+
+    if is_compact_artifact(artifact):
+        classifier, preprocessor = load_compact_artifact(artifact)
+    else:
+        import joblib
+        container = joblib.load(artifact)
+        if not isinstance(container, dict):
+            raise ValueError("Model-only (old format) artifacts need a preprocessor; "
+                             "register the model and use --model-id instead")
+        classifier, preprocessor = container["model"], container["vectorizer"]
+    return LogisticRegressionModel.from_fitted(classifier), preprocessor
+
+
+def _cold_load(model_id: Optional[str], artifact: Optional[str], registry: str) -> Dict[str, Any]:
+    """新しいプロセスで読み込み時間とメモリを計測（spawnで実行）"""
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    load_target(model_id, artifact, registry)
+    load_seconds = time.perf_counter() - start
+    rss_after = current_rss_bytes()
+    return {
+        "load_seconds": load_seconds,
+        "rss_mb_after_load": rss_after / (1024 * 1024) if rss_after else None,
+        "rss_delta_mb": (rss_after - rss_before) / (1024 * 1024) if rss_after and rss_before else None
+    }
+
+
+def measure_cold_load(model_id: Optional[str], artifact: Optional[str], registry: str,
+                      runs: int) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    samples = []
+    for _ in range(runs):
+        with context.Pool(1) as pool:
+            samples.append(pool.apply(_cold_load, (model_id, artifact, registry)))
+    load_times = [sample["load_seconds"] for sample in samples]
+    return {
+        "runs": runs,
+        "load_seconds_median": float(np.median(load_times)),
+        "load_seconds_min": float(np.min(load_times)),
+        "rss_mb_after_load": samples[-1]["rss_mb_after_load"],
+        "rss_delta_mb": samples[-1]["rss_delta_mb"]
+    }
+
+
+def _percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean())
+    }
+
+
+def measure_latency(inference: Any, samples_per_bucket: int, seed: int) -> Dict[str, Any]:
+    """入力長バケットごとの単一推論レイテンシ"""
+    rng = random.Random(seed)
+    for _ in range(10):
+        inference.predict_single_text(synthetic_snippet(rng, 256, 1024))
+
+    results = {}
+    for name, min_chars, max_chars in LENGTH_BUCKETS:
+        snippets = [synthetic_snippet(rng, min_chars, max_chars) for _ in range(samples_per_bucket)]
+        times = []
+        for snippet in snippets:
+            start = time.perf_counter()
+            inference.predict_single_text(snippet)
+            times.append(time.perf_counter() - start)
+        results[name] = {"samples": samples_per_bucket, **_percentiles(times)}
+        print(f"   {name:<8} p50={results[name]['p50_ms']:.2f}ms  p95={results[name]['p95_ms']:.2f}ms  "
+              f"p99={results[name]['p99_ms']:.2f}ms")
+    return results
+
+
+def measure_throughput(inference: Any, batch_sizes: List[int], n_docs: int, seed: int) -> Dict[str, Any]:
+    """バッチサイズごとのスループット（入力長は256〜4K文字）"""
+    rng = random.Random(seed + 1)
+    docs = [synthetic_snippet(rng, 256, 4096) for _ in range(n_docs)]
+    results = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, n_docs, batch_size):
+            inference.predict_batch(docs[i:i + batch_size], return_all_probabilities=False)
+        elapsed = time.perf_counter() - start
+        results[str(batch_size)] = {"docs": n_docs, "seconds": elapsed, "docs_per_second": n_docs / elapsed}
+        print(f"   batch={batch_size:<5} {n_docs / elapsed:.0f} docs/s")
+    return results
+
+
+def compare_with_baseline(result: Dict[str, Any], baseline: Dict[str, Any],
+                          max_regression: float) -> List[str]:
+    """ベースラインから悪化した項目の一覧"""
+    regressions = []
+    for bucket, current in result["latency"].items():
+        previous = baseline.get("latency", {}).get(bucket)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if current[key] > previous[key] * (1 + max_regression):
+                regressions.append(f"latency {bucket} {key}: {previous[key]:.2f} -> {current[key]:.2f}")
+    for batch_size, current in result["throughput"].items():
+        previous = baseline.get("throughput", {}).get(batch_size)
+        if previous is not None and current["docs_per_second"] < previous["docs_per_second"] * (1 - max_regression):
+            regressions.append(f"throughput batch={batch_size}: {previous['docs_per_second']:.0f} -> "
+                               f"{current['docs_per_second']:.0f} docs/s")
+    previous_load = baseline.get("cold_load", {}).get("load_seconds_median")
+    current_load = result.get("cold_load", {}).get("load_seconds_median")
+    if previous_load and current_load and current_load > previous_load * (1 + max_regression):
+        regressions.append(f"cold load: {previous_load:.3f} -> {current_load:.3f}s")
+    return regressions
+
+
+def main():
+    from src.web.inference import WebInference
+
+    parser = argparse.ArgumentParser(description="Inference micro-benchmark")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--model-id', help='model_info.jsonに登録されたモデルID')
+    target.add_argument('--artifact', help='ローカルのモデルファイル（joblib新形式またはコンパクト形式）')
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--samples-per-bucket', type=int, default=200)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--throughput-docs', type=int, default=1024)
+    parser.add_argument('--cold-runs', type=int, default=3, help='コールドロードの計測回数（0で省略）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=None, help='比較する前回のベンチマーク結果JSON')
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument('--output', default='experiments/inference_benchmark.json')
+    args = parser.parse_args()
+
+    result: Dict[str, Any] = {"model_id": args.model_id, "artifact": args.artifact}
+    if args.cold_runs > 0:
+        print("🧊 コールドロードを計測中...")
+        result["cold_load"] = measure_cold_load(args.model_id, args.artifact, args.registry, args.cold_runs)
+        print(f"   {result['cold_load']['load_seconds_median']:.3f}s, "
+              f"RSS {result['cold_load']['rss_mb_after_load'] or 0:.0f}MB")
+
+    model, preprocessor = load_target(args.model_id, args.artifact, args.registry)
+    # キャッシュなし（毎回実際に推論する）
+    inference = WebInference(model, preprocessor)
+
+    print("⏱️ 単一推論レイテンシ")
+    result["latency"] = measure_latency(inference, args.samples_per_bucket, args.seed)
+    print("🚀 バッチスループット")
+    result["throughput"] = measure_throughput(inference, args.batch_sizes, args.throughput_docs, args.seed)
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.max_regression)
+        if regressions:
+            print(f"❌ ベースラインから{args.max_regression:.0%}以上悪化しました:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ ベースラインからの悪化はありません")
+
+
+if __name__ == "__main__":
+    main()
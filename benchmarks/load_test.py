@@ -0,0 +1,135 @@
+"""
+推論HTTPサービスの負荷テスト
+localhostで起動した src.web.server に同時接続数concurrencyでリクエストを送り、
+スループット・レイテンシ・503（キューあふれ）の件数を計測する
+
+使い方:
+    python -m src.web.server --port 8000 &
+    python -m benchmarks.load_test --port 8000 --concurrency 64 --requests 5000
+    # マイクロバッチなしとの比較: サーバーを --max-batch-size 1 で起動して同じ条件で実行
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.inference_benchmark import synthetic_snippet
+
+
+async def _post(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str,
+                body: bytes) -> Tuple[int, Dict[str, Any]]:
+    """keep-aliveの接続で/predictにPOSTし、(ステータス, JSON)を返す"""
+    writer.write(
+        f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed the connection")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host: str, port: int, bodies: List[bytes], next_index: List[int],
+                  latencies: List[float], statuses: Dict[int, int], batch_sizes: List[int]) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while next_index[0] < len(bodies):
+            body = bodies[next_index[0]]
+            next_index[0] += 1
+            start = time.perf_counter()
+            status, response = await _post(reader, writer, host, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200 and "batch_size" in response:
+                batch_sizes.append(response["batch_size"])
+    finally:
+        writer.close()
+
+
+async def run_load_test(host: str, port: int, model_id: Optional[str], n_requests: int,
+                        concurrency: int, min_chars: int, max_chars: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(n_requests):
+        payload = {"text": synthetic_snippet(rng, min_chars, max_chars)}
+        if model_id:
+            payload["model_id"] = model_id
+        bodies.append(json.dumps(payload).encode("utf-8"))
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    batch_sizes: List[int] = []
+    next_index = [0]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, bodies, next_index, latencies, statuses, batch_sizes)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": n_requests / elapsed,
+        "ok": statuses.get(200, 0),
+        "rejected_503": statuses.get(503, 0),
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99))
+        },
+        "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the inference HTTP service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model-id', default=None, help='省略時はサービスの既定モデル')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--min-chars', type=int, default=256)
+    parser.add_argument('--max-chars', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    print(f"🔥 {args.requests}件を同時接続数{args.concurrency}で送信中: http://{args.host}:{args.port}")
+    result = asyncio.run(run_load_test(
+        args.host, args.port, args.model_id, args.requests, args.concurrency,
+        args.min_chars, args.max_chars, args.seed
+    ))
+    print(f"🚀 {result['requests_per_second']:.0f} req/s  "
+          f"p50={result['latency_ms']['p50']:.1f}ms  p95={result['latency_ms']['p95']:.1f}ms  "
+          f"p99={result['latency_ms']['p99']:.1f}ms")
+    print(f"📦 平均バッチサイズ {result['mean_batch_size']:.1f}  "
+          f"成功 {result['ok']}  503 {result['rejected_503']}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
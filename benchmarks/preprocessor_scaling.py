@@ -0,0 +1,91 @@
+"""
+並列前処理（NaturalLanguagePreprocessor n_jobs）のスケーリングベンチマーク
+ワーカー数ごとにfit / transform時間を計測し、逐次fitと語彙が一致するかを確認する
+
+使い方:
+    python -m benchmarks.preprocessor_scaling --workers 1 2 4 8
+    python -m benchmarks.preprocessor_scaling --synthetic 50000   # データセット不要
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from src.data.loader import DataLoaderFactory
+from src.data.preprocessor import NaturalLanguagePreprocessor
+
+
+def synthetic_corpus(n_docs: int, seed: int = 0) -> List[str]:
+    """オフライン計測用の疑似コード文書"""
+    rng = random.Random(seed)
+    tokens = ["def", "return", "int", "void", "fn", "let", "var", "func", "end", "begin",
+              "print", "puts", "println", "import", "include", "class", "struct", "if", "else", "for"]
+    tokens += [f"ident{i}" for i in range(5000)]
+    return [" ".join(rng.choice(tokens) for _ in range(rng.randint(20, 400))) for _ in range(n_docs)]
+
+
+def run(docs: List[str], n_jobs: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    preprocessor = NaturalLanguagePreprocessor(n_jobs=n_jobs, **kwargs)
+    start = time.perf_counter()
+    preprocessor.fit(docs)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = preprocessor.transform(docs)
+    transform_time = time.perf_counter() - start
+    return {
+        "n_jobs": n_jobs,
+        "fit_seconds": fit_time,
+        "transform_seconds": transform_time,
+        "transform_docs_per_second": len(docs) / transform_time,
+        "n_features": int(matrix.shape[1]),
+        "_preprocessor": preprocessor
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel preprocessing scaling benchmark")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--lightweight', action='store_true', help='lightweight設定のベクトライザーを使う')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Rosetta Codeの代わりにN件の疑似文書を使う')
+    parser.add_argument('--output', default='experiments/preprocessor_scaling.json')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        docs = synthetic_corpus(args.synthetic)
+    else:
+        _, docs, _, _ = DataLoaderFactory.create_loader(
+            "programming_language", min_samples_per_class=200
+        ).load()
+    kwargs = {"lightweight": args.lightweight}
+    print(f"📥 文書数: {len(docs)}")
+
+    results = []
+    baseline = None
+    for n_jobs in args.workers:
+        result = run(docs, n_jobs, kwargs)
+        preprocessor = result.pop("_preprocessor")
+        if baseline is None:
+            baseline = preprocessor
+        result["vocabulary_matches_first"] = (
+            getattr(preprocessor.vectorizer, "vocabulary_", None)
+            == getattr(baseline.vectorizer, "vocabulary_", None)
+        )
+        result["fit_speedup"] = results[0]["fit_seconds"] / result["fit_seconds"] if results else 1.0
+        result["transform_speedup"] = (
+            results[0]["transform_seconds"] / result["transform_seconds"] if results else 1.0
+        )
+        results.append(result)
+        print(f"⚙️  n_jobs={n_jobs}: fit {result['fit_seconds']:.2f}s (x{result['fit_speedup']:.2f}), "
+              f"transform {result['transform_seconds']:.2f}s (x{result['transform_speedup']:.2f}), "
+              f"語彙一致: {result['vocabulary_matches_first']}")
+
+    with open(args.output, "w") as f:
+        json.dump({"n_docs": len(docs), "settings": kwargs, "results": results}, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+起動時間ベンチマーク
+Webアプリが読み込むモジュール（src.web）のimport時間と、プロセス起動から最初の推論までの時間を
+新しいプロセスで計測し、重い依存関係の混入やimport時間の悪化を検出する
+
+使い方:
+    python -m benchmarks.startup --model-id lr_baseline_001 --output experiments/startup.json
+    python -m benchmarks.startup --model-id lr_baseline_001 \\
+        --baseline experiments/startup.json   # 悪化していれば終了コード1
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Webアプリの起動時にimportされるモジュール
+WEB_MODULES = ["src.web.cache", "src.web.inference", "src.web.model_manager", "src.web.warmup"]
+
+# 起動時に読み込まれてはいけない重い依存（必要になったコードパスでだけ読み込む）
+FORBIDDEN_MODULES = [
+    "datasets", "pandas", "matplotlib", "seaborn", "sklearn", "scipy",
+    "transformers", "tensorflow"
+]
+
+# ベースラインからこの割合以上悪化したら回帰とみなす
+DEFAULT_MAX_REGRESSION = 0.2
+
+# 最初の推論までを計測する子プロセスのスクリプト
+FIRST_PREDICTION_SCRIPT = """
+import time
+start = time.perf_counter()
+import json, sys
+from src.web.inference import WebInference
+from src.web.model_manager import ModelManager
+imported = time.perf_counter()
+from benchmarks.inference_benchmark import load_target
+model, preprocessor = load_target({model_id!r}, {artifact!r}, {registry!r})
+loaded = time.perf_counter()
+result = WebInference(model, preprocessor).predict_single_text("def main():\\n    print('hello')\\n")
+predicted = time.perf_counter()
+assert result["success"], result
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "load_seconds": loaded - imported,
+    "first_prediction_seconds": predicted - loaded,
+    "time_to_first_prediction_seconds": predicted - start
+}}))
+"""
+
+
+def _parse_importtime(stderr: str) -> Tuple[float, Set[str]]:
+    """-X importtimeの出力から(トップレベルimportの合計秒数, 読み込まれたモジュール名)を取得"""
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        # インデントのない行がトップレベルのimport
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1e6, modules
+
+
+def measure_imports(modules: List[str], runs: int) -> Dict[str, Any]:
+    """新しいプロセスでmodulesをimportする時間（中央値）と、読み込まれた禁止モジュール"""
+    seconds = []
+    imported: Set[str] = set()
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        )
+        total, imported = _parse_importtime(completed.stderr)
+        seconds.append(total)
+    forbidden = sorted({
+        name for name in imported
+        if name.split(".")[0] in FORBIDDEN_MODULES
+    })
+    return {
+        "modules": modules,
+        "runs": runs,
+        "import_seconds_median": float(np.median(seconds)),
+        "import_seconds_min": float(np.min(seconds)),
+        "n_modules_imported": len(imported),
+        "forbidden_modules_imported": sorted({name.split(".")[0] for name in forbidden})
+    }
+
+
+def measure_first_prediction(model_id: Optional[str], artifact: Optional[str],
+                             registry: str, runs: int) -> Dict[str, Any]:
+    """プロセス起動から最初の推論結果が出るまでの時間（中央値）"""
+    script = FIRST_PREDICTION_SCRIPT.format(model_id=model_id, artifact=artifact, registry=registry)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT,
+                                   capture_output=True, text=True, check=True)
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample["process_seconds"] = time.perf_counter() - start
+        samples.append(sample)
+    return {
+        key: float(np.median([sample[key] for sample in samples]))
+        for key in samples[0]
+    }
+
+
+def compare_with_baseline(result: Dict[str, Any], baseline: Dict[str, Any],
+                          max_regression: float) -> List[str]:
+    """ベースラインから悪化した項目の一覧"""
+    regressions = []
+    checks = [
+        ("imports", "import_seconds_median"),
+        ("first_prediction", "time_to_first_prediction_seconds"),
+        ("first_prediction", "process_seconds"),
+    ]
+    for section, key in checks:
+        previous = baseline.get(section, {}).get(key)
+        current = result.get(section, {}).get(key)
+        if previous and current and current > previous * (1 + max_regression):
+            regressions.append(f"{section}.{key}: {previous:.3f} -> {current:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--model-id', help='最初の推論に使う登録済みモデルID')
+    target.add_argument('--artifact', help='最初の推論に使うローカルのモデルファイル')
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', default=None, help='比較する前回のベンチマーク結果JSON')
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument('--output', default='experiments/startup_benchmark.json')
+    args = parser.parse_args()
+
+    print("📦 import時間を計測中...")
+    result: Dict[str, Any] = {"imports": measure_imports(WEB_MODULES, args.runs)}
+    print(f"   {result['imports']['import_seconds_median'] * 1000:.0f}ms "
+          f"({result['imports']['n_modules_imported']} modules)")
+
+    if args.model_id or args.artifact:
+        print("🚀 最初の推論までの時間を計測中...")
+        result["first_prediction"] = measure_first_prediction(
+            args.model_id, args.artifact, args.registry, args.runs
+        )
+        first = result["first_prediction"]
+        print(f"   import {first['import_seconds']:.3f}s + load {first['load_seconds']:.3f}s + "
+              f"predict {first['first_prediction_seconds']:.3f}s "
+              f"(プロセス全体 {first['process_seconds']:.3f}s)")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+    failures = []
+    forbidden = result["imports"]["forbidden_modules_imported"]
+    if forbidden:
+        failures.append(f"起動時に重い依存が読み込まれています: {', '.join(forbidden)}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        failures.extend(compare_with_baseline(result, baseline, args.max_regression))
+    if failures:
+        print("❌ 起動時間の回帰を検出しました:")
+        for failure in failures:
+            print(f"   {failure}")
+        sys.exit(1)
+    print("✅ 回帰はありません")
+
+
+if __name__ == "__main__":
+    main()
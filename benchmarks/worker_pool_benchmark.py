@@ -0,0 +1,98 @@
+"""
+推論ワーカープールのベンチマーク
+ワーカー数ごとのスループットと、プール全体のメモリ（PSSの合計）を計測する。
+PSSの合計がワーカー数に比例して増えなければ、モデルはワーカー間で共有されている。
+
+使い方:
+    python -m benchmarks.worker_pool_benchmark --model-id lr_baseline_001 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.inference_benchmark import synthetic_snippet
+from src.utils.memory import process_memory_bytes
+
+MB = 1024 * 1024
+
+
+def measure_pool(model_manager: Any, model_id: str, n_workers: int, docs: List[str],
+                 batch_size: int) -> Dict[str, Any]:
+    """n_workers個のワーカーでdocsを推論したときのスループットとメモリ"""
+    from src.web.worker_pool import InferenceWorkerPool
+
+    with InferenceWorkerPool(model_manager, [model_id], n_workers=n_workers) as pool:
+        # ウォームアップ（各ワーカーで1バッチ以上）
+        for future in [pool.submit(model_id, docs[:batch_size]) for _ in range(n_workers * 2)]:
+            future.result()
+
+        start = time.perf_counter()
+        futures = [
+            pool.submit(model_id, docs[i:i + batch_size], return_all_probabilities=False)
+            for i in range(0, len(docs), batch_size)
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        memory = pool.memory_stats()
+
+    worker_rss = [worker["rss"] for worker in memory["workers"] if worker["rss"] is not None]
+    return {
+        "n_workers": n_workers,
+        "docs_per_second": len(docs) / elapsed,
+        "seconds": elapsed,
+        "total_pss_mb": memory["total_pss"] / MB if memory["total_pss"] is not None else None,
+        "parent_rss_mb": memory["parent"]["rss"] / MB if memory["parent"]["rss"] is not None else None,
+        "sum_rss_mb": (sum(worker_rss) + (memory["parent"]["rss"] or 0)) / MB if worker_rss else None
+    }
+
+
+def main():
+    from src.web.model_manager import ModelManager
+
+    parser = argparse.ArgumentParser(description="Worker pool benchmark")
+    parser.add_argument('--model-id', required=True)
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--docs', type=int, default=4096)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='experiments/worker_pool_benchmark.json')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    docs = [synthetic_snippet(rng, 256, 4096) for _ in range(args.docs)]
+
+    model_manager = ModelManager(args.registry)
+    model_manager.get_model_and_preprocessor(args.model_id, wait=True)
+    single_rss = process_memory_bytes(os.getpid())["rss"]
+    print(f"📦 モデル読み込み後のRSS: {single_rss / MB if single_rss else float('nan'):.0f}MB "
+          f"(CPU {os.cpu_count()}コア)")
+
+    results = []
+    for n_workers in args.workers:
+        result = measure_pool(model_manager, args.model_id, n_workers, docs, args.batch_size)
+        results.append(result)
+        pss = result["total_pss_mb"]
+        print(f"   workers={n_workers:<3} {result['docs_per_second']:.0f} docs/s  "
+              f"PSS合計 {pss if pss is not None else float('nan'):.0f}MB  "
+              f"(RSSの単純合計 {result['sum_rss_mb'] or float('nan'):.0f}MB)")
+
+    output = {
+        "model_id": args.model_id,
+        "cpu_count": os.cpu_count(),
+        "single_process_rss_mb": single_rss / MB if single_rss else None,
+        "results": results
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"💾 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,12 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.feature_extraction.text import TfidfVectorizer
 import joblib
 
-def rebuild_model():
+def rebuild_model(profiler=None):
     """
     訓練データから軽量モデルを再構築
     GitHub 100MB制限対応
+
+    profiler: src.utils.profiling.StageProfiler（省略時は新規作成し、最後に計測結果を表示）
     """
     try:
         print("🔄 モデルを再構築中...")
@@ -23,6 +25,10 @@ def rebuild_model():
         sys.path.append('.')
         from src.data.loader import DataLoaderFactory
         from src.models.classifier import LogisticRegressionModel
+        from src.utils.profiling import StageProfiler
+        
+        if profiler is None:
+            profiler = StageProfiler()
         
         # 訓練データ読み込み
         print("📥 訓練データを読み込み中...")
@@ -30,7 +36,8 @@ def rebuild_model():
             "programming_language", 
             min_samples_per_class=200
         )
-        y_train, X_train, _, _ = data_loader.load()
+        with profiler.stage("load_data"):
+            y_train, X_train, y_test, X_test = data_loader.load()
         
         # 軽量設定でTF-IDFベクトライザーを作成
         print("🔧 TF-IDFベクトライザーを構築中...")
@@ -43,7 +50,8 @@ def rebuild_model():
         )
         
         # 前処理
-        X_train_tfidf = vectorizer.fit_transform(X_train)
+        with profiler.stage("vectorizer_fit"):
+            X_train_tfidf = vectorizer.fit_transform(X_train)
         
         # 軽量モデル訓練
         print("🤖 軽量モデルを訓練中...")
@@ -53,15 +61,17 @@ def rebuild_model():
             n_jobs=1,  # Cloud環境用
             random_state=42
         )
-        model.fit(X_train_tfidf, y_train)
+        with profiler.stage("model_fit"):
+            model.fit(X_train_tfidf, y_train)
         
         # テストデータで性能評価
         print("📊 モデル性能を評価中...")
-        y_train, X_train, y_test, X_test = data_loader.load()
-        X_test_tfidf = vectorizer.transform(X_test)
+        with profiler.stage("test_transform"):
+            X_test_tfidf = vectorizer.transform(X_test)
         
         # 予測と評価
-        y_pred = model.predict(X_test_tfidf)
+        with profiler.stage("evaluation"):
+            y_pred = model.predict(X_test_tfidf)
         from sklearn.metrics import accuracy_score, f1_score
         
         accuracy = accuracy_score(y_test, y_pred)
@@ -87,11 +97,13 @@ def rebuild_model():
             }
         }
         
-        joblib.dump(model_data, model_path)
+        with profiler.stage("save_model"):
+            joblib.dump(model_data, model_path)
         
         # ファイルサイズ確認
         file_size = os.path.getsize(model_path) / (1024 * 1024)
         print(f"✅ モデル再構築完了! サイズ: {file_size:.1f}MB")
+        print(f"⏱️ ステージごとの計測結果:\n{profiler.format_table()}")
         
         # model_info.jsonを更新
         update_model_info(accuracy, f1, file_size)
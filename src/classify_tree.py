@@ -0,0 +1,317 @@
+"""
+ディレクトリ（ソースツリー）内のファイルを一括で言語判定し、JSONLで出力するCLI
+
+ディレクトリは逐次たどり（一覧をまとめて持たない）、拡張子とサイズで候補を絞ってから
+一定件数のバッチでプロセスプールに渡す。結果は入力順に1行ずつ書き出すため、
+ツリーの大きさによらずメモリ使用量は一定になる。
+
+使い方:
+    python -m src.classify_tree path/to/repo --model-id lr_baseline_001 --output results.jsonl
+    python -m src.classify_tree path/to/repo --output results.jsonl --resume   # 中断した位置から再開
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, dropwhile, islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .data.parallel import resolve_n_jobs
+from .utils.logger import setup_logging, get_logger
+from .web.inference import validate_file_extension, validate_file_size
+
+
+DEFAULT_EXCLUDE_DIRS = [".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox"]
+
+# チェックポイントを書き込む間隔（秒）
+CHECKPOINT_INTERVAL = 5.0
+
+# ワーカープロセスが使う推論エンジン（fork時は親プロセスで読み込んだものを共有する）
+_worker_inference = None
+
+
+def iter_candidates(roots: List[str], max_size_mb: int = 10,
+                    exclude_dirs: Optional[List[str]] = None,
+                    follow_symlinks: bool = False) -> Iterator[str]:
+    """判定対象のファイルパスを決まった順序（ディレクトリごとに名前順）で逐次返す
+
+    拡張子（validate_file_extension）とサイズ（validate_file_size）の条件を満たすものだけを返す。
+    """
+    excluded = set(exclude_dirs if exclude_dirs is not None else DEFAULT_EXCLUDE_DIRS)
+    for root in roots:
+        if os.path.isfile(root):
+            if validate_file_extension(root) and validate_file_size(os.path.getsize(root), max_size_mb):
+                yield root
+            continue
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as scanner:
+                    entries = sorted(scanner, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            subdirectories = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if entry.name not in excluded:
+                            subdirectories.append(entry.path)
+                    elif (entry.is_file(follow_symlinks=follow_symlinks)
+                          and validate_file_extension(entry.name)
+                          and validate_file_size(entry.stat(follow_symlinks=follow_symlinks).st_size,
+                                                 max_size_mb)):
+                        yield entry.path
+                except OSError:
+                    continue
+            # 名前順にたどるため逆順に積む
+            stack.extend(reversed(subdirectories))
+
+
+def _walk_key(root: str, path: str) -> Tuple[Tuple[int, str], ...]:
+    """iter_candidatesがrootの下でpathを返す順序のキー
+
+    各ディレクトリではファイル（名前順）を先に返し、その後にサブディレクトリを名前順にたどる。
+    """
+    parts = os.path.relpath(path, root).split(os.sep) if path != root else []
+    return tuple((1, name) for name in parts[:-1]) + tuple((0, name) for name in parts[-1:])
+
+
+def _resume_candidates(roots: List[str], checkpoint: Optional[Dict[str, Any]], max_size_mb: int,
+                       exclude_dirs: Optional[List[str]]) -> Iterator[Tuple[int, str]]:
+    """(rootの番号, パス)を返す。チェックポイントがあれば最後に処理したパスより後から始める
+
+    走査は名前順で決まっているため、前回からファイルが増減していても処理済みの位置を見失わない。
+    """
+    candidates = chain.from_iterable(
+        ((i, path) for path in iter_candidates([root], max_size_mb, exclude_dirs))
+        for i, root in enumerate(roots)
+    )
+    if not checkpoint:
+        return candidates
+    if checkpoint.get("last_path") is None:
+        # 処理済みの件数だけを記録した古い形式のチェックポイント
+        return islice(candidates, checkpoint["files_done"], None)
+    last_root = checkpoint["last_root"]
+    last_key = _walk_key(roots[last_root], checkpoint["last_path"])
+
+    def processed(item: Tuple[int, str]) -> bool:
+        root_index, path = item
+        return root_index < last_root or (root_index == last_root and _walk_key(roots[root_index], path) <= last_key)
+
+    return dropwhile(processed, candidates)
+
+
+def _batched(items: Iterator[Any], batch_size: int) -> Iterator[List[Any]]:
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _load_inference(registry: str, model_id: str) -> Any:
+    from .web.inference import WebInference
+    from .web.model_manager import ModelManager
+
+    model, preprocessor = ModelManager(registry).get_model_and_preprocessor(model_id, wait=True)
+    return WebInference(model, preprocessor)
+
+
+def _init_classify_worker(registry: str, model_id: str) -> None:
+    """fork以外で起動したワーカーはここでモデルを読み込む"""
+    global _worker_inference
+    if _worker_inference is None:
+        _worker_inference = _load_inference(registry, model_id)
+
+
+def _classify_batch(paths: List[str]) -> List[Dict[str, Any]]:
+    """バッチ内のファイルを読み込み、まとめて推論する（ワーカープロセスで実行）"""
+    records: List[Dict[str, Any]] = [{"path": path} for path in paths]
+    texts = []
+    readable = []
+    for i, path in enumerate(paths):
+        try:
+            with open(path, "rb") as f:
+                texts.append(f.read().decode("utf-8"))
+            readable.append(i)
+        except UnicodeDecodeError:
+            records[i]["error"] = "not UTF-8"
+        except OSError as e:
+            records[i]["error"] = e.strerror or str(e)
+
+    if texts:
+        results = _worker_inference.predict_batch(texts, top_k=1, return_all_probabilities=False)
+        for i, result in zip(readable, results):
+            if not result["success"]:
+                records[i]["error"] = result["error"]
+                continue
+            records[i]["language"] = str(result["predicted_language"])
+            top = result.get("top_predictions")
+            records[i]["confidence"] = top[0]["confidence"] if top else None
+    return records
+
+
+def _read_checkpoint(path: Path, roots: List[str], model_id: str) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("roots") != roots or checkpoint.get("model_id") != model_id:
+        return None
+    return checkpoint
+
+
+def _write_checkpoint(path: Path, checkpoint: Dict[str, Any]) -> None:
+    # 書き込み完了後に入れ替える（中断時に壊れたチェックポイントを残さない）
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    tmp_path.replace(path)
+
+
+def classify_tree(roots: List[str], output: str, registry: str, model_id: str,
+                  n_jobs: int = -1, batch_size: int = 64, max_size_mb: int = 10,
+                  exclude_dirs: Optional[List[str]] = None, resume: bool = False,
+                  progress_interval: float = 10.0) -> Dict[str, Any]:
+    """rootsの下のファイルを判定してoutputにJSONLで書き出し、件数・速度のサマリーを返す
+
+    チェックポイント（<output>.checkpoint）には処理済みの候補数、最後に処理したパスと出力のバイト数を記録する。
+    resume=Trueなら、出力を記録時点まで切り詰め、最後に処理したパスの次の候補から処理する。
+    """
+    global _worker_inference
+    logger = get_logger(__name__)
+    output_path = Path(output)
+    checkpoint_path = output_path.with_name(output_path.name + ".checkpoint")
+
+    checkpoint = _read_checkpoint(checkpoint_path, roots, model_id) if resume else None
+    if not resume:
+        # 前回の実行のチェックポイントを残さない（最初のチェックポイントまでに中断した場合に誤って再開しないように）
+        checkpoint_path.unlink(missing_ok=True)
+    elif checkpoint and checkpoint["output_bytes"] > (output_path.stat().st_size if output_path.exists() else 0):
+        raise ValueError(f"Cannot resume: {output_path} is shorter than recorded in {checkpoint_path} "
+                         f"({checkpoint['output_bytes']} bytes); run without --resume")
+    files_done = checkpoint["files_done"] if checkpoint else 0
+    output_bytes = checkpoint["output_bytes"] if checkpoint else 0
+    last_root = checkpoint.get("last_root") if checkpoint else None
+    last_path = checkpoint.get("last_path") if checkpoint else None
+    if checkpoint:
+        logger.info(f"Resuming after {files_done} files (last: {last_path})")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "ab") as f:
+        # 最後のチェックポイント以降に書かれた行（途中の行を含む）を捨てる
+        f.truncate(output_bytes)
+
+    n_workers = resolve_n_jobs(n_jobs)
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        # 親プロセスで読み込んだモデルをワーカーがコピーオンライトで共有する
+        _worker_inference = _load_inference(registry, model_id)
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+
+    candidates = _resume_candidates(roots, checkpoint, max_size_mb, exclude_dirs)
+    counts = {"files": 0, "errors": 0}
+    languages: Dict[str, int] = {}
+    start = time.perf_counter()
+    last_progress = last_checkpoint = start
+
+    def write_records(f: Any, batch: List[Tuple[int, str]], records: List[Dict[str, Any]]) -> None:
+        nonlocal files_done, last_checkpoint, last_root, last_path
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8"))
+        files_done += len(records)
+        last_root, last_path = batch[-1]
+        counts["files"] += len(records)
+        for record in records:
+            if "error" in record:
+                counts["errors"] += 1
+            else:
+                languages[record["language"]] = languages.get(record["language"], 0) + 1
+        now = time.perf_counter()
+        if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+            f.flush()
+            _write_checkpoint(checkpoint_path, {
+                "roots": roots, "model_id": model_id,
+                "files_done": files_done, "last_root": last_root, "last_path": last_path,
+                "output_bytes": f.tell()
+            })
+            last_checkpoint = now
+
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                             initializer=_init_classify_worker, initargs=(registry, model_id)) as executor, \
+            open(output_path, "ab") as f:
+        # 同時に処理中のバッチ数を制限し、結果は投入順に書き出す
+        pending = deque()
+        for batch in _batched(candidates, batch_size):
+            pending.append((batch, executor.submit(_classify_batch, [path for _, path in batch])))
+            if len(pending) >= n_workers * 2:
+                batch, future = pending.popleft()
+                write_records(f, batch, future.result())
+            now = time.perf_counter()
+            if now - last_progress >= progress_interval:
+                logger.info(f"{files_done} files ({counts['files'] / (now - start):.0f} files/s, "
+                            f"{counts['errors']} errors)")
+                last_progress = now
+        while pending:
+            batch, future = pending.popleft()
+            write_records(f, batch, future.result())
+        f.flush()
+        _write_checkpoint(checkpoint_path, {
+            "roots": roots, "model_id": model_id, "files_done": files_done,
+            "last_root": last_root, "last_path": last_path,
+            "output_bytes": f.tell(), "completed": True
+        })
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": counts["files"],
+        "files_total": files_done,
+        "errors": counts["errors"],
+        "seconds": elapsed,
+        "files_per_second": counts["files"] / elapsed if elapsed > 0 else 0.0,
+        "languages": dict(sorted(languages.items(), key=lambda item: -item[1]))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every source file under directories (JSONL output)")
+    parser.add_argument('roots', nargs='+', help='Directories (or files) to classify')
+    parser.add_argument('--output', default='classified.jsonl', help='Output JSONL (path, language, confidence)')
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--model-id', default=None, help='Registered model id (default: default_model_id)')
+    parser.add_argument('--jobs', type=int, default=-1, help='Number of worker processes (-1: all cores)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Files per inference batch')
+    parser.add_argument('--max-size-mb', type=int, default=10, help='Skip files larger than this')
+    parser.add_argument('--exclude-dir', action='append', default=None,
+                        help=f'Directory names to skip (default: {", ".join(DEFAULT_EXCLUDE_DIRS)})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue from <output>.checkpoint instead of starting over')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='Seconds between progress logs')
+    args = parser.parse_args()
+
+    setup_logging()
+    logger = get_logger(__name__)
+
+    model_id = args.model_id
+    if model_id is None:
+        from .web.model_manager import ModelManager
+        model_id = ModelManager(args.registry).get_default_model_id()
+
+    summary = classify_tree(
+        args.roots, args.output, args.registry, model_id, n_jobs=args.jobs,
+        batch_size=args.batch_size, max_size_mb=args.max_size_mb, exclude_dirs=args.exclude_dir,
+        resume=args.resume, progress_interval=args.progress_interval
+    )
+    logger.info(f"Classified {summary['files']} files in {summary['seconds']:.1f}s "
+                f"({summary['files_per_second']:.0f} files/s, {summary['errors']} errors) -> {args.output}")
+    for language, count in list(summary["languages"].items())[:10]:
+        logger.info(f"  {language}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import yaml
 
 @dataclass
@@ -10,6 +10,10 @@ class DataConfig:
     normalize: bool = True
     min_samples_per_class: int = 10
     lightweight: bool = False  # 軽量化モードフラグ
+    hashing: bool = False  # ハッシュ方式（語彙なし）の前処理を使うか
+    hashing_n_features: int = 2 ** 17
+    hashing_use_idf: bool = True
+    preprocess_n_jobs: int = 1  # 前処理のfit / transformの並列ワーカー数（-1で全コア）
 
 @dataclass
 class ModelConfig:
@@ -26,6 +30,9 @@ class TrainingConfig:
     learning_rate: float = 0.001
     early_stopping: bool = True
     patience: int = 5
+    streaming: bool = False  # チャンク単位のpartial_fitで訓練（out-of-core）
+    chunk_size: int = 5000  # streaming時の1チャンクあたりのサンプル数
+    chunk_source: Optional[str] = None  # streaming時のデータ源（"package.module:function"。省略時はデータセットのキャッシュ）
 
 @dataclass
 class LoggingConfig:
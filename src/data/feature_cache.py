@@ -0,0 +1,99 @@
+"""TF-IDF特徴量行列のキャッシュ"""
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+
+from ..utils.logger import get_logger
+
+
+DEFAULT_FEATURE_CACHE_DIR = "data/cache/features"
+
+
+def labels_digest(labels: List[str]) -> str:
+    """ラベル列のハッシュ（キャッシュした行列と行順が一致するかの確認用）"""
+    hasher = hashlib.sha256()
+    for label in labels:
+        hasher.update(str(label).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class FeatureCache:
+    """学習済みベクトライザーとtrain/testの疎行列をディスクに保存する
+
+    キーはデータセットのfingerprint・ローダー設定・前処理器設定から作るため、
+    model.parametersだけを変えた実験ではベクトル化を丸ごと省略できる。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_FEATURE_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.logger = get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def make_key(dataset_fingerprint: str,
+                 loader_params: Dict[str, Any],
+                 preprocessor_params: Dict[str, Any]) -> str:
+        """キャッシュキーを生成"""
+        payload = json.dumps(
+            {
+                "dataset": dataset_fingerprint,
+                "loader": loader_params,
+                "preprocessor": preprocessor_params
+            },
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def load(self, key: str, y_train: List[str], y_test: List[str]) -> Optional[Tuple[Any, Any, Any]]:
+        """(前処理器, X_train, X_test)を取得（ラベルの並びが一致しない場合はNone）"""
+        import scipy.sparse as sp
+
+        path = self.cache_dir / key
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if (meta.get("y_train") != labels_digest(y_train)
+                or meta.get("y_test") != labels_digest(y_test)):
+            self.logger.warning(f"Feature cache {key} does not match the loaded labels; ignoring it")
+            return None
+
+        preprocessor = joblib.load(path / "preprocessor.joblib")
+        X_train = sp.load_npz(path / "X_train.npz")
+        X_test = sp.load_npz(path / "X_test.npz")
+        self.logger.info(f"Loaded cached features: {path} "
+                         f"(train={X_train.shape}, test={X_test.shape})")
+        return preprocessor, X_train, X_test
+
+    def save(self, key: str, preprocessor: Any, X_train: Any, X_test: Any,
+             y_train: List[str], y_test: List[str]) -> None:
+        """前処理器と特徴量行列を保存"""
+        import scipy.sparse as sp
+
+        path = self.cache_dir / key
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            joblib.dump(preprocessor, tmp_path / "preprocessor.joblib")
+            sp.save_npz(tmp_path / "X_train.npz", sp.csr_matrix(X_train), compressed=False)
+            sp.save_npz(tmp_path / "X_test.npz", sp.csr_matrix(X_test), compressed=False)
+            with open(tmp_path / "meta.json", "w") as f:
+                json.dump({
+                    "y_train": labels_digest(y_train),
+                    "y_test": labels_digest(y_test),
+                    "train_shape": list(X_train.shape),
+                    "test_shape": list(X_test.shape)
+                }, f, indent=2)
+            # 書き込み完了後に入れ替える
+            shutil.rmtree(path, ignore_errors=True)
+            tmp_path.rename(path)
+            self.logger.info(f"Cached features to: {path}")
+        except OSError as e:
+            self.logger.warning(f"Failed to write feature cache: {e}")
@@ -1,11 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import Tuple, Any
-import numpy as np
-from datasets import load_dataset
-import pandas as pd
-from sklearn.model_selection import train_test_split
+from typing import Tuple, Any, Callable, Iterator, List, Optional
+import hashlib
+import json
+import shutil
+from pathlib import Path
 from ..utils.logger import get_logger
 
+# フィルタ・分割済みデータセットのキャッシュ先
+DEFAULT_CACHE_DIR = "data/cache"
+# キャッシュのParquetの行グループサイズ（チャンク読み込み時のメモリ上限の目安）
+CACHE_ROW_GROUP_SIZE = 10000
+
 class DataLoader(ABC):
     """データローダーの基底クラス"""
 
@@ -14,51 +19,236 @@ class DataLoader(ABC):
         pass
 
 class ProgrammingLanguageLoader(DataLoader):
-    """プログラミング言語データローダー"""
-    def __init__(self, min_samples_per_class: int = 10):
+    """プログラミング言語データローダー
+
+    フィルタ・分割済みのtrain/testをParquetでローカルにキャッシュする。
+    キャッシュは(データセットのfingerprint, min_samples_per_class, 分割シード, test_size)
+    ごとに作られ、2回目以降はload_datasetを呼ばずに読み込む（オフラインでも動作）。
+    """
+    DATASET_NAME = "christopher/rosetta-code"
+
+    def __init__(self, 
+                 min_samples_per_class: int = 10,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 random_state: int = 42,
+                 test_size: float = 0.1,
+                 refresh: bool = False):
         self.min_samples_per_class = min_samples_per_class
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.random_state = random_state
+        self.test_size = test_size
+        self.refresh = refresh
+        # 読み込んだデータセットのfingerprint（load後に設定）
+        self.fingerprint: Optional[str] = None
         self.logger = get_logger(self.__class__.__name__)
     
     def load(self) -> Tuple[Any, ...]:
-        from collections import Counter
+        if self.cache_dir is not None and not self.refresh:
+            cached = self._read_cache()
+            if cached is not None:
+                return cached
+        
+        from datasets import load_dataset
         
-        rosetta_datasets = load_dataset("christopher/rosetta-code")
+        rosetta_datasets = load_dataset(self.DATASET_NAME)
+        self.fingerprint = self._dataset_fingerprint(rosetta_datasets['train'])
         # Convert to regular Python lists to avoid dataset indexing issues
         all_languages = list(rosetta_datasets['train']['language_name'])
         all_code = list(rosetta_datasets['train']['code'])
         
+        train_indices, test_indices = self._split_indices(all_languages)
+        X_train_val = [all_code[i] for i in train_indices]
+        y_train_val = [all_languages[i] for i in train_indices]
+        X_test = [all_code[i] for i in test_indices]
+        y_test = [all_languages[i] for i in test_indices]
+        
+        if self.cache_dir is not None:
+            self._write_cache(y_train_val, X_train_val, y_test, X_test)
+        return y_train_val, X_train_val, y_test, X_test
+    
+    def cached_fingerprint(self) -> Optional[str]:
+        """最後に読み込んだデータセットのfingerprint（キャッシュの索引から取得）"""
+        if self.cache_dir is None:
+            return None
+        index_path = self.cache_dir / "index.json"
+        if not index_path.exists():
+            return None
+        with open(index_path, "r") as f:
+            return json.load(f).get(self.DATASET_NAME)
+    
+    def iter_chunks(self, split: str = "train", chunk_size: int = 5000) -> Iterator[Tuple[List[str], List[str]]]:
+        """キャッシュ済みの分割を(labels, codes)のチャンクとして逐次読み込む
+
+        読み込むのは行グループ単位なので、メモリ使用量は全体ではなくチャンクサイズで決まる。
+        """
+        import pyarrow.parquet as pq
+        
+        parquet = pq.ParquetFile(self._split_path(split))
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=["language", "code"]):
+            yield batch.column("language").to_pylist(), batch.column("code").to_pylist()
+    
+    def classes(self, split: str = "train") -> List[str]:
+        """分割に含まれるラベルの一覧（ラベル列だけを読む）"""
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        
+        column = pq.read_table(self._split_path(split), columns=["language"]).column("language")
+        return sorted(pc.unique(column).to_pylist())
+    
+    def _split_path(self, split: str) -> Path:
+        if self.cache_dir is None:
+            raise ValueError("Chunked reading requires a dataset cache_dir")
+        fingerprint = None if self.refresh else self.cached_fingerprint()
+        if fingerprint is None or not (self._cache_path(fingerprint) / f"{split}.parquet").exists():
+            # 初回のみキャッシュを作る（コード列は全件をメモリに載せずに書き出す）
+            self._build_cache_streaming()
+            self.refresh = False
+            fingerprint = self.cached_fingerprint()
+            if fingerprint is None or not (self._cache_path(fingerprint) / f"{split}.parquet").exists():
+                # _store_cacheは書き込みの失敗を警告するだけなので、ここで読めないことを伝える
+                raise RuntimeError(f"Failed to build the dataset cache in {self.cache_dir} "
+                                   f"(chunked reading needs a writable cache_dir; see the warning above)")
+        self.fingerprint = fingerprint
+        return self._cache_path(fingerprint) / f"{split}.parquet"
+    
+    def _cache_path(self, fingerprint: str) -> Path:
+        dataset = self.DATASET_NAME.replace("/", "__")
+        return self.cache_dir / (
+            f"{dataset}_{fingerprint}_min{self.min_samples_per_class}"
+            f"_seed{self.random_state}_test{self.test_size}"
+        )
+    
+    @staticmethod
+    def _dataset_fingerprint(dataset: Any) -> str:
+        fingerprint = getattr(dataset, "_fingerprint", None)
+        if fingerprint:
+            return fingerprint
+        # fingerprintが取れない場合は件数とサイズで代用
+        raw = f"{dataset.num_rows}:{getattr(dataset.info, 'dataset_size', None)}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+    
+    def _read_cache(self) -> Optional[Tuple[Any, ...]]:
+        fingerprint = self.cached_fingerprint()
+        if fingerprint is None:
+            return None
+        path = self._cache_path(fingerprint)
+        if not (path / "train.parquet").exists() or not (path / "test.parquet").exists():
+            return None
+        
+        import pyarrow.parquet as pq
+        
+        train = pq.read_table(path / "train.parquet")
+        test = pq.read_table(path / "test.parquet")
+        self.fingerprint = fingerprint
+        self.logger.info(f"Loaded cached split: {path} "
+                         f"(train={train.num_rows}, test={test.num_rows})")
+        return (
+            train.column("language").to_pylist(),
+            train.column("code").to_pylist(),
+            test.column("language").to_pylist(),
+            test.column("code").to_pylist()
+        )
+    
+    def _split_indices(self, all_languages: List[str]) -> Tuple[List[int], List[int]]:
+        """サンプル数の少ない言語を除き、層化分割した(train, test)の行番号を返す（ラベルだけを使う）"""
+        from collections import Counter
+        from sklearn.model_selection import train_test_split
+        
         # Count samples per language
         language_counts = Counter(all_languages)
         
         # Filter out languages with too few samples
         valid_languages = set(lang for lang, count in language_counts.items() 
                             if count >= self.min_samples_per_class)
-        # Filter data
-        filtered_languages = []
-        filtered_code = []
-        
-        for lang, code in zip(all_languages, all_code):
-            if lang in valid_languages:
-                filtered_languages.append(lang)
-                filtered_code.append(code)
+        indices = [i for i, lang in enumerate(all_languages) if lang in valid_languages]
+        filtered_languages = [all_languages[i] for i in indices]
         
         self.logger.info(f"Filtered data: {len(all_languages)} -> {len(filtered_languages)} samples")
         self.logger.info(f"Languages: {len(language_counts)} -> {len(valid_languages)} languages")
         self.logger.info(f"Removed {len(language_counts) - len(valid_languages)} languages with < {self.min_samples_per_class} samples")
         
-        # Split into train and test
-        X_train_val, X_test, y_train_val, y_test = train_test_split(
-            filtered_code, filtered_languages, 
-            test_size=0.1, 
-            random_state=42,
+        # Split into train and test（行番号を分割するので、コードを渡した場合と同じ分割・順序になる）
+        train_indices, test_indices = train_test_split(
+            indices,
+            test_size=self.test_size, 
+            random_state=self.random_state,
             stratify=filtered_languages  # Now we can use stratify since all classes have enough samples
         )
-        return y_train_val, X_train_val, y_test, X_test
+        return train_indices, test_indices
+    
+    def _build_cache_streaming(self) -> None:
+        """load()と同じ分割のキャッシュを、コード列を行グループ単位で読み書きして作る
+        
+        メモリに載せるのはラベル列と行番号だけで、コードはArrow（メモリマップ）から
+        CACHE_ROW_GROUP_SIZE件ずつ読んでParquetに追記する。
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from datasets import load_dataset
+        
+        dataset = load_dataset(self.DATASET_NAME)['train']
+        self.fingerprint = self._dataset_fingerprint(dataset)
+        train_indices, test_indices = self._split_indices(list(dataset['language_name']))
+        schema = pa.schema([("language", pa.string()), ("code", pa.string())])
+        
+        def write(tmp_path: Path) -> None:
+            for split, indices in (("train", train_indices), ("test", test_indices)):
+                with pq.ParquetWriter(tmp_path / f"{split}.parquet", schema) as writer:
+                    for batch in dataset.select(indices).iter(batch_size=CACHE_ROW_GROUP_SIZE):
+                        writer.write_table(pa.table({"language": batch["language_name"], "code": batch["code"]},
+                                                    schema=schema),
+                                           row_group_size=CACHE_ROW_GROUP_SIZE)
+        
+        self.logger.info(f"Building split cache by streaming "
+                         f"(train={len(train_indices)}, test={len(test_indices)})")
+        self._store_cache(write)
+    
+    def _write_cache(self, y_train: List[str], X_train: List[str], y_test: List[str], X_test: List[str]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        def write(tmp_path: Path) -> None:
+            pq.write_table(pa.table({"language": y_train, "code": X_train}), tmp_path / "train.parquet",
+                           row_group_size=CACHE_ROW_GROUP_SIZE)
+            pq.write_table(pa.table({"language": y_test, "code": X_test}), tmp_path / "test.parquet",
+                           row_group_size=CACHE_ROW_GROUP_SIZE)
+        
+        self._store_cache(write)
+    
+    def _store_cache(self, write: Callable[[Path], None]) -> None:
+        """write(一時ディレクトリ)でtrain/testを書き出し、キャッシュとして登録する"""
+        try:
+            path = self._cache_path(self.fingerprint)
+            tmp_path = path.with_name(path.name + ".tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            write(tmp_path)
+            # 書き込み完了後に入れ替える（中断時に壊れたキャッシュを残さない）
+            shutil.rmtree(path, ignore_errors=True)
+            tmp_path.rename(path)
+            
+            index_path = self.cache_dir / "index.json"
+            index = {}
+            if index_path.exists():
+                with open(index_path, "r") as f:
+                    index = json.load(f)
+            index[self.DATASET_NAME] = self.fingerprint
+            # 索引も一時ファイルに書いてから入れ替える（中断時に壊れた索引を残さない）
+            tmp_index_path = index_path.with_name(index_path.name + ".tmp")
+            with open(tmp_index_path, "w") as f:
+                json.dump(index, f, indent=2)
+            tmp_index_path.replace(index_path)
+            self.logger.info(f"Cached split to: {path}")
+        except OSError as e:
+            self.logger.warning(f"Failed to write dataset cache: {e}")
     
 class DataLoaderFactory:
     """データローダーのファクトリクラス"""
     @staticmethod
-    def create_loader(dataset_name: str, min_samples_per_class: int = 10) -> DataLoader:
+    def create_loader(dataset_name: str, 
+                      min_samples_per_class: int = 10,
+                      cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                      refresh: bool = False) -> DataLoader:
         loaders = {
             "programming_language": ProgrammingLanguageLoader
         }
@@ -66,7 +256,11 @@ class DataLoaderFactory:
             raise ValueError(f"Invalid dataset name: {dataset_name}")
         
         if dataset_name == "programming_language":
-            return loaders[dataset_name](min_samples_per_class=min_samples_per_class)
+            return loaders[dataset_name](
+                min_samples_per_class=min_samples_per_class,
+                cache_dir=cache_dir,
+                refresh=refresh
+            )
         else:
             return loaders[dataset_name]()
         
\ No newline at end of file
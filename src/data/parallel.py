@@ -0,0 +1,120 @@
+"""TF-IDFのfit / transformをプロセスプールで並列化"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .vocabulary import build_fitted_tfidf, select_features
+
+
+# 並列transformの1チャンクあたりの文書数
+DEFAULT_CHUNK_SIZE = 2000
+
+# ワーカープロセスに一度だけ渡すベクトライザー（チャンクごとにpickleしない）
+_worker_vectorizer = None
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+    """n_jobs=-1などを実際のワーカー数に変換"""
+    cpu_count = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, cpu_count + 1 + n_jobs)
+    return n_jobs
+
+
+def _split(items: List[Any], n_chunks: int) -> List[List[Any]]:
+    """リストを連続したn_chunks個の塊に分割"""
+    bounds = np.linspace(0, len(items), n_chunks + 1).astype(int)
+    return [items[bounds[i]:bounds[i + 1]] for i in range(n_chunks) if bounds[i] < bounds[i + 1]]
+
+
+def _count_shard(params: Dict[str, Any], docs: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """シャード内の語ごとの文書頻度と総出現回数を数える"""
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    counter = CountVectorizer(**params)
+    counts = counter.fit_transform(docs).tocsr()
+    terms = list(counter.vocabulary_)
+    columns = np.fromiter(counter.vocabulary_.values(), dtype=np.int64, count=len(terms))
+    dfs = np.bincount(counts.indices, minlength=counts.shape[1])[columns]
+    tfs = np.asarray(counts.sum(axis=0)).ravel()[columns]
+    return terms, dfs, tfs
+
+
+def parallel_fit_tfidf(vectorizer: Any, docs: List[str], n_jobs: int) -> Any:
+    """文書をシャードに分けてdf/tfを数え、マージしてTfidfVectorizer.fitと同じ語彙を作る"""
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    if isinstance(docs, str):
+        raise ValueError("Iterable over raw text documents expected, string object received.")
+    docs = list(docs)
+    n_workers = min(resolve_n_jobs(n_jobs), max(1, len(docs)))
+
+    # トークン化に関わる設定だけを引き継ぎ、語彙の絞り込みはマージ後に行う
+    count_params = {
+        key: value for key, value in vectorizer.get_params().items()
+        if key in CountVectorizer().get_params()
+    }
+    count_params.update(min_df=1, max_df=1.0, max_features=None, vocabulary=None,
+                        binary=False, dtype=np.int64)
+
+    shards = _split(docs, n_workers)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(_count_shard, [count_params] * len(shards), shards))
+
+    # シャードごとの集計をマージ
+    index: Dict[str, int] = {}
+    merged_dfs = np.zeros(0, dtype=np.int64)
+    merged_tfs = np.zeros(0, dtype=np.int64)
+    for terms, dfs, tfs in results:
+        ids = np.fromiter((index.setdefault(term, len(index)) for term in terms),
+                          dtype=np.int64, count=len(terms))
+        if len(index) > len(merged_dfs):
+            merged_dfs = np.concatenate([merged_dfs, np.zeros(len(index) - len(merged_dfs), dtype=np.int64)])
+            merged_tfs = np.concatenate([merged_tfs, np.zeros(len(index) - len(merged_tfs), dtype=np.int64)])
+        np.add.at(merged_dfs, ids, dfs)
+        np.add.at(merged_tfs, ids, tfs)
+    if not index:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+    # CountVectorizerと同じく語のソート順で並べてから絞り込む
+    sorted_terms = sorted(index)
+    order = np.fromiter((index[term] for term in sorted_terms), dtype=np.int64, count=len(sorted_terms))
+    dfs = merged_dfs[order]
+    tfs = dfs if vectorizer.binary else merged_tfs[order]
+    dtype = np.dtype(vectorizer.dtype)
+    tfs = tfs.astype(dtype if np.issubdtype(dtype, np.floating) else np.int64)
+
+    mask = select_features(dfs, tfs, len(docs), vectorizer.min_df,
+                           vectorizer.max_df, vectorizer.max_features)
+    kept = np.flatnonzero(mask)
+    return build_fitted_tfidf(vectorizer, [sorted_terms[i] for i in kept], dfs[kept], len(docs))
+
+
+def _init_transform_worker(vectorizer: Any) -> None:
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+
+
+def _transform_chunk(docs: List[str]) -> Any:
+    return _worker_vectorizer.transform(docs)
+
+
+def parallel_transform(vectorizer: Any, docs: List[str], n_jobs: int,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Any:
+    """文書をチャンクに分けて並列にtransformし、結果を縦に連結"""
+    import scipy.sparse as sp
+
+    docs = list(docs)
+    n_workers = resolve_n_jobs(n_jobs)
+    if n_workers <= 1 or len(docs) <= chunk_size:
+        return vectorizer.transform(docs)
+
+    chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_transform_worker,
+                             initargs=(vectorizer,)) as executor:
+        parts = list(executor.map(_transform_chunk, chunks))
+    return sp.vstack(parts, format="csr")
@@ -1,7 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Tuple, List
 import numpy as np
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
 
 class Preprocessor(ABC):
     """前処理の基底クラス"""
@@ -35,8 +34,17 @@ class ImagePreprocessor(Preprocessor):
 
 class NaturalLanguagePreprocessor(Preprocessor):
     """自然言語データの前処理"""
-    def __init__(self, vectorizer=None, max_length: int = 128, lightweight: bool = False):
-        if vectorizer is None:
+    def __init__(self, 
+                 vectorizer=None, 
+                 max_length: int = 128, 
+                 lightweight: bool = False,
+                 hashing: bool = False,
+                 n_features: int = 2 ** 17,
+                 use_idf: bool = True,
+                 n_jobs: int = 1):
+        if vectorizer is None and hashing:
+            self.vectorizer = self._build_hashing_vectorizer(n_features, use_idf)
+        elif vectorizer is None:
             from sklearn.feature_extraction.text import TfidfVectorizer
             if lightweight:
                 # 軽量化設定（Streamlit Cloud用）
@@ -53,14 +61,65 @@ class NaturalLanguagePreprocessor(Preprocessor):
         else:
             self.vectorizer = vectorizer
         self.max_length = max_length
+        # 1より大きい（または-1）場合、fit / transformをプロセスプールで並列化
+        self.n_jobs = n_jobs
+
+    @staticmethod
+    def _build_hashing_vectorizer(n_features: int, use_idf: bool):
+        """語彙を持たないハッシュ方式のベクトライザーを作成
+
+        メモリ使用量は語彙数ではなくn_featuresで決まる。use_idf=Falseの場合は
+        学習するパラメータがなく、transformをワーカー間で自由に分割できる。
+        """
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+        from sklearn.pipeline import Pipeline
+
+        if not use_idf:
+            return HashingVectorizer(
+                n_features=n_features,
+                ngram_range=(1, 3),
+                alternate_sign=False,
+                norm='l2'
+            )
+        # IDF重みベクトル（長さn_features）だけを学習する
+        return Pipeline([
+            ('hashing', HashingVectorizer(
+                n_features=n_features,
+                ngram_range=(1, 3),
+                alternate_sign=False,
+                norm=None
+            )),
+            ('idf', TfidfTransformer(norm='l2'))
+        ])
 
     def fit(self, X_train: List[str]) -> 'NaturalLanguagePreprocessor':
         if self.vectorizer is not None:
-            self.vectorizer.fit(X_train)
+            if getattr(self, "n_jobs", 1) != 1:
+                self._parallel_fit(X_train)
+            else:
+                self.vectorizer.fit(X_train)
         return self
 
+    def _parallel_fit(self, X_train: List[str]) -> None:
+        """シャード並列でfit（結果は逐次fitと同じ）"""
+        from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+        from sklearn.pipeline import Pipeline
+        from .parallel import parallel_fit_tfidf, parallel_transform
+
+        if isinstance(self.vectorizer, TfidfVectorizer):
+            self.vectorizer = parallel_fit_tfidf(self.vectorizer, X_train, self.n_jobs)
+        elif isinstance(self.vectorizer, Pipeline) and isinstance(self.vectorizer.steps[0][1], HashingVectorizer):
+            # ハッシュ段は状態を持たないので並列にtransformし、IDFだけを学習
+            hashed = parallel_transform(self.vectorizer.steps[0][1], X_train, self.n_jobs)
+            self.vectorizer.steps[-1][1].fit(hashed)
+        else:
+            self.vectorizer.fit(X_train)
+
     def transform(self, X: List[str]) -> np.ndarray:
         if self.vectorizer is not None:
+            if getattr(self, "n_jobs", 1) != 1:
+                from .parallel import parallel_transform
+                return parallel_transform(self.vectorizer, X, self.n_jobs)
             return self.vectorizer.transform(X)
         else:
             raise ValueError("vectorizer must be provided")
@@ -68,9 +127,23 @@ class NaturalLanguagePreprocessor(Preprocessor):
     def fit_transform(self, X_train: List[str]) -> np.ndarray:
         return self.fit(X_train).transform(X_train)
 
+    @property
+    def is_stateless(self) -> bool:
+        """学習するパラメータを持たない（fitせずにチャンクごとにtransformできる）か"""
+        from sklearn.feature_extraction.text import HashingVectorizer
+        return isinstance(self.vectorizer, HashingVectorizer)
+
+    def get_params(self) -> dict:
+        """ベクトライザーの種類と設定（特徴量キャッシュのキー用）"""
+        params = {"vectorizer": type(self.vectorizer).__name__}
+        if hasattr(self.vectorizer, "get_params"):
+            params.update(self.vectorizer.get_params())
+        return params
+
 class StandardPreprocessor(Preprocessor):
     """標準化前処理"""
     def __init__(self):
+        from sklearn.preprocessing import StandardScaler
         self.scaler = StandardScaler()
 
     def fit(self, x_train: np.ndarray) -> 'StandardPreprocessor':
@@ -83,8 +156,20 @@ class StandardPreprocessor(Preprocessor):
 class PreprocessorFactory:
     """前処理のファクトリクラス"""
     @staticmethod
-    def create_preprocessor(dataset_name: str, normalize: bool = True, lightweight: bool = False) -> Preprocessor:
+    def create_preprocessor(dataset_name: str, 
+                            normalize: bool = True, 
+                            lightweight: bool = False,
+                            hashing: bool = False,
+                            hashing_n_features: int = 2 ** 17,
+                            hashing_use_idf: bool = True,
+                            n_jobs: int = 1) -> Preprocessor:
         if dataset_name == "programming_language":
-            return NaturalLanguagePreprocessor(lightweight=lightweight)
+            return NaturalLanguagePreprocessor(
+                lightweight=lightweight,
+                hashing=hashing,
+                n_features=hashing_n_features,
+                use_idf=hashing_use_idf,
+                n_jobs=n_jobs
+            )
         else:
             raise ValueError(f"Unknown dataset: {dataset_name}")
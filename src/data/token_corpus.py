@@ -0,0 +1,258 @@
+"""トークン化済みコーパスのキャッシュ
+
+正規表現によるトークン化とn-gram生成は前処理の大部分を占めるが、
+min_df / max_df / max_featuresは「どのn-gramを残すか」しか変えない。
+解析済みの文書をn-gram IDの平坦なint配列 + 文書ごとのオフセットとして保存しておけば、
+異なる絞り込み設定の語彙とTF-IDF行列をNumPy / scipyの演算だけで導出できる。
+
+使い方:
+    python -m src.data.token_corpus build --output data/cache/tokens --ngram-max 3
+    python -m src.data.token_corpus sweep --corpus data/cache/tokens \\
+        --max-features 5000 7500 --min-df 2 3 --max-df 0.9 0.95
+"""
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .vocabulary import build_fitted_tfidf, select_features
+from ..utils.logger import get_logger
+
+
+# コーパスに固定されるトークン化の設定（これ以外のTfidfVectorizer引数は導出時に変えられる）
+ANALYZER_PARAMS = (
+    "input", "encoding", "decode_error", "strip_accents", "lowercase",
+    "preprocessor", "tokenizer", "stop_words", "token_pattern", "ngram_range", "analyzer"
+)
+
+
+def analyzer_params_of(vectorizer: Any) -> Dict[str, Any]:
+    """ベクトライザーからトークン化に関わる設定を取り出す"""
+    params = vectorizer.get_params()
+    return {key: params[key] for key in ANALYZER_PARAMS}
+
+
+def _jsonable(params: Dict[str, Any]) -> Dict[str, Any]:
+    result = {}
+    for key, value in params.items():
+        if callable(value):
+            raise ValueError(f"Callable analyzer parameter cannot be stored: {key}")
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        elif isinstance(value, tuple):
+            value = list(value)
+        result[key] = value
+    return result
+
+
+class TokenCorpus:
+    """解析済み文書（語IDの平坦な配列 + 文書オフセット）と文書頻度
+
+    terms は昇順にソートされており、語IDはそのままTfidfVectorizerの列順になる。
+    """
+
+    def __init__(self, terms: List[str], token_ids: np.ndarray, offsets: np.ndarray,
+                 analyzer_params: Dict[str, Any]):
+        self.terms = terms
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.analyzer_params = analyzer_params
+        self._counts = None
+        self._dfs = None
+        self.logger = get_logger(self.__class__.__name__)
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(cls, docs: List[str], vectorizer: Any) -> 'TokenCorpus':
+        """vectorizerのトークン化設定で文書を解析してコーパスを作る"""
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        params = analyzer_params_of(vectorizer)
+        analyze = CountVectorizer(**params).build_analyzer()
+
+        index: Dict[str, int] = {}
+        token_ids: List[int] = []
+        offsets = [0]
+        for doc in docs:
+            token_ids.extend(index.setdefault(token, len(index)) for token in analyze(doc))
+            offsets.append(len(token_ids))
+
+        # 語IDをソート順に振り直す
+        terms = sorted(index)
+        remap = np.empty(len(terms), dtype=np.int32)
+        remap[np.fromiter((index[term] for term in terms), dtype=np.int64, count=len(terms))] = \
+            np.arange(len(terms), dtype=np.int32)
+        return cls(
+            terms=terms,
+            token_ids=remap[np.asarray(token_ids, dtype=np.int64)],
+            offsets=np.asarray(offsets, dtype=np.int64),
+            analyzer_params=params
+        )
+
+    def encode(self, docs: List[str]) -> 'TokenCorpus':
+        """このコーパスの語IDで別の文書群（テストデータなど）を解析（未知語は捨てる）"""
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        analyze = CountVectorizer(**self.analyzer_params).build_analyzer()
+        index = {term: i for i, term in enumerate(self.terms)}
+        token_ids: List[int] = []
+        offsets = [0]
+        for doc in docs:
+            for token in analyze(doc):
+                term_id = index.get(token)
+                if term_id is not None:
+                    token_ids.append(term_id)
+            offsets.append(len(token_ids))
+        return TokenCorpus(
+            terms=self.terms,
+            token_ids=np.asarray(token_ids, dtype=np.int32),
+            offsets=np.asarray(offsets, dtype=np.int64),
+            analyzer_params=self.analyzer_params
+        )
+
+    def count_matrix(self):
+        """文書×語の出現回数行列（CSR、初回のみ計算）"""
+        import scipy.sparse as sp
+
+        if self._counts is None:
+            # sum_duplicatesは配列をその場で並べ替えるため、メモリマップはコピーする
+            counts = sp.csr_matrix(
+                (np.ones(len(self.token_ids), dtype=np.int64), np.array(self.token_ids), self.offsets),
+                shape=(self.n_docs, len(self.terms))
+            )
+            counts.sum_duplicates()
+            self._counts = counts
+        return self._counts
+
+    def document_frequencies(self) -> np.ndarray:
+        """語ごとの文書頻度"""
+        if self._dfs is None:
+            self._dfs = np.bincount(self.count_matrix().indices, minlength=len(self.terms))
+        return self._dfs
+
+    def term_frequencies(self) -> np.ndarray:
+        """語ごとの総出現回数"""
+        return np.bincount(self.token_ids, minlength=len(self.terms))
+
+    def _check_compatible(self, vectorizer: Any) -> None:
+        if _jsonable(analyzer_params_of(vectorizer)) != _jsonable(self.analyzer_params):
+            raise ValueError("Vectorizer tokenization settings differ from the token corpus")
+
+    def derive(self, vectorizer: Any) -> Tuple[Any, Any, np.ndarray]:
+        """vectorizerの絞り込み設定で(学習済みベクトライザー, TF-IDF行列, 残した語ID)を導出
+
+        結果はvectorizer.fit_transform(元の文書)と一致する。
+        """
+        self._check_compatible(vectorizer)
+        dfs = self.document_frequencies()
+        tfs = dfs if vectorizer.binary else self.term_frequencies()
+        dtype = np.dtype(vectorizer.dtype)
+        tfs = tfs.astype(dtype if np.issubdtype(dtype, np.floating) else np.int64)
+
+        mask = select_features(dfs, tfs, self.n_docs, vectorizer.min_df,
+                               vectorizer.max_df, vectorizer.max_features)
+        kept = np.flatnonzero(mask)
+        fitted = build_fitted_tfidf(vectorizer, [self.terms[i] for i in kept], dfs[kept], self.n_docs)
+        return fitted, self.derive_transform(fitted, kept), kept
+
+    def derive_transform(self, fitted: Any, kept: np.ndarray) -> Any:
+        """derive()の結果で、このコーパスの文書をTF-IDF行列に変換（fitted.transformと一致）"""
+        counts = self.count_matrix()[:, kept].astype(fitted.dtype)
+        if fitted.binary:
+            counts.data.fill(1)
+        # TfidfVectorizer.transformと同じくTfidfTransformerで重み付け・正規化
+        return fitted._tfidf.transform(counts, copy=False)
+
+    def save(self, path: str) -> None:
+        """配列をそれぞれ.npyとして保存"""
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        encoded = [term.encode("utf-8") for term in self.terms]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=term_offsets[1:])
+        with open(directory / "terms.bin", "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(directory / "term_offsets.npy", term_offsets)
+        np.save(directory / "token_ids.npy", self.token_ids)
+        np.save(directory / "doc_offsets.npy", self.offsets)
+        np.save(directory / "document_frequencies.npy", self.document_frequencies())
+        with open(directory / "meta.json", "w") as f:
+            json.dump({
+                "n_docs": self.n_docs,
+                "n_terms": len(self.terms),
+                "n_tokens": int(len(self.token_ids)),
+                "analyzer_params": _jsonable(self.analyzer_params)
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'TokenCorpus':
+        """保存済みコーパスを読み込み（トークン配列はメモリマップ）"""
+        directory = Path(path)
+        with open(directory / "meta.json", "r") as f:
+            meta = json.load(f)
+        params = meta["analyzer_params"]
+        params["ngram_range"] = tuple(params["ngram_range"])
+
+        blob = (directory / "terms.bin").read_bytes()
+        term_offsets = np.load(directory / "term_offsets.npy")
+        terms = [blob[term_offsets[i]:term_offsets[i + 1]].decode("utf-8") for i in range(meta["n_terms"])]
+
+        corpus = cls(
+            terms=terms,
+            token_ids=np.load(directory / "token_ids.npy", mmap_mode="r" if mmap else None),
+            offsets=np.load(directory / "doc_offsets.npy"),
+            analyzer_params=params
+        )
+        corpus._dfs = np.load(directory / "document_frequencies.npy")
+        return corpus
+
+
+def main():
+    import argparse
+    import itertools
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from .loader import DataLoaderFactory
+
+    parser = argparse.ArgumentParser(description="Build or sweep a token corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="訓練データを解析してコーパスを保存")
+    build_parser.add_argument("--output", default="data/cache/tokens")
+    build_parser.add_argument("--ngram-max", type=int, default=3)
+    build_parser.add_argument("--min-samples-per-class", type=int, default=200)
+
+    sweep_parser = subparsers.add_parser("sweep", help="絞り込み設定ごとに語彙とTF-IDF行列を導出")
+    sweep_parser.add_argument("--corpus", default="data/cache/tokens")
+    sweep_parser.add_argument("--max-features", type=int, nargs="+", default=[None])
+    sweep_parser.add_argument("--min-df", type=int, nargs="+", default=[1])
+    sweep_parser.add_argument("--max-df", type=float, nargs="+", default=[1.0])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        _, X_train, _, _ = DataLoaderFactory.create_loader(
+            "programming_language", min_samples_per_class=args.min_samples_per_class
+        ).load()
+        start = time.perf_counter()
+        corpus = TokenCorpus.build(X_train, TfidfVectorizer(ngram_range=(1, args.ngram_max)))
+        corpus.save(args.output)
+        print(f"✅ コーパスを保存しました: {args.output} "
+              f"(文書 {corpus.n_docs}, 語 {len(corpus.terms)}, {time.perf_counter() - start:.1f}秒)")
+        return
+
+    corpus = TokenCorpus.load(args.corpus)
+    for max_features, min_df, max_df in itertools.product(args.max_features, args.min_df, args.max_df):
+        vectorizer = TfidfVectorizer(ngram_range=corpus.analyzer_params["ngram_range"],
+                                     max_features=max_features, min_df=min_df, max_df=max_df)
+        start = time.perf_counter()
+        _, matrix, kept = corpus.derive(vectorizer)
+        print(f"max_features={max_features} min_df={min_df} max_df={max_df}: "
+              f"{len(kept)} features, nnz={matrix.nnz}, {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
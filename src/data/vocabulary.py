@@ -0,0 +1,73 @@
+"""語彙の選択とTF-IDFベクトライザーの組み立て
+
+文書頻度(df)と総出現回数(tf)の配列から、TfidfVectorizer.fitと同じ規則で
+語彙を選び、学習済みのTfidfVectorizerを作る。並列fit・トークン化キャッシュで共用する。
+"""
+from numbers import Integral
+from typing import Any, List
+
+import numpy as np
+
+
+def select_features(dfs: np.ndarray, tfs: np.ndarray, n_docs: int,
+                    min_df: Any = 1, max_df: Any = 1.0, max_features: Any = None) -> np.ndarray:
+    """min_df / max_df / max_featuresで残す列のマスクを返す
+
+    dfs・tfsは語をソートした順に並んでいる必要がある（CountVectorizerと同じ
+    argsortの入力にすることで、max_featuresの同率順位も含めて結果が一致する）。
+    """
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_docs
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_docs
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    mask = np.ones(len(dfs), dtype=bool)
+    mask &= dfs <= max_doc_count
+    mask &= dfs >= min_doc_count
+    if max_features is not None and mask.sum() > max_features:
+        mask_inds = (-tfs[mask]).argsort()[:max_features]
+        new_mask = np.zeros(len(dfs), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+
+    if not mask.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    return mask
+
+
+def compute_idf(dfs: np.ndarray, n_docs: int, smooth_idf: bool = True,
+                dtype: Any = np.float64) -> np.ndarray:
+    """TfidfTransformer.fitと同じ式でIDFを計算"""
+    dtype = dtype if dtype in (np.float64, np.float32) else np.float64
+    df = dfs.astype(dtype)
+    df += float(smooth_idf)
+    n_samples = n_docs + int(smooth_idf)
+    idf = np.full_like(df, fill_value=n_samples, dtype=dtype)
+    idf /= df
+    np.log(idf, out=idf)
+    idf += 1.0
+    return idf
+
+
+def build_fitted_tfidf(template: Any, terms: List[str], dfs: np.ndarray, n_docs: int) -> Any:
+    """選択済みの語彙（ソート順）とdfから学習済みTfidfVectorizerを作る"""
+    from sklearn.base import clone
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    vectorizer = clone(template)
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+    vectorizer.fixed_vocabulary_ = False
+
+    transformer = TfidfTransformer(
+        norm=vectorizer.norm,
+        use_idf=vectorizer.use_idf,
+        smooth_idf=vectorizer.smooth_idf,
+        sublinear_tf=vectorizer.sublinear_tf
+    )
+    transformer.n_features_in_ = len(terms)
+    if vectorizer.use_idf:
+        transformer.idf_ = compute_idf(
+            np.asarray(dfs), n_docs, vectorizer.smooth_idf, np.dtype(vectorizer.dtype)
+        )
+    vectorizer._tfidf = transformer
+    return vectorizer
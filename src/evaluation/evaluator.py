@@ -3,8 +3,6 @@ import numpy as np
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score, f1_score, classification_report, confusion_matrix
 )
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from ..models.base import BaseModel
 from ..utils.logger import get_logger
@@ -23,6 +21,14 @@ class Evaluator:
         """分類モデルの評価"""
         self.logger.info("Starting model evaluation...")
         y_pred = model.predict(X_test)
+        return self.evaluate_predictions(y_test, y_pred, average=average)
+
+    def evaluate_predictions(
+        self,
+        y_test: np.ndarray,
+        y_pred: np.ndarray,
+        average: str = 'weighted') -> Dict[str, Any]:
+        """予測済みラベルの評価（チャンク単位で予測した場合など）"""
         metrics = {
             'accuracy': accuracy_score(y_test, y_pred),
             'precision': precision_score(y_test, y_pred, average=average, zero_division=0),
@@ -48,6 +54,9 @@ class Evaluator:
         class_names: List[str] = None,
         save_path: str = None) -> None:
         """混同行列をプロット"""
+        # 描画ライブラリは重いので、プロットする場合だけ読み込む
+        import matplotlib.pyplot as plt
+        import seaborn as sns
 
         plt.figure(figsize=(8, 6))
         sns.heatmap(confusion_matrix,
@@ -7,10 +7,15 @@ from pathlib import Path
 from .config.config import Config
 from .data.loader import DataLoaderFactory
 from .data.preprocessor import PreprocessorFactory
+from .data.feature_cache import FeatureCache
 from .models.classifier import ModelFactory
 from .training.trainer import Trainer
+from .training.streaming import StreamingTrainer, collect_classes, load_chunk_source
+from .training.pruning import prune_vocabulary
+from .training.sweep import load_sweep_spec, run_sweep, save_leaderboard
 from .evaluation.evaluator import Evaluator
 from .utils.logger import setup_logging, get_logger
+from .utils.profiling import StageProfiler
 
 
 def main():
@@ -18,6 +23,31 @@ def main():
     parser = argparse.ArgumentParser(description="MNIST Classification")
     parser.add_argument('--config', default='configs/default.yaml', 
                        help='Path to config file')
+    parser.add_argument('--refresh-data', action='store_true',
+                       help='Ignore the local dataset cache and re-download the dataset')
+    parser.add_argument('--no-feature-cache', action='store_true',
+                       help='Always refit the vectorizer instead of reusing cached feature matrices')
+    parser.add_argument('--sweep', default=None,
+                       help='Path to a sweep spec (grid / candidates of model.parameters); '
+                            'vectorizes once and writes a leaderboard instead of a single model')
+    parser.add_argument('--cv', type=int, default=None, metavar='N_FOLDS',
+                       help='Run stratified k-fold cross-validation on the training split '
+                            'instead of a single training run')
+    parser.add_argument('--cv-jobs', type=int, default=-1,
+                       help='Number of folds to run in parallel (-1: all cores)')
+    parser.add_argument('--trace-malloc', action='store_true',
+                       help='Also record the tracemalloc peak of each stage (slows the run down)')
+    parser.add_argument('--profile-dir', default=None,
+                       help='Dump a cProfile file per stage into this directory')
+    parser.add_argument('--chunk-source', default=None, metavar='MODULE:FUNCTION',
+                       help='Streaming training only: function(split, chunk_size) yielding (labels, texts) '
+                            'chunks, used instead of the dataset cache (overrides training.chunk_source)')
+    parser.add_argument('--prune-tol', type=float, default=None,
+                       help='Export a vocabulary-pruned model dropping features whose '
+                            'coefficients are <= this value for every class')
+    parser.add_argument('--prune-min-agreement', type=float, default=1.0,
+                       help='Do not write the pruned model unless its predictions agree with the '
+                            'full model on at least this fraction of the test set')
     args = parser.parse_args()
     
     # 設定読み込み
@@ -48,34 +78,33 @@ def main():
         json.dump(config_dict, f, indent=2)
     
     start_time = time.time()
+    # ステージごとの時間・メモリ（results.jsonの"profile"）
+    profiler = StageProfiler(trace_malloc=args.trace_malloc, profile_dir=args.profile_dir)
     
     try:
-        # データ読み込み
-        logger.info("Loading data...")
+        # データローダー
         data_loader = DataLoaderFactory.create_loader(
             config.data.dataset_name, 
-            min_samples_per_class=config.data.min_samples_per_class
+            min_samples_per_class=config.data.min_samples_per_class,
+            refresh=args.refresh_data
         )
-        y_train, X_train, y_test, X_test = data_loader.load()
-        logger.info(f"Data loaded: train={len(y_train)}, test={len(X_train)}")
         
         # 前処理
-        logger.info("Preprocessing data...")
         lightweight = getattr(config.data, 'lightweight', False)
         preprocessor = PreprocessorFactory.create_preprocessor(
             config.data.dataset_name, 
             normalize=config.data.normalize,
-            lightweight=lightweight
+            lightweight=lightweight,
+            hashing=config.data.hashing,
+            hashing_n_features=config.data.hashing_n_features,
+            hashing_use_idf=config.data.hashing_use_idf,
+            n_jobs=config.data.preprocess_n_jobs
         )
-        if lightweight:
+        if config.data.hashing:
+            logger.info(f"Using hashing preprocessing (n_features={config.data.hashing_n_features}, "
+                       f"use_idf={config.data.hashing_use_idf})")
+        elif lightweight:
             logger.info("Using lightweight preprocessing (max_features=7500)")
-
-        # トレーナーの設定
-        trainer = Trainer(
-            preprocessor=preprocessor,
-            validation_split=config.data.validation_split,
-            random_seed=config.random_seed
-        )
         
         # モデル作成
         logger.info(f"Creating model: {config.model.model_type}")
@@ -84,19 +113,160 @@ def main():
             **config.model.parameters
         )
         
-        # 訓練
-        logger.info("Training model...")
-        trained_model = trainer.train(model, X_train, y_train)
-        
-        # テストデータの前処理
-        x_test_processed = trainer.prepare_test_data(X_test)
-        
-        # 評価
-        logger.info("Evaluating model...")
-        evaluator = Evaluator()
-        results = evaluator.evaluate_classification(
-            trained_model, x_test_processed, y_test
-        )
+        X_test = None
+        if config.training.streaming and (args.sweep or args.cv):
+            raise ValueError("--sweep / --cv are not supported with streaming training")
+        chunk_source_spec = args.chunk_source or config.training.chunk_source
+        if chunk_source_spec and not config.training.streaming:
+            raise ValueError("--chunk-source / training.chunk_source require training.streaming: true")
+        if config.training.streaming:
+            # チャンク単位で読み込み・ベクトル化・partial_fit（全件をメモリに載せない）
+            chunk_size = config.training.chunk_size
+            logger.info(f"Streaming training (chunk_size={chunk_size})...")
+            if chunk_source_spec:
+                logger.info(f"Using chunk source: {chunk_source_spec}")
+                chunk_source = load_chunk_source(chunk_source_spec)
+                classes = collect_classes(lambda: chunk_source("train", chunk_size))
+            else:
+                chunk_source = data_loader.iter_chunks
+                classes = data_loader.classes("train")
+            trainer = StreamingTrainer(
+                preprocessor=preprocessor,
+                classes=classes,
+                epochs=config.training.epochs
+            )
+            with profiler.stage("model_fit"):
+                trained_model = trainer.train(model, lambda: chunk_source("train", chunk_size))
+            
+            logger.info("Evaluating model...")
+            with profiler.stage("evaluation"):
+                y_test, y_pred = trainer.predict(trained_model, lambda: chunk_source("test", chunk_size))
+                results = Evaluator().evaluate_predictions(y_test, y_pred)
+        else:
+            # データ読み込み
+            logger.info("Loading data...")
+            with profiler.stage("load_data"):
+                y_train, X_train, y_test, X_test = data_loader.load()
+            logger.info(f"Data loaded: train={len(y_train)}, test={len(X_train)}")
+            
+            loader_params = {
+                "dataset_name": config.data.dataset_name,
+                "min_samples_per_class": config.data.min_samples_per_class,
+                "random_state": data_loader.random_state,
+                "test_size": data_loader.test_size
+            }
+            feature_cache = None
+            if not args.no_feature_cache and getattr(data_loader, 'fingerprint', None):
+                feature_cache = FeatureCache()
+            
+            # 交差検証（訓練データのみを使い、テストデータには触れない）
+            if args.cv:
+                cv_trainer = Trainer(
+                    preprocessor=preprocessor,
+                    validation_split=config.data.validation_split,
+                    random_seed=config.random_seed,
+                    epochs=config.training.epochs,
+                    early_stopping=config.training.early_stopping,
+                    patience=config.training.patience
+                )
+                with profiler.stage("cross_validation"):
+                    cross_validation = cv_trainer.cross_validate(
+                        config.model.model_type,
+                        config.model.parameters,
+                        X_train,
+                        y_train,
+                        n_folds=args.cv,
+                        n_jobs=args.cv_jobs,
+                        feature_cache=feature_cache,
+                        cache_key_fn=lambda fold: FeatureCache.make_key(
+                            data_loader.fingerprint,
+                            {**loader_params, "cv_folds": args.cv, "cv_seed": config.random_seed, "fold": fold},
+                            preprocessor.get_params()
+                        )
+                    )
+                end_time = time.time()
+                with open(experiment_dir / "results.json", "w") as f:
+                    json.dump({
+                        "experiment_name": config.experiment_name,
+                        "timestamp": timestamp,
+                        "duration": end_time - start_time,
+                        "config": config_dict,
+                        "cross_validation": cross_validation,
+                        "profile": profiler.summary()
+                    }, f, indent=2)
+                logger.info(f"Cross-validation completed in {end_time - start_time:.2f}s")
+                logger.info(f"Results saved to: {experiment_dir}")
+                return
+            
+            # 特徴量行列（データセットと前処理設定が同じならキャッシュを再利用）
+            logger.info("Preprocessing data...")
+            cached_features = None
+            if feature_cache is not None:
+                feature_cache_key = FeatureCache.make_key(
+                    data_loader.fingerprint, loader_params, preprocessor.get_params()
+                )
+                with profiler.stage("feature_cache_load"):
+                    cached_features = feature_cache.load(feature_cache_key, y_train, y_test)
+            
+            if cached_features is not None:
+                logger.info("Reusing cached feature matrices")
+                preprocessor, x_train_processed, x_test_processed = cached_features
+            else:
+                with profiler.stage("vectorizer_fit"):
+                    preprocessor.fit(X_train)
+                with profiler.stage("train_transform"):
+                    x_train_processed = preprocessor.transform(X_train)
+                with profiler.stage("test_transform"):
+                    x_test_processed = preprocessor.transform(X_test)
+                if feature_cache is not None:
+                    with profiler.stage("feature_cache_save"):
+                        feature_cache.save(feature_cache_key, preprocessor,
+                                           x_train_processed, x_test_processed, y_train, y_test)
+
+            # ハイパーパラメータ探索（同じ特徴量行列で候補を並列に訓練）
+            if args.sweep:
+                candidates, n_workers = load_sweep_spec(args.sweep)
+                with profiler.stage("sweep"):
+                    leaderboard = run_sweep(config, candidates, x_train_processed, y_train,
+                                            x_test_processed, y_test, n_workers=n_workers)
+                save_leaderboard(leaderboard, experiment_dir)
+                end_time = time.time()
+                with open(experiment_dir / "results.json", "w") as f:
+                    json.dump({
+                        "experiment_name": config.experiment_name,
+                        "timestamp": timestamp,
+                        "duration": end_time - start_time,
+                        "config": config_dict,
+                        "sweep": args.sweep,
+                        "leaderboard": leaderboard,
+                        "profile": profiler.summary()
+                    }, f, indent=2)
+                logger.info(f"Sweep completed in {end_time - start_time:.2f}s")
+                logger.info(f"Leaderboard saved to: {experiment_dir / 'leaderboard.csv'}")
+                return
+
+            # トレーナーの設定
+            trainer = Trainer(
+                preprocessor=preprocessor,
+                validation_split=config.data.validation_split,
+                random_seed=config.random_seed,
+                epochs=config.training.epochs,
+                early_stopping=config.training.early_stopping,
+                patience=config.training.patience
+            )
+            
+            # 訓練
+            logger.info("Training model...")
+            with profiler.stage("model_fit"):
+                trained_model = trainer.train(model, x_train_processed, y_train, fit_preprocessor=False)
+            
+            # 評価
+            logger.info("Evaluating model...")
+            evaluator = Evaluator()
+            with profiler.stage("evaluation"):
+                results = evaluator.evaluate_classification(
+                    trained_model, x_test_processed, y_test
+                )
         
         # 結果表示
         metrics = results['metrics']
@@ -105,9 +275,35 @@ def main():
         
         # モデル保存（新形式: モデル + 前処理器）
         model_path = experiment_dir / "model.joblib"
-        trained_model.save(str(model_path), preprocessor=trainer.preprocessor)
+        with profiler.stage("save_model"):
+            trained_model.save(str(model_path), preprocessor=preprocessor)
         logger.info(f"Model saved (new format) to: {model_path}")
         
+        # 係数0の特徴量を除いた軽量モデルをエクスポート
+        pruning_report = None
+        if args.prune_tol is not None and config.training.streaming:
+            logger.warning("Vocabulary pruning is not available for streaming training; skipping")
+        elif args.prune_tol is not None:
+            logger.info("Pruning vocabulary...")
+            with profiler.stage("pruning"):
+                pruned_model, pruned_preprocessor, pruning_report = prune_vocabulary(
+                    trained_model, preprocessor, tol=args.prune_tol, eval_texts=X_test
+                )
+            agreement = pruning_report['prediction_agreement']
+            pruning_report["exported"] = agreement >= args.prune_min_agreement
+            if pruning_report["exported"]:
+                pruned_path = experiment_dir / "model_pruned.joblib"
+                pruned_model.save(str(pruned_path), preprocessor=pruned_preprocessor)
+                logger.info(f"Pruned model saved to: {pruned_path} "
+                           f"(features: {pruning_report['n_features_before']} -> "
+                           f"{pruning_report['n_features_after']}, "
+                           f"agreement: {agreement:.4f})")
+            else:
+                # 予測が変わるモデルはエクスポートしない
+                logger.error(f"Pruned model NOT saved: prediction agreement {agreement:.4f} "
+                             f"< --prune-min-agreement {args.prune_min_agreement} "
+                             f"(max probability diff: {pruning_report.get('max_probability_diff')})")
+        
         # 実験結果保存
         end_time = time.time()
         experiment_results = {
@@ -121,11 +317,17 @@ def main():
                 "confusion_matrix": results['confusion_matrix'].tolist()
             }
         }
+        experiment_results["profile"] = profiler.summary()
+        if isinstance(trainer, Trainer) and trainer.history:
+            experiment_results["training"] = trainer.get_training_summary()
+        if pruning_report is not None:
+            experiment_results["pruning"] = pruning_report
         
         with open(experiment_dir / "results.json", "w") as f:
             json.dump(experiment_results, f, indent=2)
         
         logger.info(f"Experiment completed successfully in {end_time - start_time:.2f}s")
+        logger.info("Stage profile:\n" + profiler.format_table())
         logger.info(f"Results saved to: {experiment_dir}")
         
     except Exception as e:
@@ -0,0 +1,395 @@
+"""メモリマップ可能なコンパクトモデル形式
+
+joblibで辞書ごとpickleする代わりに、線形モデルとベクトライザーを
+ディレクトリ内の生の.npy配列と小さなJSONヘッダーとして保存する。
+
+    header.json         クラス名・ベクトライザー設定など
+    coef_t.npy          係数行列の転置 (n_features, n_classes)
+    intercept.npy       切片 (n_classes,)
+    idf.npy             IDF重み（使用時のみ）
+    vocab_hashes.npy    語彙の64bitハッシュ（昇順）
+    vocab_columns.npy   vocab_hashesと同じ順の列番号
+    vocab_terms.bin     語彙文字列（列番号順にUTF-8で連結）
+    vocab_offsets.npy   vocab_terms.bin内の各語の開始位置 (n_features + 1,)
+
+読み込み時は配列をmmap_mode='r'で開くため数ミリ秒で完了し、
+同じファイルを開いた複数プロセス間でページが共有される。
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+FORMAT_VERSION = "compact-linear-v1"
+HEADER_FILE = "header.json"
+ARRAY_FILES = (
+    "coef_t.npy", "intercept.npy", "idf.npy", "vocab_hashes.npy",
+    "vocab_columns.npy", "vocab_terms.bin", "vocab_offsets.npy"
+)
+
+# 語彙のトークン化に関わるCountVectorizerの引数
+_ANALYZER_PARAMS = (
+    "input", "encoding", "decode_error", "strip_accents", "lowercase",
+    "stop_words", "token_pattern", "ngram_range", "analyzer"
+)
+# HashingVectorizerの引数（normとalternate_sign以外はトークン化に関わる）
+_HASHING_PARAMS = _ANALYZER_PARAMS + ("n_features", "binary", "norm", "alternate_sign")
+
+
+def term_hashes(terms: List[str]) -> np.ndarray:
+    """語の64bitハッシュ（プロセス間で安定）"""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+         for term in terms),
+        dtype=np.uint64,
+        count=len(terms)
+    )
+
+
+def is_compact_artifact(path: str) -> bool:
+    """パスがコンパクト形式のモデルディレクトリかどうか"""
+    return (Path(path) / HEADER_FILE).is_file()
+
+
+class CompactLinearClassifier:
+    """メモリマップした係数で推論する線形分類器（LogisticRegression互換の推論API）"""
+
+    def __init__(self, classes: np.ndarray, coef_t: np.ndarray, intercept: np.ndarray,
+                 probability: str = "multinomial"):
+        self.classes_ = classes
+        self.coef_t = coef_t
+        self.intercept_ = intercept
+        # "multinomial"（softmax）/ "ovr"（シグモイドを正規化）/ "binary"
+        self.probability = probability
+
+    @property
+    def coef_(self) -> np.ndarray:
+        return self.coef_t.T
+
+    @property
+    def n_features_in_(self) -> int:
+        return self.coef_t.shape[0]
+
+    def decision_function(self, X: Any) -> np.ndarray:
+        scores = np.asarray(X @ self.coef_t) + self.intercept_
+        if self.probability == "binary":
+            return scores.ravel()
+        return scores
+
+    def predict(self, X: Any) -> np.ndarray:
+        scores = self.decision_function(X)
+        if self.probability == "binary":
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        scores = self.decision_function(X)
+        if self.probability == "binary":
+            positive = 1.0 / (1.0 + np.exp(-scores))
+            return np.column_stack([1.0 - positive, positive])
+        if self.probability == "ovr":
+            probabilities = 1.0 / (1.0 + np.exp(-scores))
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        scores = scores - scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+
+class CompactTfidfVectorizer:
+    """配列ベースの語彙で動くTF-IDFベクトライザー（TfidfVectorizer.transformと同じ出力）
+
+    語彙はdictではなく、ソート済みハッシュ配列への二分探索で引く。
+    """
+
+    def __init__(self, params: Dict[str, Any], vocab_hashes: Optional[np.ndarray],
+                 vocab_columns: Optional[np.ndarray], idf: Optional[np.ndarray],
+                 n_features: int, terms_path: Optional[Path] = None,
+                 offsets: Optional[np.ndarray] = None):
+        self.params = params
+        self.vocab_hashes = vocab_hashes
+        self.vocab_columns = vocab_columns
+        self.idf_ = idf
+        self.n_features = n_features
+        self._terms_path = terms_path
+        self._offsets = offsets
+        self._analyzer = None
+        self._hashing = None
+
+    @property
+    def is_hashing(self) -> bool:
+        return self.params["type"] == "hashing"
+
+    def _analyzer_kwargs(self) -> Dict[str, Any]:
+        kwargs = dict(self.params["analyzer"])
+        kwargs["ngram_range"] = tuple(kwargs["ngram_range"])
+        return kwargs
+
+    def _get_analyzer(self):
+        if self._analyzer is None:
+            from sklearn.feature_extraction.text import CountVectorizer
+            self._analyzer = CountVectorizer(**self._analyzer_kwargs()).build_analyzer()
+        return self._analyzer
+
+    def _get_hashing(self):
+        if self._hashing is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            self._hashing = HashingVectorizer(**self._analyzer_kwargs())
+        return self._hashing
+
+    def _count(self, X: List[str]):
+        """語彙を引いて出現回数のCSR行列を作成"""
+        import scipy.sparse as sp
+
+        analyze = self._get_analyzer()
+        local_vocabulary: Dict[str, int] = {}
+        local_indices = []
+        indptr = [0]
+        for doc in X:
+            for token in analyze(doc):
+                local_indices.append(local_vocabulary.setdefault(token, len(local_vocabulary)))
+            indptr.append(len(local_indices))
+
+        # バッチ内のユニークな語だけをハッシュ化して二分探索
+        columns = np.full(len(local_vocabulary), -1, dtype=np.int64)
+        if local_vocabulary:
+            hashes = term_hashes(list(local_vocabulary))
+            positions = np.searchsorted(self.vocab_hashes, hashes)
+            positions[positions >= len(self.vocab_hashes)] = 0
+            found = self.vocab_hashes[positions] == hashes
+            columns[found] = self.vocab_columns[positions[found]]
+
+        indptr = np.asarray(indptr, dtype=np.int64)
+        cols = columns[np.asarray(local_indices, dtype=np.int64)]
+        rows = np.repeat(np.arange(len(X)), np.diff(indptr))
+        known = cols >= 0
+        counts = sp.csr_matrix(
+            (np.ones(int(known.sum()), dtype=np.float64), (rows[known], cols[known])),
+            shape=(len(X), self.n_features)
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def transform(self, X: List[str]):
+        from sklearn.preprocessing import normalize
+
+        if self.is_hashing:
+            matrix = self._get_hashing().transform(X).astype(np.float64)
+        else:
+            matrix = self._count(X)
+            if self.params.get("binary"):
+                matrix.data.fill(1.0)
+            if self.params.get("sublinear_tf"):
+                np.log(matrix.data, matrix.data)
+                matrix.data += 1.0
+
+        if self.idf_ is not None:
+            matrix.data *= self.idf_[matrix.indices]
+        if self.params.get("norm"):
+            matrix = normalize(matrix, norm=self.params["norm"], copy=False)
+        return matrix.astype(np.dtype(self.params.get("dtype", "float64")), copy=False)
+
+    def get_feature_names_out(self) -> np.ndarray:
+        """列番号順の語彙（必要になった時だけファイルから復元）"""
+        if self._terms_path is None:
+            raise ValueError("Hashing vectorizer has no vocabulary")
+        blob = np.memmap(self._terms_path, dtype=np.uint8, mode="r") if self._offsets[-1] else b""
+        return np.array([
+            bytes(blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+            for i in range(len(self._offsets) - 1)
+        ], dtype=object)
+
+
+def _json_value(value: Any) -> Any:
+    """ベクトライザー引数をJSON化"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, tuple):
+        return list(value)
+    if isinstance(value, type):
+        return np.dtype(value).name
+    if callable(value):
+        raise ValueError(f"Callable vectorizer parameters cannot be stored: {value!r}")
+    return value
+
+
+def _vectorizer_spec(vectorizer: Any) -> Tuple[Dict[str, Any], Optional[Dict[str, int]], Optional[np.ndarray]]:
+    """ベクトライザーから(設定, 語彙, IDF)を取り出す"""
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer, CountVectorizer
+    from sklearn.pipeline import Pipeline
+
+    # NaturalLanguagePreprocessorでラップされている場合は中身を使う
+    vectorizer = getattr(vectorizer, "vectorizer", vectorizer)
+
+    if isinstance(vectorizer, (TfidfVectorizer, CountVectorizer)):
+        params = vectorizer.get_params()
+        for key in ("preprocessor", "tokenizer"):
+            if params.get(key) is not None:
+                raise ValueError(f"Vectorizers with a custom {key} are not supported")
+        is_tfidf = isinstance(vectorizer, TfidfVectorizer)
+        spec = {
+            "type": "tfidf",
+            "analyzer": {key: _json_value(params[key]) for key in _ANALYZER_PARAMS},
+            "binary": params["binary"],
+            "sublinear_tf": params.get("sublinear_tf", False) if is_tfidf else False,
+            "norm": params.get("norm") if is_tfidf else None,
+            "dtype": _json_value(params["dtype"])
+        }
+        idf = vectorizer.idf_ if is_tfidf and vectorizer.use_idf else None
+        return spec, vectorizer.vocabulary_, idf
+
+    hashing, idf = vectorizer, None
+    norm = None
+    if isinstance(vectorizer, Pipeline):
+        hashing, transformer = vectorizer.steps[0][1], vectorizer.steps[-1][1]
+        idf = transformer.idf_ if transformer.use_idf else None
+        norm = transformer.norm
+    if not isinstance(hashing, HashingVectorizer):
+        raise ValueError(f"Unsupported vectorizer type: {type(vectorizer).__name__}")
+    params = hashing.get_params()
+    analyzer = {key: _json_value(params[key]) for key in _HASHING_PARAMS}
+    if hashing is not vectorizer:
+        # TfidfTransformer側で正規化するため、ハッシュ段では正規化しない
+        analyzer["norm"] = None
+    else:
+        norm = None
+    spec = {
+        "type": "hashing",
+        "analyzer": analyzer,
+        "norm": norm,
+        "dtype": "float64"
+    }
+    return spec, None, idf
+
+
+def _probability_mode(model: Any) -> str:
+    """predict_probaの計算方式を判定"""
+    loss = getattr(model, "loss", None)
+    if loss is not None and loss != "log_loss":
+        raise ValueError(f"Compact format requires probabilistic outputs, got loss={loss}")
+    if len(model.classes_) <= 2:
+        return "binary"
+    if loss == "log_loss":
+        # SGDClassifierはOvRのシグモイドを正規化する
+        return "ovr"
+    multi_class = getattr(model, "multi_class", "auto")
+    if multi_class == "ovr" or (multi_class in ("auto", "deprecated")
+                                and getattr(model, "solver", None) == "liblinear"):
+        return "ovr"
+    return "multinomial"
+
+
+def save_compact_artifact(path: str, model: Any, vectorizer: Any,
+                          metadata: Optional[Dict[str, Any]] = None) -> None:
+    """線形モデルとベクトライザーをコンパクト形式で保存"""
+    # LogisticRegressionModelなどでラップされている場合は中身を使う
+    model = model.model if hasattr(model, "is_fitted") else model
+    if not hasattr(model, "coef_") or not hasattr(model, "intercept_"):
+        raise ValueError(f"Compact format requires a linear model, got {type(model).__name__}")
+
+    spec, vocabulary, idf = _vectorizer_spec(vectorizer)
+    coef = np.asarray(model.coef_)
+    n_features = coef.shape[1]
+
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    # 上書き時は前回の配列が残らないよう、ヘッダーから順に削除する
+    for name in (HEADER_FILE,) + ARRAY_FILES:
+        (directory / name).unlink(missing_ok=True)
+    np.save(directory / "coef_t.npy", np.ascontiguousarray(coef.T))
+    np.save(directory / "intercept.npy", np.asarray(model.intercept_))
+    if idf is not None:
+        np.save(directory / "idf.npy", np.asarray(idf))
+
+    if vocabulary is not None:
+        if len(vocabulary) != n_features:
+            raise ValueError("Vocabulary size does not match model features")
+        terms = [None] * n_features
+        for term, column in vocabulary.items():
+            terms[column] = term
+        encoded = [term.encode("utf-8") for term in terms]
+        offsets = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        with open(directory / "vocab_terms.bin", "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(directory / "vocab_offsets.npy", offsets)
+
+        hashes = term_hashes(terms)
+        order = np.argsort(hashes, kind="stable")
+        sorted_hashes = hashes[order]
+        if len(sorted_hashes) > 1 and np.any(sorted_hashes[1:] == sorted_hashes[:-1]):
+            raise ValueError("Vocabulary hash collision; cannot store in compact format")
+        np.save(directory / "vocab_hashes.npy", sorted_hashes)
+        np.save(directory / "vocab_columns.npy", order.astype(np.int64))
+
+    header = {
+        "format": FORMAT_VERSION,
+        "model_type": type(model).__name__,
+        "classes": np.asarray(model.classes_).tolist(),
+        "probability": _probability_mode(model),
+        "n_features": int(n_features),
+        "vectorizer": spec,
+        "metadata": metadata or {}
+    }
+    # ヘッダーは最後に書く（ヘッダーの存在を保存完了の目印にする）
+    with open(directory / HEADER_FILE, "w") as f:
+        json.dump(header, f, indent=2, ensure_ascii=False)
+
+
+def load_compact_artifact(path: str, mmap: bool = True) -> Tuple[CompactLinearClassifier, CompactTfidfVectorizer]:
+    """コンパクト形式のモデルを読み込み（配列はメモリマップ）"""
+    directory = Path(path)
+    with open(directory / HEADER_FILE, "r") as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format: {header.get('format')}")
+
+    mmap_mode = "r" if mmap else None
+
+    def load_array(name: str) -> Optional[np.ndarray]:
+        file_path = directory / name
+        return np.load(file_path, mmap_mode=mmap_mode) if file_path.exists() else None
+
+    classifier = CompactLinearClassifier(
+        classes=np.asarray(header["classes"], dtype=object),
+        coef_t=load_array("coef_t.npy"),
+        intercept=np.load(directory / "intercept.npy"),
+        probability=header["probability"]
+    )
+    has_vocabulary = header["vectorizer"]["type"] == "tfidf"
+    vectorizer = CompactTfidfVectorizer(
+        params=header["vectorizer"],
+        vocab_hashes=load_array("vocab_hashes.npy"),
+        vocab_columns=load_array("vocab_columns.npy"),
+        idf=load_array("idf.npy"),
+        n_features=header["n_features"],
+        terms_path=directory / "vocab_terms.bin" if has_vocabulary else None,
+        offsets=load_array("vocab_offsets.npy")
+    )
+    return classifier, vectorizer
+
+
+def convert_joblib_artifact(joblib_path: str, output_path: str) -> None:
+    """既存のjoblib（新形式の辞書）をコンパクト形式に変換"""
+    import joblib
+
+    model_data = joblib.load(joblib_path)
+    if not isinstance(model_data, dict):
+        raise ValueError("Only new-format joblib files (with a vectorizer) can be converted")
+    metadata = {key: value for key, value in model_data.items()
+                if key in ("performance", "model_type")}
+    save_compact_artifact(output_path, model_data["model"], model_data["vectorizer"],
+                          metadata=json.loads(json.dumps(metadata, default=str)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a joblib model to the compact format")
+    parser.add_argument("joblib_path")
+    parser.add_argument("output_path")
+    args = parser.parse_args()
+    convert_joblib_artifact(args.joblib_path, args.output_path)
+    print(f"✅ 変換完了: {args.output_path}")
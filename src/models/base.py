@@ -1,6 +1,5 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict
-import joblib
 import numpy as np
 
 class BaseModel(ABC):
@@ -17,12 +16,30 @@ class BaseModel(ABC):
     def predict(self, X: np.ndarray) -> np.ndarray:
         pass
 
-    def save(self, path: str, preprocessor=None) -> None:
-        """モデルを保存（新形式対応）"""
+    def save(self, path: str, preprocessor=None, format: str = "joblib") -> None:
+        """モデルを保存（新形式対応）
+
+        format="compact"の場合はメモリマップ可能なディレクトリ形式で保存する
+        （線形モデルのみ対応、src/models/artifact.py参照）。
+        """
         if not self.is_fitted:
             raise ValueError("Model must be fitted before saving")
+        import joblib
 
-        if preprocessor is not None:
+        if format == "compact":
+            if preprocessor is None:
+                raise ValueError("Compact format requires a preprocessor")
+            from .artifact import save_compact_artifact
+            save_compact_artifact(path, self.model, preprocessor,
+                                  metadata={'model_type': self.__class__.__name__})
+        elif format != "joblib":
+            raise ValueError(f"Invalid model format: {format}")
+        elif preprocessor is not None:
+            if getattr(preprocessor, "n_jobs", 1) != 1:
+                # 推論側（Webサーバー・ワーカー）でプロセスプールを起動しないよう、並列数1で保存する
+                import copy
+                preprocessor = copy.copy(preprocessor)
+                preprocessor.n_jobs = 1
             # 新形式: モデル + 前処理器
             model_data = {
                 'model': self.model,
@@ -37,6 +54,7 @@ class BaseModel(ABC):
 
     def load(self, path: str) -> 'BaseModel':
         """モデルを読み込み"""
+        import joblib
         self.model = joblib.load(path)
         self.is_fitted = True
         return self
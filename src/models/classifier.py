@@ -1,15 +1,24 @@
 import numpy as np
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.svm import SVC
 from .base import BaseModel
 
+# sklearnの推定器は各モデルの生成時に読み込む（推論だけのプロセスでは不要なモジュールを読み込まない）
+
 class LogisticRegressionModel(BaseModel):
     """ロジスティック回帰モデル"""
     def __init__(self, **kwargs):
         super().__init__()
+        from sklearn.linear_model import LogisticRegression
         self.model = LogisticRegression(**kwargs)
 
+    @classmethod
+    def from_fitted(cls, estimator) -> 'LogisticRegressionModel':
+        """学習済みの推定器をラップする（LogisticRegressionを生成しないためsklearnを読み込まない）"""
+        model = cls.__new__(cls)
+        BaseModel.__init__(model)
+        model.model = estimator
+        model.is_fitted = True
+        return model
+
     def fit(self, X: np.ndarray, y: np.ndarray) -> 'LogisticRegressionModel':
         self.model.fit(X, y)
         self.is_fitted = True
@@ -29,6 +38,7 @@ class RandomForestModel(BaseModel):
     """ランダムフォレストモデル"""
     def __init__(self, **kwargs):
         super().__init__()
+        from sklearn.ensemble import RandomForestClassifier
         self.model = RandomForestClassifier(**kwargs)
 
     def fit(self, X: np.ndarray, y: np.ndarray) -> 'RandomForestModel':
@@ -45,6 +55,7 @@ class SVMModel(BaseModel):
     """サポートベクトルマシンモデル"""
     def __init__(self, **kwargs):
         super().__init__()
+        from sklearn.svm import SVC
         self.model = SVC(**kwargs)
 
     def fit(self, X: np.ndarray, y: np.ndarray) -> 'SVMModel':
@@ -57,6 +68,36 @@ class SVMModel(BaseModel):
             raise ValueError("Model must be fitted before prediction")
         return self.model.predict(X)
 
+class SGDClassifierModel(BaseModel):
+    """確率的勾配降下法による線形分類器（partial_fitでチャンク単位に学習可能）"""
+    def __init__(self, **kwargs):
+        super().__init__()
+        from sklearn.linear_model import SGDClassifier
+        # 確率出力（Webアプリの上位候補表示）のため、既定の損失はlog_loss
+        kwargs.setdefault("loss", "log_loss")
+        self.model = SGDClassifier(**kwargs)
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> 'SGDClassifierModel':
+        self.model.fit(X, y)
+        self.is_fitted = True
+        return self
+
+    def partial_fit(self, X: np.ndarray, y: np.ndarray, classes: np.ndarray = None) -> 'SGDClassifierModel':
+        """1チャンク分を学習（初回はclassesに全クラスを渡す）"""
+        self.model.partial_fit(X, y, classes=classes)
+        self.is_fitted = True
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if not self.is_fitted:
+            raise ValueError("Model must be fitted before prediction")
+        return self.model.predict(X)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if not self.is_fitted:
+            raise ValueError("Model must be fitted before prediction")
+        return self.model.predict_proba(X)
+
 class ModelFactory:
     """モデルのファクトリクラス"""
     @staticmethod
@@ -64,7 +105,8 @@ class ModelFactory:
         models = {
             "logistic_regression": LogisticRegressionModel,
             "random_forest": RandomForestModel,
-            "svm": SVMModel
+            "svm": SVMModel,
+            "sgd": SGDClassifierModel
         }
         if model_type not in models:
             raise ValueError(f"Invalid model type: {model_type}")
@@ -0,0 +1,126 @@
+"""係数に基づく語彙の枝刈り（エクスポート用）"""
+import copy
+import io
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from ..models.base import BaseModel
+from ..data.preprocessor import NaturalLanguagePreprocessor
+from ..utils.logger import get_logger
+
+
+def _dumped_size(obj: Any) -> int:
+    """joblib.dumpした場合のバイト数"""
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell()
+
+
+def _measure_latency(model: BaseModel, vectorizer: Any, texts: List[str]) -> float:
+    """1件ずつtransform + predictした場合の平均レイテンシ（秒）"""
+    start = time.perf_counter()
+    for text in texts:
+        model.predict(vectorizer.transform([text]))
+    return (time.perf_counter() - start) / len(texts)
+
+
+class NormPreservingColumnSelector:
+    """元のベクトライザーで変換し、残す列だけを返す（norm='l2'のTF-IDFの枝刈り用）
+
+    削除した語も行ベクトルのL2ノルムに含めて計算するため、残した列の値は元のベクトライザーと
+    完全に一致する。語彙は元のまま保持し、小さくなるのは係数行列だけ。
+    """
+
+    def __init__(self, vectorizer: Any, columns: np.ndarray):
+        self.vectorizer = vectorizer
+        self.columns = np.asarray(columns)
+
+    def transform(self, X: List[str]) -> Any:
+        return self.vectorizer.transform(X)[:, self.columns]
+
+    def get_feature_names_out(self) -> np.ndarray:
+        return self.vectorizer.get_feature_names_out()[self.columns]
+
+
+def prune_vocabulary(
+    model: BaseModel,
+    preprocessor: Any,
+    tol: float = 0.0,
+    eval_texts: Optional[List[str]] = None,
+    latency_samples: int = 200) -> Tuple[BaseModel, NaturalLanguagePreprocessor, Dict[str, Any]]:
+    """全クラスで係数の絶対値がtol以下の特徴量を語彙から削除する
+
+    elastic-net / L1で学習したモデルでは係数が全クラスで0の列が多く、
+    それらのn-gramは推論時のスコアに寄与しない。語彙・IDF・係数行列から
+    該当列を取り除いた、より小さいモデルと前処理器を返す。
+
+    norm='l2'のTF-IDFでは削除した語も行ベクトルのノルムに含まれるため、語彙は削らず
+    NormPreservingColumnSelectorでノルムを元のまま計算する（tol=0なら予測・確率が一致する）。
+    normなしの場合は語彙・IDFからも該当列を取り除く。
+    eval_textsを渡すと、予測ラベルの一致率と確率の最大差をレポートに含める。
+    """
+    from sklearn.base import clone
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    logger = get_logger("prune_vocabulary")
+    vectorizer = getattr(preprocessor, "vectorizer", preprocessor)
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise ValueError(f"Vocabulary pruning requires a TfidfVectorizer, got {type(vectorizer).__name__}")
+    if not hasattr(model.model, "coef_"):
+        raise ValueError("Vocabulary pruning requires a linear model with coef_")
+
+    coef = np.asarray(model.model.coef_)
+    keep = np.flatnonzero(np.abs(coef).max(axis=0) > tol)
+    n_before = coef.shape[1]
+    logger.info(f"Pruning vocabulary: {n_before} -> {len(keep)} features (tol={tol})")
+
+    if vectorizer.norm is not None:
+        # 削除した語もノルムの計算に使うため、語彙は元のベクトライザーのものを使う
+        pruned_vectorizer = NormPreservingColumnSelector(vectorizer, keep)
+    else:
+        # 語彙・IDFを作り直す（列順は元の順序を保つ）
+        terms = vectorizer.get_feature_names_out()[keep]
+        pruned_vectorizer = clone(vectorizer)
+        pruned_vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+        if vectorizer.use_idf:
+            pruned_vectorizer.idf_ = vectorizer.idf_[keep]
+
+    pruned_sklearn_model = copy.deepcopy(model.model)
+    pruned_sklearn_model.coef_ = np.ascontiguousarray(coef[:, keep])
+    pruned_sklearn_model.n_features_in_ = len(keep)
+
+    pruned_model = copy.copy(model)
+    pruned_model.model = pruned_sklearn_model
+    pruned_preprocessor = NaturalLanguagePreprocessor(vectorizer=pruned_vectorizer)
+
+    report = {
+        "tol": tol,
+        "n_features_before": int(n_before),
+        "n_features_after": int(len(keep)),
+        "feature_reduction": 1.0 - len(keep) / n_before if n_before else 0.0,
+        "vectorizer_bytes_before": _dumped_size(vectorizer),
+        "vectorizer_bytes_after": _dumped_size(pruned_vectorizer),
+        "model_bytes_before": _dumped_size(model.model),
+        "model_bytes_after": _dumped_size(pruned_sklearn_model)
+    }
+
+    if eval_texts:
+        original = model.predict(vectorizer.transform(eval_texts))
+        pruned = pruned_model.predict(pruned_vectorizer.transform(eval_texts))
+        report["prediction_agreement"] = float(np.mean(original == pruned))
+        if hasattr(model, "predict_proba"):
+            report["max_probability_diff"] = float(np.abs(
+                model.predict_proba(vectorizer.transform(eval_texts))
+                - pruned_model.predict_proba(pruned_vectorizer.transform(eval_texts))
+            ).max())
+
+        samples = eval_texts[:latency_samples]
+        report["latency_seconds_before"] = _measure_latency(model, vectorizer, samples)
+        report["latency_seconds_after"] = _measure_latency(pruned_model, pruned_vectorizer, samples)
+
+    logger.info(f"Pruned model size: {report['vectorizer_bytes_before'] + report['model_bytes_before']} -> "
+                f"{report['vectorizer_bytes_after'] + report['model_bytes_after']} bytes")
+    return pruned_model, pruned_preprocessor, report
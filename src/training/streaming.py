@@ -0,0 +1,83 @@
+"""チャンク単位のpartial_fitによるout-of-core訓練"""
+import importlib
+import time
+from typing import Callable, Iterable, List, Tuple
+
+import numpy as np
+
+from ..models.base import BaseModel
+from ..data.preprocessor import Preprocessor
+from ..utils.logger import get_logger
+
+
+# (labels, texts)のチャンクを先頭から返すイテレータを作る関数（エポックごとに呼び直す）
+ChunkSource = Callable[[], Iterable[Tuple[List[str], List[str]]]]
+# 分割名（"train" / "test"）とチャンクサイズから(labels, texts)のチャンクを返す関数
+# （ProgrammingLanguageLoader.iter_chunksと同じ形。training.chunk_sourceで差し替える）
+ChunkSourceFactory = Callable[[str, int], Iterable[Tuple[List[str], List[str]]]]
+
+
+def load_chunk_source(spec: str) -> ChunkSourceFactory:
+    """"package.module:function"形式の指定からチャンクソースの関数を読み込む"""
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"chunk_source must be 'package.module:function', got {spec!r}")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    if not callable(factory):
+        raise ValueError(f"chunk_source {spec!r} is not callable")
+    return factory
+
+
+def collect_classes(chunk_source: ChunkSource) -> List[str]:
+    """チャンクを1周してラベルの一覧を集める（ラベルだけを保持する）"""
+    classes = set()
+    for labels, _ in chunk_source():
+        classes.update(labels)
+    return sorted(classes)
+
+
+class StreamingTrainer:
+    """データセットをチャンクごとにベクトル化してpartial_fitする
+
+    前処理器は状態を持たないもの（IDFなしのHashingVectorizer）に限る。
+    全体の特徴量行列を作らないため、ピークメモリはチャンクサイズで決まる。
+    """
+    def __init__(self,
+                 preprocessor: Preprocessor,
+                 classes: List[str],
+                 epochs: int = 1):
+        if not getattr(preprocessor, "is_stateless", False):
+            raise ValueError("Streaming training requires a stateless preprocessor "
+                             "(hashing: true, hashing_use_idf: false)")
+        self.preprocessor = preprocessor
+        self.classes = np.asarray(classes)
+        self.epochs = epochs
+        self.logger = get_logger(self.__class__.__name__)
+
+    def train(self, model: BaseModel, chunk_source: ChunkSource) -> BaseModel:
+        """全チャンクをepochs回流してモデルを訓練"""
+        if not hasattr(model, "partial_fit"):
+            raise ValueError(f"Streaming training requires a model with partial_fit, "
+                             f"got {model.__class__.__name__}")
+
+        self.logger.info(f"Starting streaming training ({self.epochs} epochs, {len(self.classes)} classes)...")
+        for epoch in range(self.epochs):
+            start = time.time()
+            n_samples = 0
+            for labels, texts in chunk_source():
+                model.partial_fit(self.preprocessor.transform(texts), np.asarray(labels),
+                                  classes=self.classes)
+                n_samples += len(labels)
+            self.logger.info(f"Epoch {epoch + 1}/{self.epochs}: {n_samples} samples "
+                             f"in {time.time() - start:.2f}s")
+        self.logger.info("Model training completed successfully")
+        return model
+
+    def predict(self, model: BaseModel, chunk_source: ChunkSource) -> Tuple[List[str], np.ndarray]:
+        """チャンクごとに予測し、(正解ラベル, 予測ラベル)を返す"""
+        y_true: List[str] = []
+        y_pred = []
+        for labels, texts in chunk_source():
+            y_true.extend(labels)
+            y_pred.append(model.predict(self.preprocessor.transform(texts)))
+        return y_true, np.concatenate(y_pred) if y_pred else np.array([])
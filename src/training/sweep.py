@@ -0,0 +1,134 @@
+"""model.parametersのハイパーパラメータ探索
+
+ベクトル化は1回だけ行い、同じ特徴量行列で候補モデルを並列に訓練・評価する。
+"""
+import csv
+import io
+import itertools
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import joblib
+import numpy as np
+import yaml
+
+from ..config.config import Config
+from ..models.classifier import ModelFactory
+from ..evaluation.evaluator import Evaluator
+from .trainer import Trainer, cap_n_jobs
+from ..utils.logger import get_logger
+
+
+# 予測レイテンシの測定に使うテストサンプル数
+LATENCY_SAMPLES = 200
+
+LEADERBOARD_COLUMNS = [
+    "rank", "parameters", "accuracy", "f1_score", "fit_time",
+    "predict_latency_ms", "model_bytes", "error"
+]
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """{パラメータ: 値のリスト}の全組み合わせを展開"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def load_sweep_spec(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    """探索設定YAMLから(候補のパラメータ上書きリスト, ワーカー数)を読み込む
+
+    gridは全組み合わせに展開し、candidatesの明示リストと連結する。
+    """
+    with open(path, "r") as f:
+        spec = yaml.safe_load(f) or {}
+    candidates = expand_grid(spec["grid"]) if spec.get("grid") else []
+    candidates.extend(spec.get("candidates") or [])
+    if not candidates:
+        raise ValueError(f"Sweep spec defines no candidates: {path}")
+    return candidates, int(spec.get("n_workers", 1))
+
+
+def _evaluate_candidate(config: Config, overrides: Dict[str, Any], inner_jobs: int,
+                        x_train: Any, y_train: List[str], x_test: Any, y_test: List[str]) -> Dict[str, Any]:
+    """候補を1つ訓練して評価（ワーカープロセスで実行）"""
+    row = {"parameters": overrides}
+    try:
+        parameters = cap_n_jobs({**config.model.parameters, **overrides}, inner_jobs)
+        model = ModelFactory.create_model(config.model.model_type, **parameters)
+        trainer = Trainer(
+            validation_split=config.data.validation_split,
+            random_seed=config.random_seed,
+            epochs=config.training.epochs,
+            early_stopping=config.training.early_stopping,
+            patience=config.training.patience
+        )
+
+        start = time.time()
+        trainer.train(model, x_train, y_train, fit_preprocessor=False)
+        row["fit_time"] = time.time() - start
+
+        metrics = Evaluator().evaluate_classification(model, x_test, y_test)["metrics"]
+        row["accuracy"] = metrics["accuracy"]
+        row["f1_score"] = metrics["f1_score"]
+
+        # 1件ずつ予測した場合の平均レイテンシ（Webアプリでの推論に相当）
+        n_samples = min(LATENCY_SAMPLES, x_test.shape[0])
+        start = time.perf_counter()
+        for i in range(n_samples):
+            model.predict(x_test[i:i + 1])
+        row["predict_latency_ms"] = (time.perf_counter() - start) / max(n_samples, 1) * 1000
+
+        buffer = io.BytesIO()
+        joblib.dump(model.model, buffer)
+        row["model_bytes"] = buffer.tell()
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def run_sweep(config: Config,
+              candidates: List[Dict[str, Any]],
+              x_train: Any,
+              y_train: List[str],
+              x_test: Any,
+              y_test: List[str],
+              n_workers: int = 1) -> List[Dict[str, Any]]:
+    """候補を並列に訓練し、精度順のリーダーボードを返す
+
+    ワーカー数 × モデル内部のn_jobsがCPU数を超えないよう、各モデルのn_jobsを制限する。
+    特徴量行列はjoblibがメモリマップして各ワーカーと共有する。
+    """
+    logger = get_logger("run_sweep")
+    cpu_count = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers if n_workers > 0 else cpu_count, len(candidates)))
+    inner_jobs = max(1, cpu_count // n_workers)
+    logger.info(f"Sweeping {len(candidates)} candidates with {n_workers} workers "
+                f"(n_jobs per model <= {inner_jobs})")
+
+    rows = joblib.Parallel(n_jobs=n_workers)(
+        joblib.delayed(_evaluate_candidate)(config, overrides, inner_jobs,
+                                            x_train, y_train, x_test, y_test)
+        for overrides in candidates
+    )
+
+    rows.sort(key=lambda row: row.get("accuracy", -np.inf), reverse=True)
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+        if "error" in row:
+            logger.warning(f"Candidate {row['parameters']} failed: {row['error']}")
+        else:
+            logger.info(f"#{rank} {row['parameters']}: accuracy={row['accuracy']:.4f}, "
+                        f"f1={row['f1_score']:.4f}, fit={row['fit_time']:.1f}s")
+    return rows
+
+
+def save_leaderboard(rows: List[Dict[str, Any]], output_dir: Path) -> None:
+    """リーダーボードをCSVで保存（JSONはresults.jsonに含める）"""
+    with open(output_dir / "leaderboard.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=LEADERBOARD_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**{key: row.get(key, "") for key in LEADERBOARD_COLUMNS},
+                             "parameters": yaml.safe_dump(row["parameters"], default_flow_style=True).strip()})
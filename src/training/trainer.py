@@ -1,29 +1,115 @@
+import copy
 import logging
-from typing import Tuple, Optional
+import math
+import os
+import time
+import warnings
+from typing import Any, Dict, List, Tuple, Optional
 import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.metrics import accuracy_score
 from sklearn.model_selection import train_test_split
 
 from ..models.base import BaseModel
 from ..data.preprocessor import Preprocessor
 from ..utils.logger import get_logger
 
+# Evaluatorが計算する指標（交差検証で平均・標準偏差を集計）
+CV_METRICS = ("accuracy", "precision", "recall", "f1_score")
+
+# warm_startを無視するソルバー（エポックごとに最初から学習し直すため、エポック単位の訓練は使わない）
+WARM_START_UNSUPPORTED_SOLVERS = {"liblinear"}
+
+# 交差検証のワーカープロセスに一度だけ渡す全データ（フォールドごとにpickleしない）
+_cv_texts = None
+_cv_labels = None
+
+
+def cap_n_jobs(parameters: Dict[str, Any], inner_jobs: int) -> Dict[str, Any]:
+    """モデル内部のn_jobsをワーカーあたりのコア数以下に抑える"""
+    parameters = dict(parameters)
+    n_jobs = parameters.get("n_jobs")
+    if n_jobs is not None and (n_jobs < 0 or n_jobs > inner_jobs):
+        parameters["n_jobs"] = inner_jobs
+    return parameters
+
+
+def _init_cv_worker(texts: List[str], labels: List[str]) -> None:
+    global _cv_texts, _cv_labels
+    _cv_texts = texts
+    _cv_labels = labels
+
+
+def _run_fold(fold: int, train_idx: np.ndarray, val_idx: np.ndarray,
+              trainer_params: Dict[str, Any], preprocessor: Preprocessor,
+              model_type: str, model_params: Dict[str, Any],
+              feature_cache: Any, cache_key: Optional[str]) -> Dict[str, Any]:
+    """1フォールド分の前処理・訓練・評価（ワーカープロセスで実行）
+
+    前処理器はフォールドの訓練部分だけでfitする（検証部分の語彙・IDFが混ざらない）。
+    """
+    from ..models.classifier import ModelFactory
+    from ..evaluation.evaluator import Evaluator
+
+    start = time.time()
+    x_train = [_cv_texts[i] for i in train_idx]
+    y_train = [_cv_labels[i] for i in train_idx]
+    x_val = [_cv_texts[i] for i in val_idx]
+    y_val = [_cv_labels[i] for i in val_idx]
+
+    cached = feature_cache.load(cache_key, y_train, y_val) if feature_cache is not None else None
+    if cached is not None:
+        _, x_train_processed, x_val_processed = cached
+    else:
+        x_train_processed = preprocessor.fit_transform(x_train)
+        x_val_processed = preprocessor.transform(x_val)
+        if feature_cache is not None:
+            feature_cache.save(cache_key, preprocessor, x_train_processed, x_val_processed, y_train, y_val)
+
+    model = ModelFactory.create_model(model_type, **model_params)
+    Trainer(**trainer_params).train(model, x_train_processed, y_train, fit_preprocessor=False)
+    metrics = Evaluator().evaluate_classification(model, x_val_processed, y_val)["metrics"]
+    return {
+        "fold": fold,
+        "n_train": len(train_idx),
+        "n_val": len(val_idx),
+        "cached_features": cached is not None,
+        "duration": time.time() - start,
+        **{name: float(metrics[name]) for name in CV_METRICS}
+    }
+
+
 class Trainer:
     """モデル訓練クラス"""
     def __init__(self, 
                 preprocessor: Optional[Preprocessor] = None,
                 validation_split: float = 0.1,
-                random_seed: int = 42):
+                random_seed: int = 42,
+                epochs: int = 1,
+                early_stopping: bool = False,
+                patience: int = 5):
         self.preprocessor = preprocessor
         self.validation_split = validation_split
         self.random_seed = random_seed
+        self.epochs = epochs
+        self.early_stopping = early_stopping
+        self.patience = patience
+        # エポックごとの検証スコア（反復訓練した場合のみ）
+        self.history: List[Dict[str, Any]] = []
+        self.best_epoch: Optional[int] = None
+        self.stopped_early = False
         self.logger = get_logger(self.__class__.__name__)
 
-    def train(self, model: BaseModel, x_train: np.ndarray, y_train: np.ndarray) -> BaseModel:
-        """モデルを訓練"""
+    def train(self, 
+              model: BaseModel, 
+              x_train: np.ndarray, 
+              y_train: np.ndarray,
+              fit_preprocessor: bool = True) -> BaseModel:
+        """モデルを訓練（fit_preprocessor=Falseの場合、x_trainは前処理済みとして扱う）"""
         self.logger.info("Starting model training...")
         
         # データの前処理
-        if self.preprocessor:
+        if self.preprocessor and fit_preprocessor:
             self.logger.info("Applying preprocessing...")
             x_train = self.preprocessor.fit_transform(x_train)
         
@@ -41,13 +127,188 @@ class Trainer:
             
         # モデルの訓練
         self.logger.info("Training model...")
-        model.fit(x_train_split, y_train_split)
+        if self.validation_split > 0 and self.epochs > 1 and self._supports_epochs(model):
+            self._train_epochs(model, x_train_split, y_train_split, x_val, y_val)
+        else:
+            model.fit(x_train_split, y_train_split)
         self.logger.info("Model training completed successfully")
 
         return model
+
+    def _supports_epochs(self, model: BaseModel) -> bool:
+        """エポック単位で訓練を継続できるか（partial_fit、またはwarm_start + max_iter）"""
+        if hasattr(model, "partial_fit"):
+            return True
+        params = model.model.get_params() if hasattr(model.model, "get_params") else {}
+        if "warm_start" not in params or "max_iter" not in params:
+            return False
+        if params.get("solver") in WARM_START_UNSUPPORTED_SOLVERS:
+            self.logger.warning(f"Solver {params['solver']} ignores warm_start; "
+                                f"training in a single fit instead of {self.epochs} epochs")
+            return False
+        return True
+
+    def _train_epochs(self,
+                      model: BaseModel,
+                      x_train: np.ndarray,
+                      y_train: np.ndarray,
+                      x_val: np.ndarray,
+                      y_val: np.ndarray) -> None:
+        """エポックごとに検証精度を測り、patienceエポック改善がなければ打ち切る
+
+        warm_start対応モデルはmax_iterをエポック数で割った反復数ずつ継続して学習する。
+        終了時は検証精度が最良だったエポックのモデルに戻す。
+        """
+        uses_partial_fit = hasattr(model, "partial_fit")
+        classes = np.unique(y_train)
+        if not uses_partial_fit:
+            original_params = model.model.get_params()
+            iters_per_epoch = max(1, math.ceil(original_params["max_iter"] / self.epochs))
+            model.model.set_params(warm_start=True, max_iter=iters_per_epoch)
+
+        try:
+            self._run_epochs(model, x_train, y_train, x_val, y_val, uses_partial_fit, classes,
+                             None if uses_partial_fit else iters_per_epoch)
+        finally:
+            if not uses_partial_fit:
+                model.model.set_params(warm_start=original_params["warm_start"],
+                                       max_iter=original_params["max_iter"])
+
+    def _run_epochs(self, model: BaseModel, x_train: np.ndarray, y_train: np.ndarray,
+                    x_val: np.ndarray, y_val: np.ndarray, uses_partial_fit: bool,
+                    classes: np.ndarray, iters_per_epoch: Optional[int]) -> None:
+        """エポックのループ（終了時に最良エポックのモデルをmodel.modelに戻す）"""
+        self.history = []
+        self.stopped_early = False
+        best_score = -np.inf
+        best_model = None
+        epochs_without_improvement = 0
+        for epoch in range(1, self.epochs + 1):
+            start = time.time()
+            with warnings.catch_warnings():
+                # エポックごとにmax_iterで止めるため、収束警告は想定内
+                warnings.simplefilter("ignore", ConvergenceWarning)
+                if uses_partial_fit:
+                    model.partial_fit(x_train, y_train, classes=classes)
+                else:
+                    model.fit(x_train, y_train)
+            fit_time = time.time() - start
+            val_accuracy = accuracy_score(y_val, model.predict(x_val))
+
+            n_iter = getattr(model.model, "n_iter_", None)
+            n_iter = int(np.max(n_iter)) if n_iter is not None else None
+            self.history.append({
+                "epoch": epoch,
+                "val_accuracy": float(val_accuracy),
+                "fit_time": fit_time,
+                "n_iter": n_iter
+            })
+            self.logger.info(f"Epoch {epoch}/{self.epochs}: val_accuracy={val_accuracy:.4f} "
+                             f"({fit_time:.2f}s)")
+
+            if val_accuracy > best_score:
+                epochs_without_improvement = 0
+            else:
+                epochs_without_improvement += 1
+            # 同じ精度なら後のエポック（より収束したモデル）を残す
+            if val_accuracy >= best_score:
+                best_score = val_accuracy
+                best_model = copy.deepcopy(model.model)
+                self.best_epoch = epoch
+
+            # ソルバーがエポック内の反復数に達する前に収束した場合はそれ以上変わらない
+            if not uses_partial_fit and n_iter is not None and n_iter < iters_per_epoch:
+                self.logger.info(f"Solver converged at epoch {epoch}")
+                break
+            if self.early_stopping and epochs_without_improvement >= self.patience:
+                self.logger.info(f"Early stopping at epoch {epoch} "
+                                 f"(best epoch {self.best_epoch}, val_accuracy={best_score:.4f})")
+                self.stopped_early = True
+                break
+
+        model.model = best_model
+
+    def get_training_summary(self) -> Dict[str, Any]:
+        """results.json用の訓練履歴"""
+        return {
+            "epochs": self.epochs,
+            "early_stopping": self.early_stopping,
+            "patience": self.patience,
+            "best_epoch": self.best_epoch,
+            "stopped_early": self.stopped_early,
+            "history": self.history
+        }
     
+    def cross_validate(self,
+                       model_type: str,
+                       model_params: Dict[str, Any],
+                       texts: List[str],
+                       labels: List[str],
+                       n_folds: int = 5,
+                       n_jobs: int = -1,
+                       feature_cache: Any = None,
+                       cache_key_fn: Any = None) -> Dict[str, Any]:
+        """層化k分割交差検証（フォールドをプロセスプールで並列実行）
+
+        各フォールドはself.preprocessorの未学習コピーをフォールドの訓練部分でfitする。
+        feature_cacheとcache_key_fn(fold) -> キーを渡すと、フォールドごとの特徴量行列を再利用する。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from sklearn.model_selection import StratifiedKFold
+        from ..data.parallel import resolve_n_jobs
+
+        if self.preprocessor is None:
+            raise ValueError("Cross-validation requires a preprocessor")
+
+        start = time.time()
+        n_workers = max(1, min(resolve_n_jobs(n_jobs), n_folds))
+        inner_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+        model_params = cap_n_jobs(model_params, inner_jobs)
+        # フォールド内の前処理は並列化しない（プロセスプールの入れ子を避ける）
+        preprocessor = copy.deepcopy(self.preprocessor)
+        if hasattr(preprocessor, "n_jobs"):
+            preprocessor.n_jobs = 1
+        trainer_params = {
+            "validation_split": self.validation_split,
+            "random_seed": self.random_seed,
+            "epochs": self.epochs,
+            "early_stopping": self.early_stopping,
+            "patience": self.patience
+        }
+
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=self.random_seed)
+        splits = list(splitter.split(np.zeros(len(labels)), labels))
+        self.logger.info(f"Cross-validating {n_folds} folds with {n_workers} workers "
+                         f"(n_jobs per model <= {inner_jobs})")
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_cv_worker,
+                                 initargs=(list(texts), list(labels))) as executor:
+            futures = [
+                executor.submit(_run_fold, fold, train_idx, val_idx, trainer_params, preprocessor,
+                                model_type, model_params, feature_cache,
+                                cache_key_fn(fold) if cache_key_fn else None)
+                for fold, (train_idx, val_idx) in enumerate(splits)
+            ]
+            folds = [future.result() for future in futures]
+
+        for fold in folds:
+            self.logger.info(f"Fold {fold['fold'] + 1}/{n_folds}: accuracy={fold['accuracy']:.4f}, "
+                             f"f1={fold['f1_score']:.4f} ({fold['duration']:.1f}s)")
+        summary = {
+            "n_folds": n_folds,
+            "n_workers": n_workers,
+            "duration": time.time() - start,
+            "folds": folds
+        }
+        for name in CV_METRICS:
+            values = np.array([fold[name] for fold in folds])
+            summary[name] = {"mean": float(values.mean()), "std": float(values.std())}
+        self.logger.info(f"Cross-validation accuracy: {summary['accuracy']['mean']:.4f} "
+                         f"± {summary['accuracy']['std']:.4f}")
+        return summary
+
     def prepare_test_data(self, x_test: np.ndarray) -> np.ndarray:
         """テストデータの前処理"""
         if self.preprocessor:
             return self.preprocessor.transform(x_test)
-        return x_test
\ No newline at end of file
+        return x_test
@@ -0,0 +1,137 @@
+"""プロセスのメモリ使用量の取得"""
+import mmap
+import os
+import sys
+import types
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+
+def current_rss_bytes() -> Optional[int]:
+    """現在の常駐メモリ（RSS）のバイト数（psutilがなければ/procから取得、取れなければNone）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """プロセス開始以降の最大RSSのバイト数"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_memory_bytes(pid: int) -> Dict[str, Optional[int]]:
+    """プロセスのRSS・PSS・USS（プライベート）のバイト数（取得できない項目はNone）
+
+    fork後にコピーオンライトで共有しているページは、RSSでは各プロセスに重複して数えられるが、
+    PSSでは共有しているプロセス数で按分されるため、PSSの合計が全体の実使用量になる。
+    """
+    memory: Dict[str, Optional[int]] = {"rss": None, "pss": None, "uss": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            fields = {}
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+        memory["rss"] = fields.get("Rss")
+        memory["pss"] = fields.get("Pss")
+        memory["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+        return memory
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        info = psutil.Process(pid).memory_full_info()
+        memory["rss"] = info.rss
+        memory["pss"] = getattr(info, "pss", None)
+        memory["uss"] = getattr(info, "uss", None)
+    except Exception:
+        pass
+    return memory
+
+
+def _is_memmapped(array: np.ndarray) -> bool:
+    """ファイルをメモリマップした配列（またはそのビュー）か"""
+    base: Any = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+# これより要素数の多いコンテナは先頭の要素だけを見て全体を推定する（語彙の辞書など）
+ESTIMATE_SAMPLE_SIZE = 64
+
+
+def _sampled_elements_bytes(elements: Iterable[Any], length: int) -> int:
+    """先頭ESTIMATE_SAMPLE_SIZE個の要素のgetsizeofから、length個分のバイト数を推定する"""
+    sample = list(islice(elements, ESTIMATE_SAMPLE_SIZE))
+    if not sample:
+        return 0
+    return sum(sys.getsizeof(element) for element in sample) * length // len(sample)
+
+
+def estimate_resident_bytes(obj: Any) -> int:
+    """objから参照される配列・コンテナ・属性の概算バイト数
+
+    メモリマップした配列はページキャッシュ上にあり、必要に応じて解放されるため含めない。
+    同じオブジェクトやビューの元配列は1回だけ数える。大きなコンテナ（語彙の辞書など）は
+    全要素をたどらず先頭の要素から推定するため、モデルの読み込みよりも十分に速い。
+    """
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, np.ndarray):
+            if _is_memmapped(item):
+                continue
+            if isinstance(item.base, np.ndarray):
+                # ビューは元の配列を数える
+                stack.append(item.base)
+                continue
+            total += item.nbytes
+            if item.dtype == object:
+                if item.size > ESTIMATE_SAMPLE_SIZE:
+                    total += _sampled_elements_bytes(item.flat, item.size)
+                else:
+                    stack.extend(item.ravel())
+            continue
+        if isinstance(item, (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)):
+            continue
+
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            if len(item) > ESTIMATE_SAMPLE_SIZE:
+                total += _sampled_elements_bytes(chain.from_iterable(item.items()), 2 * len(item))
+            else:
+                stack.extend(item.keys())
+                stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            if len(item) > ESTIMATE_SAMPLE_SIZE:
+                total += _sampled_elements_bytes(item, len(item))
+            else:
+                stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
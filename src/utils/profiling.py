@@ -0,0 +1,148 @@
+"""処理ステージごとの時間・メモリ計測"""
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .memory import current_rss_bytes, peak_rss_bytes
+
+MB = 1024 * 1024
+
+# ステージ中のRSSを測るサンプリング間隔（秒）
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+class _RssSampler(threading.Thread):
+    """ステージ実行中のRSSの最大値を別スレッドで記録する"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_bytes() or 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            rss = current_rss_bytes() or 0
+            self.peak = max(self.peak, rss)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_bytes() or 0)
+        return self.peak
+
+
+def _cpu_seconds() -> float:
+    """このプロセスと終了済み子プロセス（プロセスプールのワーカー）のCPU時間"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageProfiler:
+    """ステージごとに経過時間・CPU時間・ピークメモリを記録する
+
+    使い方:
+        profiler = StageProfiler()
+        with profiler.stage("vectorizer_fit"):
+            preprocessor.fit(X_train)
+        profiler.summary()  # results.jsonの"profile"ブロック
+
+    trace_malloc=TrueでPythonのメモリ割り当てのピーク（tracemalloc）も記録する（実行は遅くなる）。
+    profile_dirを指定するとステージごとのcProfile結果を<profile_dir>/<stage>.profに保存する。
+    """
+
+    def __init__(self, trace_malloc: bool = False, profile_dir: Optional[str] = None):
+        self.trace_malloc = trace_malloc
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._order: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """withブロックの処理を1ステージとして計測"""
+        started_tracing = False
+        if self.trace_malloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+
+        profile = None
+        if self.profile_dir is not None:
+            import cProfile
+            profile = cProfile.Profile()
+
+        rss_before = current_rss_bytes()
+        sampler = _RssSampler()
+        sampler.start()
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_seconds()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = _cpu_seconds() - cpu_start
+            peak_rss = sampler.stop()
+            rss_after = current_rss_bytes()
+
+            record = {
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "rss_mb_before": rss_before / MB if rss_before else None,
+                "rss_mb_after": rss_after / MB if rss_after else None,
+                "peak_rss_mb": peak_rss / MB if peak_rss else None
+            }
+            if self.trace_malloc:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                record["tracemalloc_peak_mb"] = (traced_peak - traced_before) / MB
+                if started_tracing:
+                    tracemalloc.stop()
+            if profile is not None:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                profile_path = self.profile_dir / f"{name}.prof"
+                profile.dump_stats(str(profile_path))
+                record["profile_path"] = str(profile_path)
+
+            # 同名のステージは合算する（交差検証の各フォールドなど）
+            if name in self.stages:
+                previous = self.stages[name]
+                for key in ("wall_seconds", "cpu_seconds"):
+                    record[key] += previous[key]
+                # ピークは全回の最大、実行前のRSSは初回のもの（実行後は最後の回のもの）
+                for key in ("peak_rss_mb", "tracemalloc_peak_mb"):
+                    values = [value for value in (previous.get(key), record.get(key)) if value is not None]
+                    if values:
+                        record[key] = max(values)
+                record["rss_mb_before"] = previous["rss_mb_before"]
+                record["calls"] = previous.get("calls", 1) + 1
+            else:
+                self._order.append(name)
+            self.stages[name] = record
+
+    def summary(self) -> Dict[str, Any]:
+        """results.json用の計測結果"""
+        peak = peak_rss_bytes()
+        return {
+            "stages": {name: self.stages[name] for name in self._order},
+            "total_wall_seconds": sum(stage["wall_seconds"] for stage in self.stages.values()),
+            "process_peak_rss_mb": peak / MB if peak else None
+        }
+
+    def format_table(self) -> str:
+        """ステージごとの計測結果を表形式の文字列にする"""
+        lines = [f"{'stage':<20}{'wall s':>10}{'cpu s':>10}{'peak RSS MB':>14}"]
+        for name in self._order:
+            stage = self.stages[name]
+            peak = stage["peak_rss_mb"]
+            lines.append(f"{name:<20}{stage['wall_seconds']:>10.2f}{stage['cpu_seconds']:>10.2f}"
+                         f"{peak if peak is not None else float('nan'):>14.1f}")
+        return "\n".join(lines)
@@ -1,9 +1,10 @@
-import matplotlib.pyplot as plt
 import numpy as np
 from typing import List, Tuple
 
 def plot_training_history(history: dict, save_path: str = None) -> None:
     """訓練履歴をプロット"""
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(1, 2, figsize=(12, 4))
 
     axes[0].plot(history['loss'], label='Training Loss')
@@ -35,6 +36,8 @@ def plot_samples(
     n_samples: int = 10,
     image_shape: Tuple[int, int] = (28, 28)) -> None:
     """サンプル画像を表示"""
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(1, n_samples, figsize=(15, 3))
 
     for i in range(n_samples):
@@ -0,0 +1,110 @@
+"""推論結果キャッシュ"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+# 1エントリあたりの固定オーバーヘッド（キー・タプル・辞書スロットの概算）
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化（改行コードと前後の空白を統一）"""
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+class PredictionCache:
+    """(モデルID, 正規化テキスト)のハッシュをキーにしたLRUキャッシュ
+
+    値は1行分のスコア（予測ラベルと確率ベクトル）と推論方法の補足情報（窓のサンプリングなど）で、
+    top_kなどの整形は呼び出し側で行う。エントリ数とバイト数の両方で上限を設定できる。
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, Any, Optional[np.ndarray], Optional[Dict[str, Any]], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(model_id: str, text: str, variant: str = "") -> str:
+        """キャッシュキーを生成（variantは結果が変わる推論設定。窓のサンプリングの設定など）"""
+        hasher = hashlib.sha256()
+        hasher.update(model_id.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(variant.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(normalize_text(text).encode("utf-8", errors="surrogatepass"))
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, Optional[np.ndarray], Optional[Dict[str, Any]]]]:
+        """キャッシュから(予測ラベル, 確率ベクトル, 補足情報)を取得"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2], entry[3]
+
+    def put(self, key: str, model_id: str, label: Any, probabilities: Optional[np.ndarray],
+            info: Optional[Dict[str, Any]] = None) -> None:
+        """キャッシュに登録し、上限を超えた分を古い順に追い出す"""
+        size = _ENTRY_OVERHEAD_BYTES + len(key)
+        if info is not None:
+            info = dict(info)
+            size += _ENTRY_OVERHEAD_BYTES
+        if probabilities is not None:
+            # バッチ全体の確率行列を保持し続けないよう、行ビューはコピーする
+            probabilities = np.array(probabilities, copy=True)
+            size += probabilities.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[-1]
+            self._entries[key] = (model_id, label, probabilities, info, size)
+            self.current_bytes += size
+
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted[-1]
+                self.evictions += 1
+
+    def invalidate(self, model_id: Optional[str] = None) -> int:
+        """指定モデル（省略時は全モデル）のエントリを削除し、削除件数を返す"""
+        with self._lock:
+            if model_id is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key, entry in self._entries.items() if entry[0] == model_id]
+            for key in keys:
+                self.current_bytes -= self._entries.pop(key)[-1]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス・追い出しなどの統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -1,66 +1,101 @@
 """Web推論機能"""
 import numpy as np
-from typing import Dict, List, Tuple, Any
+from collections import Counter
+from typing import Dict, List, Tuple, Any, Optional
 import time
 from ..models.base import BaseModel
-from ..data.preprocessor import PreprocessorFactory
+from .cache import PredictionCache
+from .cascade import FirstStage
+
+
+# この文字数を超える入力は全体ではなく、一部の窓だけをサンプリングして推論する
+DEFAULT_LARGE_INPUT_CHARS = 32 * 1024
+DEFAULT_WINDOW_CHARS = 4096
+DEFAULT_MAX_WINDOWS = 8
+# 先頭・末尾の窓がこの確率以上で同じ言語と判定したら、残りの窓は推論しない
+DEFAULT_EARLY_EXIT_CONFIDENCE = 0.9
+
+
+def sample_windows(text: str, window_chars: int, n_windows: int) -> List[str]:
+    """先頭・末尾と、その間に等間隔に置いた窓（最大n_windows個）を切り出す
+
+    先頭・末尾の窓を先に返す。窓は行の途中から始まらないよう、近くの改行の直後にずらす。
+    """
+    last_start = len(text) - window_chars
+    if last_start <= 0:
+        return [text]
+    starts = [0, last_start][:max(1, n_windows)]
+    if n_windows > 2:
+        starts += [int(start) for start in np.linspace(0, last_start, n_windows)[1:-1]]
+    
+    windows = []
+    for start in starts:
+        if start > 0:
+            newline = text.find("\n", start, start + window_chars // 8)
+            if newline != -1:
+                start = newline + 1
+        windows.append(text[start:start + window_chars])
+    return windows
 
 
 class WebInference:
-    """Web用推論クラス"""
+    """Web用推論クラス
     
-    def __init__(self, model: BaseModel, preprocessor: Any):
+    large_input_charsを超える入力は、window_chars文字の窓を最大max_windows個
+    （先頭・末尾・中間）サンプリングし、1つのバッチとして推論した確率を平均する。
+    1件あたりの処理量は入力の長さによらずmax_windows * window_chars文字で頭打ちになる。
+    large_input_chars=Noneで無効（常に全体を推論）。
+    
+    first_stage（FirstStage）を渡すと、拡張子・shebang・キーワードから確信できる入力は
+    モデルを使わずに判定する。結果の"cascade"に経路（prior / model / blended）を記録する。
+    """
+    
+    def __init__(
+        self,
+        model: BaseModel,
+        preprocessor: Any,
+        single_pass: bool = True,
+        cache: Optional[PredictionCache] = None,
+        model_id: Optional[str] = None,
+        large_input_chars: Optional[int] = DEFAULT_LARGE_INPUT_CHARS,
+        window_chars: int = DEFAULT_WINDOW_CHARS,
+        max_windows: int = DEFAULT_MAX_WINDOWS,
+        early_exit_confidence: float = DEFAULT_EARLY_EXIT_CONFIDENCE,
+        first_stage: Optional[FirstStage] = None):
         self.model = model
         self.preprocessor = preprocessor
+        # Trueの場合、predict_probaを1回だけ計算し、そのargmaxを予測ラベルとする
+        # （SVCのPlatt scalingのようにargmaxとpredictが一致しないモデルではFalseにする）
+        self.single_pass = single_pass
+        # キャッシュはモデルIDがある場合のみ有効（キーにモデルIDを含めるため）
+        self.cache = cache if model_id is not None else None
+        self.model_id = model_id
+        self.large_input_chars = large_input_chars
+        self.window_chars = window_chars
+        self.max_windows = max_windows
+        self.early_exit_confidence = early_exit_confidence
+        self.first_stage = first_stage
         
-    def predict_single_text(self, text: str) -> Dict[str, Any]:
-        """単一テキストの推論"""
+    def predict_single_text(
+        self,
+        text: str,
+        top_k: int = 3,
+        return_all_probabilities: bool = True,
+        filename: Optional[str] = None) -> Dict[str, Any]:
+        """単一テキストの推論（filenameはfirst_stageで拡張子を見るために使う）"""
+        self._validate_top_k(top_k)
         start_time = time.time()
         
         try:
-            # 前処理
-            processed_text = self.preprocessor.transform([text])
-            
-            # 推論実行
-            predictions = self.model.predict(processed_text)
-            probabilities = None
-            
-            # 確率取得（可能な場合）
-            if hasattr(self.model, 'predict_proba'):
-                try:
-                    probabilities = self.model.predict_proba(processed_text)[0]
-                except:
-                    probabilities = None
-            
-            end_time = time.time()
-            
-            # 結果整形
-            result = {
-                "predicted_language": predictions[0] if len(predictions) > 0 else "Unknown",
-                "processing_time": end_time - start_time,
-                "success": True
-            }
-            
-            # 確率情報があれば追加
-            if probabilities is not None:
-                # クラス名取得
-                classes = self.model.model.classes_ if hasattr(self.model.model, 'classes_') else None
-                if classes is not None:
-                    # 上位3つの予測結果
-                    top_indices = np.argsort(probabilities)[::-1][:3]
-                    top_predictions = [
-                        {
-                            "language": classes[i],
-                            "confidence": float(probabilities[i])
-                        }
-                        for i in top_indices
-                    ]
-                    result["top_predictions"] = top_predictions
-                    result["all_probabilities"] = {
-                        classes[i]: float(probabilities[i]) 
-                        for i in range(len(classes))
-                    }
-            
+            window_info: Dict[int, Dict[str, Any]] = {}
+            cascade_info: Dict[int, Dict[str, Any]] = {}
+            label, probabilities = self._score_cascaded([text], [filename], window_info, cascade_info)[0]
+            result = self._build_result(label, probabilities, top_k, return_all_probabilities)
+            if 0 in window_info:
+                result["large_input"] = window_info[0]
+            if 0 in cascade_info:
+                result["cascade"] = cascade_info[0]
+            result["processing_time"] = time.time() - start_time
             return result
             
         except Exception as e:
@@ -69,6 +104,275 @@ class WebInference:
                 "error": str(e),
                 "processing_time": time.time() - start_time
             }
+    
+    def predict_batch(
+        self,
+        texts: List[str],
+        top_k: int = 3,
+        return_all_probabilities: bool = True,
+        filenames: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """複数テキストの一括推論
+        
+        バッチ全体を1つの疎行列にベクトル化し、1回のスコア計算で全件を推論する。
+        filenamesを渡す場合はtextsと同じ長さにする。
+        戻り値は入力と同じ順序で、各要素はpredict_single_textと同じ形式。
+        processing_timeはバッチ全体の処理時間を件数で割った値。
+        """
+        self._validate_top_k(top_k)
+        start_time = time.time()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        if filenames is None:
+            filenames = [None] * len(texts)
+        
+        # 文字列以外の入力は個別にエラーとして扱う
+        valid_indices = []
+        for i, text in enumerate(texts):
+            if isinstance(text, str):
+                valid_indices.append(i)
+            else:
+                results[i] = {
+                    "success": False,
+                    "error": f"Input must be str, got {type(text).__name__}",
+                    "processing_time": 0.0
+                }
+        
+        if valid_indices:
+            try:
+                window_info: Dict[int, Dict[str, Any]] = {}
+                cascade_info: Dict[int, Dict[str, Any]] = {}
+                scored = self._score_cascaded(
+                    [texts[i] for i in valid_indices], [filenames[i] for i in valid_indices],
+                    window_info, cascade_info
+                )
+                
+                per_item_time = (time.time() - start_time) / len(valid_indices)
+                for position, ((label, probabilities), i) in enumerate(zip(scored, valid_indices)):
+                    result = self._build_result(label, probabilities, top_k, return_all_probabilities)
+                    if position in window_info:
+                        result["large_input"] = window_info[position]
+                    if position in cascade_info:
+                        result["cascade"] = cascade_info[position]
+                    result["processing_time"] = per_item_time
+                    results[i] = result
+            except Exception:
+                # バッチ全体が失敗した場合は1件ずつ推論してエラーを切り分ける
+                for i in valid_indices:
+                    results[i] = self.predict_single_text(
+                        texts[i], top_k=top_k, return_all_probabilities=return_all_probabilities,
+                        filename=filenames[i]
+                    )
+        
+        return results
+    
+    def _score_cascaded(
+        self,
+        texts: List[str],
+        filenames: List[Optional[str]],
+        window_info: Dict[int, Dict[str, Any]],
+        cascade_info: Dict[int, Dict[str, Any]]) -> List[Tuple[Any, Optional[np.ndarray]]]:
+        """first_stageで判定できた入力は事前分布を、残りはモデルの(予測ラベル, 確率ベクトル)を返す
+        
+        cascade_info[インデックス]に経路と事前分布の確信度を記録する。
+        """
+        classes = getattr(self.model.model, 'classes_', None)
+        if self.first_stage is None or classes is None:
+            return self._score_texts(texts, window_info)
+        
+        scored: List[Optional[Tuple[Any, Optional[np.ndarray]]]] = [None] * len(texts)
+        priors: List[Optional[np.ndarray]] = [None] * len(texts)
+        prior_seconds = [0.0] * len(texts)
+        # 経路の集計はバッチ全体が成功してから記録する（失敗時は1件ずつの推論で記録される）
+        records: List[Tuple[str, float]] = []
+        model_indices = []
+        for i, (text, filename) in enumerate(zip(texts, filenames)):
+            start = time.perf_counter()
+            priors[i] = self.first_stage.distribution(text, filename, classes)
+            prior_seconds[i] = time.perf_counter() - start
+            if self.first_stage.is_confident(priors[i]):
+                scored[i] = (classes[np.argmax(priors[i])], priors[i])
+                cascade_info[i] = {"path": "prior", "prior_confidence": float(priors[i].max())}
+                records.append(("prior", prior_seconds[i]))
+            else:
+                model_indices.append(i)
+        
+        if model_indices:
+            start = time.perf_counter()
+            model_window_info: Dict[int, Dict[str, Any]] = {}
+            model_scored = self._score_texts([texts[i] for i in model_indices], model_window_info)
+            per_item_seconds = (time.perf_counter() - start) / len(model_indices)
+            for position, (i, (label, probabilities)) in enumerate(zip(model_indices, model_scored)):
+                prior = priors[i]
+                path = "model"
+                if prior is not None and probabilities is not None and self.first_stage.blend_weight > 0:
+                    probabilities = self.first_stage.blend(probabilities, prior)
+                    label = classes[np.argmax(probabilities)]
+                    path = "blended"
+                scored[i] = (label, probabilities)
+                if position in model_window_info:
+                    window_info[i] = model_window_info[position]
+                cascade_info[i] = {
+                    "path": path,
+                    "prior_confidence": float(prior.max()) if prior is not None else None
+                }
+                records.append((path, prior_seconds[i] + per_item_seconds))
+        
+        for path, seconds in records:
+            self.first_stage.record(path, seconds)
+        return scored
+    
+    def _score_texts(
+        self,
+        texts: List[str],
+        window_info: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Tuple[Any, Optional[np.ndarray]]]:
+        """テキストごとに(予測ラベル, 確率ベクトル)を返す（キャッシュ済みのものは再計算しない）
+        
+        窓のサンプリングで推論した入力は、window_info[インデックス]に窓の情報を記録する。
+        """
+        scored: List[Optional[Tuple[Any, Optional[np.ndarray]]]] = [None] * len(texts)
+        keys: List[Optional[str]] = [None] * len(texts)
+        
+        miss_indices = []
+        for i, text in enumerate(texts):
+            windowed = self.large_input_chars is not None and len(text) > self.large_input_chars
+            if self.cache is not None:
+                keys[i] = PredictionCache.make_key(self.model_id, text, self._cache_variant(windowed))
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    label, probabilities, info = cached
+                    scored[i] = (label, probabilities)
+                    if info is not None and window_info is not None:
+                        window_info[i] = info
+            if scored[i] is None:
+                if windowed:
+                    # 大きな入力は窓ごとに推論（入力ごとに1バッチ）
+                    label, probabilities, info = self._score_windows(text)
+                    scored[i] = (label, probabilities)
+                    if window_info is not None:
+                        window_info[i] = info
+                    if self.cache is not None:
+                        self.cache.put(keys[i], self.model_id, label, probabilities, info)
+                else:
+                    miss_indices.append(i)
+        
+        if miss_indices:
+            # 前処理（未キャッシュ分をまとめてベクトル化）
+            processed = self.preprocessor.transform([texts[i] for i in miss_indices])
+            for i, row_score in zip(miss_indices, self._score_matrix(processed)):
+                scored[i] = row_score
+                if self.cache is not None:
+                    self.cache.put(keys[i], self.model_id, *row_score)
+        
+        return scored
+    
+    def _cache_variant(self, windowed: bool) -> str:
+        """結果に影響する推論設定（キャッシュキーに含め、設定の異なるインスタンスと結果を共有しない）"""
+        variant = f"single_pass={self.single_pass}"
+        if windowed:
+            variant += (f";window_chars={self.window_chars};max_windows={self.max_windows}"
+                        f";early_exit={self.early_exit_confidence}")
+        return variant
+    
+    def _score_windows(self, text: str) -> Tuple[Any, Optional[np.ndarray], Dict[str, Any]]:
+        """先頭・末尾の窓を推論し、一致していなければ中間の窓も推論して確率を平均する"""
+        windows = sample_windows(text, self.window_chars, self.max_windows)
+        scored = self._score_matrix(self.preprocessor.transform(windows[:2]))
+        early_exit = len(windows) > 2 and self._windows_agree(scored)
+        if len(windows) > 2 and not early_exit:
+            scored += self._score_matrix(self.preprocessor.transform(windows[2:]))
+        
+        if all(probabilities is not None for _, probabilities in scored):
+            probabilities = np.mean([probabilities for _, probabilities in scored], axis=0)
+            label = self.model.model.classes_[np.argmax(probabilities)]
+        else:
+            # 確率が取れないモデルは窓ごとの予測の多数決
+            probabilities = None
+            label = Counter(label for label, _ in scored).most_common(1)[0][0]
+        info = {
+            "input_chars": len(text),
+            "windows": len(scored),
+            "window_chars": self.window_chars,
+            "early_exit": early_exit
+        }
+        return label, probabilities, info
+    
+    def _windows_agree(self, scored: List[Tuple[Any, Optional[np.ndarray]]]) -> bool:
+        """すべての窓が同じ言語を、early_exit_confidence以上の確率で予測しているか"""
+        labels = {label for label, _ in scored}
+        if len(labels) != 1 or any(probabilities is None for _, probabilities in scored):
+            return False
+        return all(probabilities.max() >= self.early_exit_confidence for _, probabilities in scored)
+    
+    def _score_matrix(self, processed: Any) -> List[Tuple[Any, Optional[np.ndarray]]]:
+        """ベクトル化済みの行列をスコアリングし、行ごとの(予測ラベル, 確率ベクトル)を返す"""
+        probabilities = self._predict_probabilities(processed)
+        classes = getattr(self.model.model, 'classes_', None)
+        if classes is None:
+            probabilities = None
+        
+        if probabilities is not None and self.single_pass:
+            # 確率の計算1回で予測ラベルも決める
+            predictions = classes[np.argmax(probabilities, axis=1)]
+        else:
+            predictions = self.model.predict(processed)
+        
+        return [
+            (predicted_language, probabilities[row] if probabilities is not None else None)
+            for row, predicted_language in enumerate(predictions)
+        ]
+    
+    def _build_result(
+        self,
+        predicted_language: Any,
+        probabilities: Optional[np.ndarray],
+        top_k: int,
+        return_all_probabilities: bool) -> Dict[str, Any]:
+        """推論結果を整形"""
+        result = {
+            "predicted_language": predicted_language,
+            "success": True
+        }
+        
+        # 確率情報があれば追加
+        if probabilities is not None:
+            classes = self.model.model.classes_
+            top_indices = self._top_k_indices(probabilities, top_k)
+            # 確率0の言語は含めない（前段の事前分布は根拠のある言語以外0になる）
+            result["top_predictions"] = [
+                {
+                    "language": classes[i],
+                    "confidence": float(probabilities[i])
+                }
+                for i in top_indices
+                if probabilities[i] > 0
+            ]
+            if return_all_probabilities:
+                result["all_probabilities"] = dict(zip(classes.tolist(), probabilities.tolist()))
+        
+        return result
+    
+    def _predict_probabilities(self, processed: Any) -> Optional[np.ndarray]:
+        """確率取得（可能な場合）"""
+        if not hasattr(self.model, 'predict_proba'):
+            return None
+        try:
+            return self.model.predict_proba(processed)
+        except:
+            return None
+    
+    @staticmethod
+    def _validate_top_k(top_k: int) -> None:
+        # 0以下だと全件がエラーになるため、入力の時点で弾く
+        if isinstance(top_k, bool) or not isinstance(top_k, (int, np.integer)) or top_k < 1:
+            raise ValueError(f"top_k must be a positive integer, got {top_k!r}")
+    
+    @staticmethod
+    def _top_k_indices(probabilities: np.ndarray, top_k: int) -> np.ndarray:
+        """確率の上位k件のインデックスを降順で返す（部分選択）"""
+        n_classes = len(probabilities)
+        if top_k >= n_classes:
+            return np.argsort(probabilities)[::-1]
+        top_indices = np.argpartition(probabilities, n_classes - top_k)[n_classes - top_k:]
+        return top_indices[np.argsort(probabilities[top_indices])[::-1]]
 
 
 def validate_file_extension(filename: str) -> bool:
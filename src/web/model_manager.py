@@ -1,122 +1,466 @@
 """モデル管理機能"""
+import copy
 import json
-import joblib
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Tuple
 import numpy as np
 
 from ..models.classifier import LogisticRegressionModel
-from ..data.preprocessor import PreprocessorFactory
-from ..data.loader import DataLoaderFactory
+from ..models.artifact import is_compact_artifact, load_compact_artifact
+from ..utils.memory import estimate_resident_bytes
+from .cache import PredictionCache
+
+
+# 読み込み済みモデルのキャッシュ上限（推定常駐バイト数）
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# 前処理器の再構築に使う訓練データの設定（モデル訓練時と同じ）
+REBUILD_MIN_SAMPLES_PER_CLASS = 200
+
+
+class PreprocessorRebuildJob:
+    """旧形式モデル用の前処理器をバックグラウンドで再構築するジョブ"""
+    
+    def __init__(self, model_id: str, target: Callable[["PreprocessorRebuildJob"], Any]):
+        self.model_id = model_id
+        self.stage = "queued"
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.preprocessor: Any = None
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, args=(target,), name=f"rebuild-{model_id}", daemon=True
+        )
+    
+    def start(self) -> "PreprocessorRebuildJob":
+        self._thread.start()
+        return self
+    
+    def _run(self, target: Callable[["PreprocessorRebuildJob"], Any]) -> None:
+        try:
+            self.preprocessor = target(self)
+            self.report("done", 1.0)
+        except Exception as e:
+            self.error = str(e)
+            self.stage = "error"
+    
+    def report(self, stage: str, progress: float) -> None:
+        """進捗を更新"""
+        self.stage = stage
+        self.progress = progress
+    
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+    
+    def is_done(self) -> bool:
+        return not self._thread.is_alive()
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "model_id": self.model_id,
+            "stage": self.stage,
+            "progress": self.progress,
+            "error": self.error,
+            "elapsed_seconds": time.time() - self.started_at
+        }
+
+
+class ModelNotReadyError(RuntimeError):
+    """前処理器の再構築中でまだモデルを使えない（statusに進捗）"""
+    
+    def __init__(self, model_id: str, job: PreprocessorRebuildJob):
+        super().__init__(f"Model {model_id} is not ready: rebuilding preprocessor ({job.stage})")
+        self.model_id = model_id
+        self.job = job
+    
+    @property
+    def status(self) -> Dict[str, Any]:
+        return self.job.status()
 
 
 class ModelManager:
-    """モデルとその前処理器を管理するクラス"""
+    """モデルとその前処理器を管理するクラス
+    
+    model_info.jsonは更新時刻が変わったときだけ読み直し、IDで引ける索引として保持する。
+    読み込んだモデルは推定常駐バイト数の合計がmax_cache_bytes以下になるようLRUで追い出す
+    （1つで上限を超えるモデルも、直近に使ったものとして1つは保持する）。
+    旧形式（モデルのみ）の前処理器は一度だけバックグラウンドで再構築し、
+    (モデルID, 訓練データのfingerprint)ごとにディスクへ保存して以降は再利用する。
+    """
     
-    def __init__(self, model_info_path: str = "models_registry/model_info.json"):
+    def __init__(self, 
+                 model_info_path: str = "models_registry/model_info.json",
+                 prediction_cache: Optional[PredictionCache] = None,
+                 max_cache_bytes: int = DEFAULT_MAX_CACHE_BYTES):
         self.model_info_path = model_info_path
-        self.loaded_models = {}
+        # 読み込み済みモデル（古い順。先頭から追い出す）
+        self.loaded_models: "OrderedDict[str, Any]" = OrderedDict()
         self.loaded_preprocessors = {}
+        self.model_sizes: Dict[str, int] = {}
+        self.max_cache_bytes = max_cache_bytes
+        self.cached_bytes = 0
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        # 推論結果キャッシュ（モデルファイルが差し替えられたら該当モデル分を無効化）
+        self.prediction_cache = prediction_cache
+        self.model_file_paths = {}
+        self.model_signatures = {}
+        # model_info.jsonの索引
+        self._registry: Optional[Dict[str, Any]] = None
+        self._registry_index: Dict[str, Dict[str, Any]] = {}
+        self._registry_signature: Optional[Tuple[int, int]] = None
+        # バックグラウンドのウォームアップと画面側から同時に呼ばれるため、モデルごとに読み込みを直列化
+        self._model_locks: Dict[str, threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+        # キャッシュ・索引の更新用
+        self._cache_lock = threading.RLock()
+        # 再構築（学習データの読み込みを含む）は同時に1つだけ
+        self._rebuild_lock = threading.Lock()
+        # 実行中の前処理器再構築ジョブ
+        self._rebuild_jobs: Dict[str, PreprocessorRebuildJob] = {}
+        self.preprocessor_dir = Path(model_info_path).parent / "preprocessors"
     
     def load_model_info(self) -> Dict[str, Any]:
-        """モデル情報を読み込み"""
+        """モデル情報を読み込み（呼び出し側で変更できるようコピーを返す）"""
+        with self._cache_lock:
+            self._refresh_registry()
+            return copy.deepcopy(self._registry)
+    
+    def get_default_model_id(self) -> Optional[str]:
+        """既定のモデルID"""
+        with self._cache_lock:
+            self._refresh_registry()
+            return self._registry.get("default_model_id")
+    
+    def get_model_data(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """IDに対応するモデル情報（登録されていなければNone）"""
+        with self._cache_lock:
+            self._refresh_registry()
+            model_data = self._registry_index.get(model_id)
+            return dict(model_data) if model_data is not None else None
+    
+    def _refresh_registry(self) -> None:
+        """model_info.jsonの更新時刻・サイズが変わっていれば読み直して索引を作る"""
+        stat = Path(self.model_info_path).stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._registry_signature:
+            return
         with open(self.model_info_path, "r") as f:
-            return json.load(f)
+            registry = json.load(f)
+        self._registry = registry
+        self._registry_index = {model["id"]: model for model in registry["models"]}
+        self._registry_signature = signature
     
-    def get_model_and_preprocessor(self, model_id: str) -> tuple:
-        """モデルと対応する前処理器を取得"""
-        if model_id in self.loaded_models:
-            return self.loaded_models[model_id], self.loaded_preprocessors[model_id]
+    def _lock_for(self, model_id: str) -> threading.RLock:
+        with self._locks_guard:
+            if model_id not in self._model_locks:
+                self._model_locks[model_id] = threading.RLock()
+            return self._model_locks[model_id]
+    
+    def is_loaded(self, model_id: str) -> bool:
+        """モデルが読み込み済み（キャッシュ済み）か"""
+        return model_id in self.loaded_models
+    
+    def is_cache_full(self) -> bool:
+        """キャッシュが上限に達しているか"""
+        return self.cached_bytes >= self.max_cache_bytes
+    
+    def get_model_and_preprocessor(self, model_id: str, wait: bool = False) -> tuple:
+        """モデルと対応する前処理器を取得（スレッドセーフ）
         
-        model_info = self.load_model_info()
-        model_data = next(
-            (model for model in model_info["models"] if model["id"] == model_id), 
-            None
-        )
+        前処理器の再構築が必要な場合はバックグラウンドで開始し、wait=Falseなら
+        ModelNotReadyErrorを送出する（wait=Trueなら完了を待つ）。
+        """
+        while True:
+            try:
+                with self._lock_for(model_id):
+                    cached = self._get_cached(model_id)
+                    if cached is not None:
+                        return cached
+                    start = time.perf_counter()
+                    model, preprocessor = self._load_model_and_preprocessor(model_id)
+                    self._add_to_cache(model_id, model, preprocessor, time.perf_counter() - start)
+                    return model, preprocessor
+            except ModelNotReadyError as e:
+                if not wait:
+                    raise
+                # ロックを持たずに待つ（他のスレッドは進捗を確認できる）
+                e.job.join()
+    
+    def get_rebuild_status(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """前処理器の再構築ジョブの進捗（ジョブがなければNone。完了・失敗したジョブは次の読み込みで片付ける）"""
+        with self._cache_lock:
+            job = self._rebuild_jobs.get(model_id)
+        return job.status() if job is not None else None
+    
+    def _get_cached(self, model_id: str) -> Optional[tuple]:
+        """キャッシュ済みで、ファイルが差し替えられていなければ(モデル, 前処理器)を返す"""
+        with self._cache_lock:
+            if model_id not in self.loaded_models:
+                return None
+            # レジストリが同じIDで別のファイルを指すようになった場合は、古いモデルの推論結果も捨てる
+            self._refresh_registry()
+            model_data = self._registry_index.get(model_id)
+            if model_data is None or model_data["file_path"] != self.model_file_paths[model_id]:
+                self._remove_from_cache(model_id)
+                if self.prediction_cache is not None:
+                    self.prediction_cache.invalidate(model_id)
+                return None
+            # 同じファイルのまま上書きされていなければキャッシュを返す
+            signature = self._file_signature(self.model_file_paths[model_id])
+            if signature != self.model_signatures.get(model_id):
+                self._remove_from_cache(model_id)
+                return None
+            self.loaded_models.move_to_end(model_id)
+            self.hits += 1
+            return self.loaded_models[model_id], self.loaded_preprocessors[model_id]
+    
+    def _add_to_cache(self, model_id: str, model: Any, preprocessor: Any, load_seconds: float) -> None:
+        """キャッシュに登録し、上限を超えた分を使われていない順に追い出す"""
+        size = estimate_resident_bytes((model, preprocessor))
+        with self._cache_lock:
+            self.loads += 1
+            self.load_seconds += load_seconds
+            self.loaded_models[model_id] = model
+            self.loaded_preprocessors[model_id] = preprocessor
+            self.model_sizes[model_id] = size
+            self.cached_bytes += size
+            while self.cached_bytes > self.max_cache_bytes and len(self.loaded_models) > 1:
+                oldest = next(iter(self.loaded_models))
+                self._remove_from_cache(oldest)
+                self.evictions += 1
+                print(f"♻️ モデルをキャッシュから追い出しました: {oldest}")
+    
+    def _remove_from_cache(self, model_id: str) -> None:
+        del self.loaded_models[model_id]
+        del self.loaded_preprocessors[model_id]
+        self.cached_bytes -= self.model_sizes.pop(model_id)
+    
+    def unload_model(self, model_id: str) -> None:
+        """モデルをキャッシュから外す（削除されたモデルなど）"""
+        with self._cache_lock:
+            if model_id in self.loaded_models:
+                self._remove_from_cache(model_id)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """モデルキャッシュの統計"""
+        with self._cache_lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "load_seconds_total": self.load_seconds,
+                "cached_models": list(self.loaded_models),
+                "cached_bytes": self.cached_bytes,
+                "max_cache_bytes": self.max_cache_bytes
+            }
+    
+    def _load_model_and_preprocessor(self, model_id: str) -> tuple:
+        """モデルファイルから(モデル, 前処理器)を読み込む"""
+        model_data = self.get_model_data(model_id)
         
         if not model_data:
             raise ValueError(f"Model {model_id} not found")
         
+        # 旧形式の前処理器を再構築中なら、モデル本体を読み込まずに待たせる（完了までは使えないため）
+        with self._cache_lock:
+            job = self._rebuild_jobs.get(model_id)
+        if job is not None and not job.is_done():
+            raise ModelNotReadyError(model_id, job)
+        
         # モデルファイルが存在しない場合は再構築
         if not Path(model_data["file_path"]).exists():
             self._ensure_model_exists()
         
         # 新しい形式でモデル読み込み（モデル＋ベクトライザー）
+        preprocessor = None
         try:
-            model_container = joblib.load(model_data["file_path"])
-            if isinstance(model_container, dict):
-                # 新形式: モデルとベクトライザーが一緒に保存されている
-                sklearn_model = model_container['model']
-                vectorizer = model_container['vectorizer']
-                
-                # LogisticRegressionModelでラップ
-                model = LogisticRegressionModel()
-                model.model = sklearn_model
-                model.is_fitted = True
+            if is_compact_artifact(model_data["file_path"]):
+                # コンパクト形式: 係数・語彙をメモリマップで読み込み
+                classifier, preprocessor = load_compact_artifact(model_data["file_path"])
+                model = LogisticRegressionModel.from_fitted(classifier)
+            
+            else:
+                import joblib
+                model_container = joblib.load(model_data["file_path"])
+                if isinstance(model_container, dict):
+                    # 新形式: モデルとベクトライザーが一緒に保存されている
+                    sklearn_model = model_container['model']
+                    vectorizer = model_container['vectorizer']
                 
-                # ベクトライザーを前処理器として使用
-                preprocessor = vectorizer
+                    # LogisticRegressionModelでラップ
+                    model = LogisticRegressionModel.from_fitted(sklearn_model)
                 
-            else:
-                # 旧形式: モデルのみ
-                model = LogisticRegressionModel()
-                model.model = model_container
-                model.is_fitted = True
+                    # ベクトライザーを前処理器として使用
+                    preprocessor = vectorizer
+                    if getattr(preprocessor, "n_jobs", 1) != 1:
+                        # 並列数付きで保存された旧モデル: サーバー内でプロセスプールを起動しない
+                        preprocessor.n_jobs = 1
                 
-                # 前処理器を再構築
-                preprocessor = self._rebuild_preprocessor(model_data)
+                else:
+                    # 旧形式: モデルのみ
+                    model = LogisticRegressionModel.from_fitted(model_container)
         
         except Exception as e:
             # 読み込み失敗時は再構築
             print(f"モデル読み込み失敗、再構築します: {e}")
             self._ensure_model_exists()
-            return self.get_model_and_preprocessor(model_id)
+            return self._load_model_and_preprocessor(model_id)
+        
+        if preprocessor is None:
+            # 旧形式: 保存済みの前処理器を使い、なければ再構築する
+            preprocessor = self._get_rebuilt_preprocessor(model_id)
         
-        # キャッシュ
-        self.loaded_models[model_id] = model
-        self.loaded_preprocessors[model_id] = preprocessor
+        self._register_model_file(model_id, model_data["file_path"])
         
         return model, preprocessor
     
+    def _register_model_file(self, model_id: str, file_path: str) -> None:
+        """読み込んだモデルファイルを記録し、以前と異なるファイルなら推論結果キャッシュを無効化"""
+        signature = self._file_signature(file_path)
+        with self._cache_lock:
+            previous = self.model_signatures.get(model_id)
+            if previous is not None and previous != signature and self.prediction_cache is not None:
+                self.prediction_cache.invalidate(model_id)
+            self.model_file_paths[model_id] = file_path
+            self.model_signatures[model_id] = signature
+    
+    @staticmethod
+    def _file_signature(file_path: str) -> Optional[Tuple[str, int, int]]:
+        """ファイルの同一性判定用シグネチャ（パス・更新時刻・サイズ）"""
+        path = Path(file_path)
+        if path.is_dir():
+            # コンパクト形式はヘッダー（保存時に最後に書かれる）で判定
+            path = path / "header.json"
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (str(Path(file_path).resolve()), stat.st_mtime_ns, stat.st_size)
+    
     def _ensure_model_exists(self):
         """モデルファイルが存在しない場合は再構築"""
         try:
             from models_registry.download_models import ensure_model_exists
-            ensure_model_exists()
+            with self._rebuild_lock:
+                ensure_model_exists()
         except Exception as e:
             print(f"モデル再構築エラー: {e}")
             raise RuntimeError("モデルの準備に失敗しました")
     
-    def _rebuild_preprocessor(self, model_data: Dict[str, Any]) -> Any:
-        """訓練データから前処理器を再構築"""
+    def _training_data_fingerprint(self) -> Optional[str]:
+        """前処理器の再構築に使う訓練データのfingerprint（ローカルにキャッシュがなければNone）"""
+        from ..data.loader import DataLoaderFactory
+        
+        data_loader = DataLoaderFactory.create_loader(
+            "programming_language", min_samples_per_class=REBUILD_MIN_SAMPLES_PER_CLASS
+        )
+        return data_loader.cached_fingerprint()
+    
+    def _get_rebuilt_preprocessor(self, model_id: str) -> Any:
+        """保存済みの前処理器を返す。なければ再構築ジョブを開始してModelNotReadyErrorを送出"""
+        preprocessor = self.load_preprocessor(model_id, self._training_data_fingerprint())
+        if preprocessor is not None:
+            with self._cache_lock:
+                job = self._rebuild_jobs.get(model_id)
+                if job is not None and job.is_done():
+                    del self._rebuild_jobs[model_id]
+            return preprocessor
+        
+        with self._cache_lock:
+            job = self._rebuild_jobs.get(model_id)
+            if job is None:
+                print(f"🔧 前処理器の再構築を開始します: {model_id}")
+                job = PreprocessorRebuildJob(
+                    model_id, lambda job: self._rebuild_and_save_preprocessor(model_id, job)
+                ).start()
+                self._rebuild_jobs[model_id] = job
+        
+        if not job.is_done():
+            raise ModelNotReadyError(model_id, job)
+        # 完了したジョブは片付ける（失敗していれば次回の呼び出しで再実行）
+        with self._cache_lock:
+            self._rebuild_jobs.pop(model_id, None)
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return job.preprocessor
+    
+    def _rebuild_and_save_preprocessor(self, model_id: str, job: PreprocessorRebuildJob) -> Any:
+        """前処理器を再構築してディスクに保存（再構築ジョブのスレッドで実行）"""
+        preprocessor, fingerprint = self._rebuild_preprocessor(report=job.report)
+        job.report("saving", 0.9)
         try:
-            # データローダーで訓練データを取得
-            data_loader = DataLoaderFactory.create_loader(
-                "programming_language", 
-                min_samples_per_class=200  # モデル訓練時と同じ設定
-            )
-            y_train, X_train, _, _ = data_loader.load()
-            
-            # 前処理器を作成し、訓練データで学習
-            preprocessor = PreprocessorFactory.create_preprocessor(
-                "programming_language", 
-                normalize=False
-            )
-            preprocessor.fit(X_train)
+            path = self.save_preprocessor(model_id, preprocessor, fingerprint)
+            print(f"💾 前処理器を保存しました: {path}")
+        except OSError as e:
+            print(f"⚠️ 前処理器の保存に失敗しました: {e}")
+        return preprocessor
+    
+    def _rebuild_preprocessor(self, report: Optional[Callable[[str, float], None]] = None) -> Tuple[Any, Optional[str]]:
+        """訓練データから前処理器を再構築（(前処理器, 訓練データのfingerprint)を返す）"""
+        # データセット関連（datasetsなど）は再構築時だけ読み込む
+        from ..data.loader import DataLoaderFactory
+        from ..data.preprocessor import PreprocessorFactory
+        
+        report = report or (lambda stage, progress: None)
+        try:
+            with self._rebuild_lock:
+                # データローダーで訓練データを取得
+                report("loading_data", 0.1)
+                data_loader = DataLoaderFactory.create_loader(
+                    "programming_language", 
+                    min_samples_per_class=REBUILD_MIN_SAMPLES_PER_CLASS  # モデル訓練時と同じ設定
+                )
+                y_train, X_train, _, _ = data_loader.load()
+                
+                # 前処理器を作成し、訓練データで学習
+                report("fitting", 0.5)
+                preprocessor = PreprocessorFactory.create_preprocessor(
+                    "programming_language", 
+                    normalize=False
+                )
+                preprocessor.fit(X_train)
             
-            return preprocessor
+            return preprocessor, data_loader.fingerprint
             
         except Exception as e:
             raise RuntimeError(f"Failed to rebuild preprocessor: {e}")
     
-    def save_preprocessor(self, model_id: str, preprocessor: Any) -> None:
-        """前処理器を保存（将来の改善用）"""
-        preprocessor_path = f"models_registry/{model_id}_preprocessor.joblib"
-        joblib.dump(preprocessor, preprocessor_path)
-    
-    def load_preprocessor(self, model_id: str) -> Optional[Any]:
-        """保存済み前処理器を読み込み（将来の改善用）"""
-        preprocessor_path = f"models_registry/{model_id}_preprocessor.joblib"
-        if Path(preprocessor_path).exists():
-            return joblib.load(preprocessor_path)
-        return None
+    def _preprocessor_path(self, model_id: str, fingerprint: str) -> Path:
+        return self.preprocessor_dir / f"{model_id}_{fingerprint}.joblib"
+    
+    def save_preprocessor(self, model_id: str, preprocessor: Any, fingerprint: Optional[str]) -> Path:
+        """前処理器を(モデルID, 訓練データのfingerprint)ごとに保存"""
+        import joblib
+        self.preprocessor_dir.mkdir(parents=True, exist_ok=True)
+        path = self._preprocessor_path(model_id, fingerprint or "unknown")
+        # 書き込み完了後に入れ替える（読み込み中の他プロセスに壊れたファイルを見せない）
+        tmp_path = path.with_name(path.name + ".tmp")
+        joblib.dump(preprocessor, tmp_path)
+        tmp_path.replace(path)
+        return path
+    
+    def load_preprocessor(self, model_id: str, fingerprint: Optional[str] = None) -> Optional[Any]:
+        """保存済み前処理器を読み込み（なければNone）
+        
+        fingerprintが分からない場合（訓練データがローカルにない場合）は、そのモデルで最後に保存したものを使う。
+        """
+        if fingerprint is not None:
+            path = self._preprocessor_path(model_id, fingerprint)
+            candidates = [path] if path.exists() else []
+        else:
+            # fingerprintに"_"は含まれない（"a"と"a_b"のようなIDを取り違えない）
+            candidates = sorted(
+                (path for path in self.preprocessor_dir.glob(f"{model_id}_*.joblib")
+                 if "_" not in path.stem[len(model_id) + 1:]),
+                key=lambda path: path.stat().st_mtime
+            )
+        if not candidates:
+            return None
+        import joblib
+        return joblib.load(candidates[-1])
@@ -0,0 +1,452 @@
+"""
+推論HTTPサービス（asyncio、標準ライブラリのみ）
+同時に届いたリクエストをモデルごとにマイクロバッチにまとめ、1回のベクトル化・推論で処理する
+
+使い方:
+    python -m src.web.server --port 8000 --max-batch-size 32 --max-wait-ms 5
+    python -m src.web.server --port 8000 --workers 4   # 推論をforkしたワーカープールで並列化
+
+エンドポイント:
+    POST /predict  {"text": "...", "model_id": "lr_baseline_001", "top_k": 3, "return_all_probabilities": false}
+    GET  /health   サービスと読み込み済みモデルの状態
+    GET  /stats    モデルごとのリクエスト数・バッチサイズ・レイテンシ・キャッシュ統計
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import PredictionCache
+from .inference import WebInference
+from .model_manager import ModelManager, ModelNotReadyError
+from .worker_pool import InferenceWorkerPool
+
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_QUEUE_SIZE = 1024
+
+# リクエストボディの上限（validate_file_sizeの10MBにJSONのオーバーヘッドを足した値）
+MAX_BODY_BYTES = 11 * 1024 * 1024
+
+# レイテンシ統計に使う直近のリクエスト数
+LATENCY_WINDOW = 2048
+
+# バッチを推論する関数（texts, top_k, return_all_probabilities）-> predict_batchと同じ形式の結果
+ScoreFn = Callable[[List[str], int, bool], Awaitable[List[Dict[str, Any]]]]
+
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"
+}
+
+
+class HTTPError(Exception):
+    """ステータスコード付きのエラー（そのままJSONのエラーレスポンスにする）"""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class MicroBatcher:
+    """1モデル分のリクエストキューと、それをバッチにまとめて推論するワーカー
+
+    最初のリクエストが届いてから最大max_wait_ms待つか、max_batch_size件集まった時点で
+    バッチを確定し、score（1回のベクトル化と推論）に渡す。同時に処理するバッチは
+    max_in_flight個までで、処理中に届いたリクエストは次のバッチにまとめる。
+    キューがmax_queue_sizeを超えた場合はsubmitがQueueFullを送出する。
+    """
+
+    def __init__(self, model_id: str, score: ScoreFn, max_batch_size: int,
+                 max_wait_ms: float, max_queue_size: int, max_in_flight: int = 1):
+        self.model_id = model_id
+        self.score = score
+        self.max_in_flight = max_in_flight
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: "asyncio.Queue[Tuple[str, int, bool, asyncio.Future]]" = asyncio.Queue(max_queue_size)
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.batch_seconds = 0.0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, text: str, top_k: int, return_all_probabilities: bool) -> "asyncio.Future":
+        """リクエストをキューに入れ、結果のFutureを返す"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((text, top_k, return_all_probabilities, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.requests += 1
+        return future
+
+    async def _collect(self) -> List[Tuple[str, int, bool, asyncio.Future]]:
+        """最初の1件を待ち、その後max_wait以内に届いた分をmax_batch_sizeまでまとめる"""
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 待たずに取れる分は先に取る
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - time.perf_counter()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            batch = await self._collect()
+            task = asyncio.get_running_loop().create_task(self._score_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _score_batch(self, batch: List[Tuple[str, int, bool, asyncio.Future]]) -> None:
+        texts = [text for text, _, _, _ in batch]
+        top_k = max(item[1] for item in batch)
+        return_all = any(item[2] for item in batch)
+        start = time.perf_counter()
+        try:
+            results = await self.score(texts, top_k, return_all)
+        except Exception as e:
+            results = [{"success": False, "error": str(e)}] * len(batch)
+        finally:
+            self._slots.release()
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.batched_requests += len(batch)
+        self.batch_seconds += elapsed
+
+        for (_, request_top_k, request_all, future), result in zip(batch, results):
+            if future.done():
+                # クライアントが切断済み
+                continue
+            result = dict(result)
+            if "top_predictions" in result:
+                result["top_predictions"] = result["top_predictions"][:request_top_k]
+            if not request_all:
+                result.pop("all_probabilities", None)
+            result["batch_size"] = len(batch)
+            future.set_result(result)
+
+    def record_latency(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "mean_batch_ms": self.batch_seconds / self.batches * 1000 if self.batches else 0.0,
+            "queue_depth": self.queue.qsize()
+        }
+        if self.latencies:
+            ms = np.asarray(self.latencies) * 1000
+            stats["latency_ms"] = {
+                "p50": float(np.percentile(ms, 50)),
+                "p95": float(np.percentile(ms, 95)),
+                "p99": float(np.percentile(ms, 99))
+            }
+        return stats
+
+    def close(self) -> None:
+        self._task.cancel()
+        for task in self._batch_tasks:
+            task.cancel()
+
+
+class InferenceServer:
+    """ModelManagerとWebInferenceを使う推論HTTPサービス
+
+    worker_poolを渡すと、プールに読み込まれたモデルのバッチはワーカープロセスで推論する
+    （ワーカー数までのバッチを並列に処理する）。それ以外のモデルはこのプロセスのスレッドで推論し、
+    バッチごとにModelManagerから取得する（ファイルの差し替えやキャッシュからの追い出しが反映される）。
+    """
+
+    def __init__(self, model_manager: ModelManager,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                 prediction_cache: Optional[PredictionCache] = None,
+                 worker_pool: Optional[InferenceWorkerPool] = None):
+        self.model_manager = model_manager
+        self.worker_pool = worker_pool
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.prediction_cache = prediction_cache
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.started_at = time.time()
+        self._batcher_locks: Dict[str, asyncio.Lock] = {}
+
+    async def get_batcher(self, model_id: str) -> MicroBatcher:
+        """モデルのバッチャーを取得（初回はモデルをスレッドで読み込む）"""
+        if model_id in self.batchers:
+            return self.batchers[model_id]
+        # 登録されていないIDのロックは作らない（クライアントの送るIDでロックが増え続けないように）
+        if self.model_manager.get_model_data(model_id) is None:
+            raise HTTPError(404, f"Model {model_id} not found")
+        lock = self._batcher_locks.setdefault(model_id, asyncio.Lock())
+        async with lock:
+            if model_id in self.batchers:
+                return self.batchers[model_id]
+            if self.worker_pool is not None and model_id in self.worker_pool.model_ids:
+                pool = self.worker_pool
+
+                async def score(texts: List[str], top_k: int, return_all: bool) -> List[Dict[str, Any]]:
+                    return await asyncio.wrap_future(pool.submit(model_id, texts, top_k, return_all))
+
+                self.batchers[model_id] = MicroBatcher(
+                    model_id, score, self.max_batch_size, self.max_wait_ms, self.max_queue_size,
+                    max_in_flight=pool.n_workers
+                )
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(None, self.model_manager.get_model_and_preprocessor, model_id)
+                except ModelNotReadyError as e:
+                    raise HTTPError(503, str(e), {"Retry-After": "30"})
+                except ValueError as e:
+                    raise HTTPError(404, str(e))
+
+                def predict_batch(texts: List[str], top_k: int, return_all: bool) -> List[Dict[str, Any]]:
+                    # バッチごとにModelManagerから取得する（ファイルの差し替え・キャッシュからの追い出しに従う）
+                    model, preprocessor = self.model_manager.get_model_and_preprocessor(model_id)
+                    inference = WebInference(model, preprocessor, cache=self.prediction_cache, model_id=model_id)
+                    return inference.predict_batch(texts, top_k=top_k, return_all_probabilities=return_all)
+
+                async def score(texts: List[str], top_k: int, return_all: bool) -> List[Dict[str, Any]]:
+                    return await loop.run_in_executor(None, predict_batch, texts, top_k, return_all)
+
+                self.batchers[model_id] = MicroBatcher(
+                    model_id, score, self.max_batch_size, self.max_wait_ms, self.max_queue_size
+                )
+        return self.batchers[model_id]
+
+    async def predict(self, payload: Any) -> Dict[str, Any]:
+        if not isinstance(payload, dict) or not isinstance(payload.get("text"), str):
+            raise HTTPError(400, 'Request body must be a JSON object with a string "text" field')
+        model_id = payload.get("model_id")
+        if model_id is not None and not isinstance(model_id, str):
+            raise HTTPError(400, "model_id must be a string")
+        model_id = model_id or self.model_manager.get_default_model_id()
+        if not model_id:
+            raise HTTPError(400, "model_id is required (the registry has no default_model_id)")
+        top_k = payload.get("top_k", 3)
+        if not isinstance(top_k, int) or top_k < 1:
+            raise HTTPError(400, "top_k must be a positive integer")
+
+        start = time.perf_counter()
+        batcher = await self.get_batcher(model_id)
+        try:
+            future = batcher.submit(payload["text"], top_k, bool(payload.get("return_all_probabilities", False)))
+        except asyncio.QueueFull:
+            raise HTTPError(503, f"Queue for model {model_id} is full", {"Retry-After": "1"})
+        result = await future
+        batcher.record_latency(time.perf_counter() - start)
+        result["model_id"] = model_id
+        return result
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_seconds": time.time() - self.started_at,
+            "models": sorted(self.batchers)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "config": {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_queue_size": self.max_queue_size
+            },
+            "models": {model_id: batcher.stats() for model_id, batcher in self.batchers.items()},
+            "model_cache": self.model_manager.get_cache_stats()
+        }
+        if self.prediction_cache is not None:
+            stats["prediction_cache"] = self.prediction_cache.stats()
+        if self.worker_pool is not None:
+            stats["worker_pool"] = {**self.worker_pool.stats(), "memory": self.worker_pool.memory_stats()}
+        return stats
+
+    async def route(self, method: str, path: str, body: bytes) -> Dict[str, Any]:
+        path = path.split("?", 1)[0]
+        if path == "/predict":
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError:
+                raise HTTPError(400, "Invalid JSON")
+            return await self.predict(payload)
+        if path in ("/health", "/stats"):
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return self.health() if path == "/health" else self.stats()
+        raise HTTPError(404, f"Unknown path: {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """1接続分のリクエストを処理（HTTP/1.1のkeep-alive対応）"""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                extra_headers: Dict[str, str] = {}
+                try:
+                    status, response = 200, await self.route(method, path, body)
+                except HTTPError as e:
+                    status, response, extra_headers = e.status, {"success": False, "error": e.message}, e.headers
+                except Exception as e:
+                    status, response = 500, {"success": False, "error": str(e)}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _write_response(writer, status, response, keep_alive, extra_headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            _write_response(writer, e.status, {"success": False, "error": e.message}, False, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """HTTPリクエストを1件読む（接続が閉じられていればNone）"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                    keep_alive: bool, extra_headers: Dict[str, str]) -> None:
+    body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **extra_headers
+    }
+    head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n" + "".join(
+        f"{name}: {value}\r\n" for name, value in headers.items()
+    ) + "\r\n"
+    writer.write(head.encode("latin-1") + body)
+
+
+def _json_default(value: Any) -> Any:
+    # ラベルがnumpyの型の場合
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def serve(server: InferenceServer, host: str, port: int, preload: List[str]) -> None:
+    loop = asyncio.get_running_loop()
+    for model_id in preload:
+        # 起動時は前処理器の再構築が必要でも完了を待つ
+        await loop.run_in_executor(
+            None, lambda: server.model_manager.get_model_and_preprocessor(model_id, wait=True)
+        )
+        await server.get_batcher(model_id)
+        print(f"✅ モデルを読み込みました: {model_id}")
+    tcp_server = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"🚀 推論サービスを起動しました: http://{host}:{port} "
+          f"(max_batch_size={server.max_batch_size}, max_wait_ms={server.max_wait_ms})")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference HTTP service with micro-batching")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--registry', default='models_registry/model_info.json')
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help='最初のリクエストからバッチを確定するまでの最大待ち時間')
+    parser.add_argument('--max-queue-size', type=int, default=DEFAULT_MAX_QUEUE_SIZE,
+                        help='モデルごとの待ち行列の上限（超えたら503）')
+    parser.add_argument('--cache-entries', type=int, default=0, help='推論結果キャッシュのエントリ数（0で無効）')
+    parser.add_argument('--preload', nargs='*', default=None,
+                        help='起動時に読み込むモデルID（省略時はデフォルトモデル）')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='推論ワーカープロセス数（0でこのプロセス内で推論。preloadしたモデルが対象）')
+    args = parser.parse_args()
+
+    model_manager = ModelManager(args.registry)
+    preload = args.preload
+    if preload is None:
+        default_model_id = model_manager.get_default_model_id()
+        preload = [default_model_id] if default_model_id else []
+
+    worker_pool = None
+    if args.workers > 0:
+        # イベントループやスレッドを作る前にforkする
+        worker_pool = InferenceWorkerPool(model_manager, preload, n_workers=args.workers).start()
+        print(f"👷 推論ワーカーを{args.workers}個起動しました")
+    # ワーカーは親プロセスのキャッシュを共有できないため、プール使用時は推論結果キャッシュを使わない
+    cache = PredictionCache(max_entries=args.cache_entries) if args.cache_entries > 0 and worker_pool is None else None
+    server = InferenceServer(model_manager, args.max_batch_size, args.max_wait_ms,
+                             args.max_queue_size, cache, worker_pool)
+    try:
+        asyncio.run(serve(server, args.host, args.port, preload))
+    except KeyboardInterrupt:
+        print("👋 推論サービスを停止しました")
+    finally:
+        if worker_pool is not None:
+            worker_pool.close()
+
+
+if __name__ == "__main__":
+    main()
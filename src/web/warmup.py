@@ -0,0 +1,149 @@
+"""起動時のモデル先読み・ウォームアップ"""
+import threading
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .inference import WebInference
+from .model_manager import ModelManager
+
+
+# モデルの状態
+PENDING = "pending"
+LOADING = "loading"
+WARMING = "warming"
+READY = "ready"
+ERROR = "error"
+# モデルキャッシュが上限に達したため先読みしなかった（使うときに読み込む）
+SKIPPED = "skipped"
+
+# ウォームアップ用のダミー入力（語彙の参照・疎行列演算・確率計算を一通り通す）
+WARMUP_SNIPPETS = [
+    "def main():\n    print('hello world')\n\nif __name__ == '__main__':\n    main()\n",
+    "#include <stdio.h>\nint main(void) {\n    printf(\"hello\\n\");\n    return 0;\n}\n",
+    "function greet(name) {\n  console.log(`hello ${name}`);\n}\ngreet('world');\n",
+]
+
+
+def warmup_model_ids(model_info: Dict[str, Any]) -> List[str]:
+    """先読みするモデルID（デフォルトモデルを先頭に、is_activeのモデル）"""
+    model_ids = []
+    default_model_id = model_info.get("default_model_id")
+    if default_model_id:
+        model_ids.append(default_model_id)
+    for model in model_info["models"]:
+        if model.get("is_active") and model["id"] not in model_ids:
+            model_ids.append(model["id"])
+    return model_ids
+
+
+# これより要素数の多いコンテナ（語彙の辞書など）は配列を含まないとみなして中をたどらない
+_TOUCH_MAX_CONTAINER = 64
+
+
+def _touch_arrays(obj: Any) -> None:
+    """係数・語彙・IDFなどの配列を一度読み、メモリマップされたページをメモリに載せる
+
+    前処理器の中のベクトライザーやPipelineの各段など、入れ子になった推定器の属性もたどる。
+    """
+    seen = set()
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            if item.size and item.dtype.kind in "biuf":
+                item.sum()
+        elif isinstance(item, (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)):
+            continue
+        elif isinstance(item, dict):
+            if len(item) <= _TOUCH_MAX_CONTAINER:
+                stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            if len(item) <= _TOUCH_MAX_CONTAINER:
+                stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+
+
+class ModelWarmer:
+    """バックグラウンドスレッドでモデルを読み込み、ダミー推論でウォームアップする
+
+    画面側はstatus()で各モデルの状態（pending/loading/warming/ready/error/skipped）を確認し、
+    準備が終わるまで待たずに描画できる。読み込んだモデルはModelManager側にキャッシュされる。
+    """
+
+    def __init__(self, model_manager: ModelManager, model_ids: List[str],
+                 n_warmup_rounds: int = 2):
+        self.model_manager = model_manager
+        self.model_ids = list(model_ids)
+        self.n_warmup_rounds = n_warmup_rounds
+        self._statuses: Dict[str, Dict[str, Any]] = {
+            model_id: {"state": PENDING} for model_id in self.model_ids
+        }
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ModelWarmer":
+        """ウォームアップスレッドを開始（開始済みなら何もしない）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """全モデルの処理が終わるまで待つ（終わっていればTrue）"""
+        if self._thread is None:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def status(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """モデルの状態（ウォームアップ対象外ならNone）"""
+        with self._lock:
+            status = self._statuses.get(model_id)
+            return dict(status) if status is not None else None
+
+    def statuses(self) -> Dict[str, Dict[str, Any]]:
+        """全モデルの状態"""
+        with self._lock:
+            return {model_id: dict(status) for model_id, status in self._statuses.items()}
+
+    def _set_status(self, model_id: str, **status: Any) -> None:
+        with self._lock:
+            self._statuses[model_id].update(status)
+
+    def _run(self) -> None:
+        for i, model_id in enumerate(self.model_ids):
+            # 先に読んだモデル（デフォルトモデルなど）を追い出してまで先読みしない
+            if i > 0 and self.model_manager.is_cache_full():
+                self._set_status(model_id, state=SKIPPED)
+                continue
+            self._warm(model_id)
+
+    def _warm(self, model_id: str) -> None:
+        try:
+            self._set_status(model_id, state=LOADING)
+            start = time.perf_counter()
+            # 前処理器の再構築が必要なモデルはこのスレッドで完了を待つ
+            model, preprocessor = self.model_manager.get_model_and_preprocessor(model_id, wait=True)
+            loaded = time.perf_counter()
+
+            self._set_status(model_id, state=WARMING, load_seconds=loaded - start)
+            _touch_arrays(model.model)
+            _touch_arrays(preprocessor)
+            # 推論結果キャッシュは使わない（ダミー入力でキャッシュを埋めない）
+            inference = WebInference(model, preprocessor)
+            for _ in range(self.n_warmup_rounds):
+                failed = [r["error"] for r in inference.predict_batch(WARMUP_SNIPPETS) if not r["success"]]
+                if failed:
+                    raise RuntimeError(f"ダミー推論に失敗しました: {failed[0]}")
+            self._set_status(model_id, state=READY, warmup_seconds=time.perf_counter() - loaded)
+            print(f"🔥 モデルの準備完了: {model_id} ({time.perf_counter() - start:.2f}s)")
+        except Exception as e:
+            self._set_status(model_id, state=ERROR, error=str(e))
+            print(f"⚠️ モデルのウォームアップに失敗しました: {model_id}: {e}")
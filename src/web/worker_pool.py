@@ -0,0 +1,370 @@
+"""
+推論ワーカープール（pre-fork）
+親プロセスでモデルを1回だけ読み込み、gc.freeze()した後にforkしたワーカーが
+読み取り専用のままコピーオンライトで共有する。sklearnの前処理はGILを持つため、
+1プロセスでは1コアしか使えない推論をコア数に応じて並列化する。
+
+ワーカーは起動時にforkした単一スレッドのzygoteプロセスからforkする。親プロセスに
+スレッド（イベントループのexecutorやウォームアップなど）が増えた後にforkすると、
+他のスレッドが持っていたロック（logging・mallocなど）を子プロセスが取れずに止まることがあるため。
+
+使い方:
+    manager = ModelManager()
+    pool = InferenceWorkerPool(manager, ["lr_baseline_001"], n_workers=4).start()
+    future = pool.submit("lr_baseline_001", ["def main(): ..."])  # concurrent.futures.Future
+    results = future.result()  # WebInference.predict_batchと同じ形式
+    pool.close()
+"""
+import gc
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection, wait
+from typing import Any, Dict, List, Optional
+
+from ..utils.memory import process_memory_bytes
+from .inference import WebInference
+from .model_manager import ModelManager
+
+
+# ワーカーが落ちたときに、処理中だったタスクを別のワーカーで再実行する回数
+DEFAULT_MAX_RETRIES = 1
+
+# 1タスクの処理時間の上限（秒）。超えたワーカーは止まっているとみなして終了させ、再起動する
+DEFAULT_TASK_TIMEOUT = 60.0
+
+
+class WorkerCrashedError(RuntimeError):
+    """タスクを処理中のワーカーが異常終了し、再実行の上限に達した"""
+
+
+class WorkerTimeoutError(TimeoutError):
+    """タスクがtask_timeout秒以内に終わらなかった"""
+
+
+@dataclass
+class _Task:
+    task_id: int
+    model_id: str
+    texts: List[str]
+    top_k: int
+    return_all_probabilities: bool
+    future: Future
+    attempts: int = 0
+    deadline: Optional[float] = None
+
+
+@dataclass
+class _Worker:
+    pid: int
+    conn: Connection
+    in_flight: Dict[int, _Task] = field(default_factory=dict)
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+    # 送信待ちのメッセージ（Noneはワーカーに終了を伝えて送信スレッドも終える）
+    outbox: "queue.SimpleQueue[Any]" = field(default_factory=queue.SimpleQueue)
+
+
+def _worker_main(conn: Connection, inferences: Dict[str, WebInference]) -> None:
+    """ワーカープロセスの処理（fork元から受け継いだモデルで推論する）"""
+    # Ctrl-Cは親プロセスが処理し、close()でワーカーを止める
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        task_id, model_id, texts, top_k, return_all = message
+        try:
+            results = inferences[model_id].predict_batch(
+                texts, top_k=top_k, return_all_probabilities=return_all
+            )
+            conn.send((task_id, results, None))
+        except Exception as e:
+            conn.send((task_id, None, str(e)))
+
+
+def _zygote_main(control: socket.socket, parent_control: socket.socket,
+                 inferences: Dict[str, WebInference]) -> None:
+    """ワーカーをforkするプロセスの処理（単一スレッドのままforkを繰り返す）
+
+    親プロセスから接続のファイルディスクリプタを受け取るたびにワーカーをforkし、pidを返す。
+    親プロセスが制御用の接続を閉じたら終了する。
+    """
+    # fork時に受け継いだ親側の端を閉じる（親が閉じたときに切断を検知できるように）
+    parent_control.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 終了したワーカーは自動で回収する（親プロセスは接続の切断で終了を検知する）
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            message, fds, _, _ = socket.recv_fds(control, 16, 1)
+        except OSError:
+            break
+        if not message or not fds:
+            break
+        pid = os.fork()
+        if pid == 0:
+            control.close()
+            try:
+                _worker_main(Connection(fds[0]), inferences)
+            finally:
+                os._exit(0)
+        os.close(fds[0])
+        control.sendall(struct.pack("!i", pid))
+
+
+class InferenceWorkerPool:
+    """モデルを共有するforkワーカーに推論バッチを振り分けるプール
+
+    タスクは処理中の件数が最も少ないワーカーに送る。ワーカーが異常終了した場合は
+    zygoteから新しいワーカーをforkし直し、処理中だったタスクをmax_retries回まで再実行する。
+    task_timeout秒を超えたタスクはWorkerTimeoutErrorで失敗させ、そのワーカーを終了・再起動する。
+    ワーカーへの送信はワーカーごとの送信スレッドが行うため、submitは処理中のワーカーや
+    大きなバッチでも待たずに戻る（イベントループから呼べる）。
+    start()は他のスレッドを起動する前に呼ぶ（zygoteをforkするため）。
+    """
+
+    def __init__(self, model_manager: ModelManager, model_ids: List[str],
+                 n_workers: Optional[int] = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 task_timeout: Optional[float] = DEFAULT_TASK_TIMEOUT):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("InferenceWorkerPool requires the 'fork' start method (Linux/macOS)")
+        self.model_manager = model_manager
+        self.model_ids = list(model_ids)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+        self.restarts = 0
+        self.timeouts = 0
+        self.completed = 0
+        self._context = multiprocessing.get_context("fork")
+        self._zygote: Any = None
+        self._zygote_control: Optional[socket.socket] = None
+        self._spawn_lock = threading.Lock()
+        self._inferences: Dict[str, WebInference] = {}
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._closed = threading.Event()
+        self._collector: Optional[threading.Thread] = None
+
+    def start(self) -> "InferenceWorkerPool":
+        """モデルを読み込み、ワーカーをforkする"""
+        for model_id in self.model_ids:
+            model, preprocessor = self.model_manager.get_model_and_preprocessor(model_id, wait=True)
+            self._inferences[model_id] = WebInference(model, preprocessor)
+        # 読み込み済みのオブジェクトをGCの追跡対象から外し、ワーカーでのGCによるページのコピーを防ぐ
+        gc.collect()
+        gc.freeze()
+        self._zygote_control, zygote_end = socket.socketpair()
+        self._zygote = self._context.Process(
+            target=_zygote_main, args=(zygote_end, self._zygote_control, self._inferences), name="worker-pool-zygote", daemon=True
+        )
+        self._zygote.start()
+        zygote_end.close()
+        self._workers = [self._spawn_worker() for _ in range(self.n_workers)]
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def _spawn_worker(self) -> _Worker:
+        """zygoteにワーカーをforkさせる（このプロセスではforkしない）"""
+        parent_conn, child_conn = self._context.Pipe()
+        with self._spawn_lock:
+            socket.send_fds(self._zygote_control, [b"spawn"], [child_conn.fileno()])
+            child_conn.close()
+            reply = b""
+            while len(reply) < 4:
+                chunk = self._zygote_control.recv(4 - len(reply))
+                if not chunk:
+                    raise RuntimeError("Worker pool zygote exited")
+                reply += chunk
+        (pid,) = struct.unpack("!i", reply)
+        worker = _Worker(pid=pid, conn=parent_conn)
+        threading.Thread(target=self._send_loop, args=(worker,),
+                         name=f"worker-pool-sender-{pid}", daemon=True).start()
+        return worker
+
+    @staticmethod
+    def _send_loop(worker: _Worker) -> None:
+        """outboxのメッセージをワーカーに送る（送信中に他のワーカーへの振り分けや呼び出し元を止めない）"""
+        while True:
+            message = worker.outbox.get()
+            try:
+                with worker.send_lock:
+                    worker.conn.send(message)
+            except (OSError, EOFError):
+                # 送信先が落ちている（collectorが再起動し、in_flightのタスクを再実行する）
+                return
+            if message is None:
+                return
+
+    def submit(self, model_id: str, texts: List[str], top_k: int = 3,
+               return_all_probabilities: bool = True) -> Future:
+        """バッチをワーカーに送り、結果（predict_batchと同じ形式のリスト）のFutureを返す"""
+        if model_id not in self._inferences:
+            raise ValueError(f"Model {model_id} is not loaded in the worker pool")
+        task = _Task(next(self._task_ids), model_id, list(texts), top_k, return_all_probabilities, Future())
+        self._dispatch(task)
+        return task.future
+
+    def predict_batch(self, model_id: str, texts: List[str], top_k: int = 3,
+                      return_all_probabilities: bool = True) -> List[Dict[str, Any]]:
+        """submitして結果を待つ"""
+        return self.submit(model_id, texts, top_k, return_all_probabilities).result()
+
+    def _dispatch(self, task: _Task) -> None:
+        if self._closed.is_set():
+            raise RuntimeError("Worker pool is closed")
+        task.attempts += 1
+        if self.task_timeout is not None:
+            task.deadline = time.monotonic() + self.task_timeout
+        with self._lock:
+            worker = min(self._workers, key=lambda w: len(w.in_flight))
+            worker.in_flight[task.task_id] = task
+        worker.outbox.put((task.task_id, task.model_id, task.texts, task.top_k,
+                           task.return_all_probabilities))
+
+    def _collect(self) -> None:
+        """ワーカーからの結果を受け取り、落ちたワーカー・止まったワーカーを再起動する"""
+        while not self._closed.is_set():
+            with self._lock:
+                workers = list(self._workers)
+            waitables = {worker.conn: worker for worker in workers}
+            for ready in wait(list(waitables), timeout=0.5):
+                worker = waitables[ready]
+                # ワーカーが終了すると接続が切れる（EOF）
+                if not self._receive(worker) and not self._closed.is_set() and worker in self._workers:
+                    self._restart(worker)
+            self._expire(workers)
+
+    def _expire(self, workers: List[_Worker]) -> None:
+        """期限を過ぎたタスクを失敗させ、そのワーカーを終了させる（切断を検知して再起動する）"""
+        now = time.monotonic()
+        for worker in workers:
+            with self._lock:
+                expired = [task for task in worker.in_flight.values()
+                           if task.deadline is not None and task.deadline < now]
+                for task in expired:
+                    del worker.in_flight[task.task_id]
+                self.timeouts += len(expired)
+            if not expired:
+                continue
+            for task in expired:
+                task.future.set_exception(WorkerTimeoutError(
+                    f"Task {task.task_id} did not finish within {self.task_timeout}s"
+                ))
+            print(f"⚠️ 推論ワーカー(pid={worker.pid})が{self.task_timeout}秒以内に応答しないため終了させます")
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _receive(self, worker: _Worker) -> bool:
+        """結果を1件受け取る（接続が切れていればFalse）"""
+        try:
+            task_id, results, error = worker.conn.recv()
+        except (OSError, EOFError):
+            return False
+        with self._lock:
+            task = worker.in_flight.pop(task_id, None)
+            self.completed += 1
+        if task is not None:
+            if error is not None:
+                task.future.set_exception(RuntimeError(error))
+            else:
+                task.future.set_result(results)
+        return True
+
+    def _restart(self, worker: _Worker) -> None:
+        """異常終了したワーカーを入れ替え、処理中だったタスクを再実行する"""
+        replacement = self._spawn_worker()
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+            orphaned = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            self.restarts += 1
+        worker.outbox.put(None)
+        worker.conn.close()
+        print(f"⚠️ 推論ワーカー(pid={worker.pid})が終了しました。再起動しました "
+              f"(処理中のタスク {len(orphaned)}件)")
+        for task in orphaned:
+            if task.attempts > self.max_retries:
+                task.future.set_exception(WorkerCrashedError(
+                    f"Worker crashed while processing task {task.task_id} ({task.attempts} attempts)"
+                ))
+            else:
+                self._dispatch(task)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """親プロセスと各ワーカーのメモリ（PSSの合計がプール全体の実使用量の目安）"""
+        with self._lock:
+            pids = [worker.pid for worker in self._workers]
+        parent = process_memory_bytes(os.getpid())
+        workers = [process_memory_bytes(pid) for pid in pids]
+        processes = [parent] + workers
+        total_pss = None
+        if all(memory.get("pss") is not None for memory in processes):
+            total_pss = sum(memory["pss"] for memory in processes)
+        return {"parent": parent, "workers": workers, "total_pss": total_pss}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "n_workers": len(self._workers),
+                "models": list(self._inferences),
+                "in_flight": sum(len(worker.in_flight) for worker in self._workers),
+                "completed": self.completed,
+                "restarts": self.restarts,
+                "timeouts": self.timeouts
+            }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """ワーカーを停止する"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._collector is not None:
+            self._collector.join()
+        for worker in self._workers:
+            worker.outbox.put(None)
+        # 終了したワーカーの接続は切断（EOF）になる。期限までに切れなければ強制終了する
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            try:
+                while worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                    worker.conn.recv()
+            except (OSError, EOFError):
+                pass
+            else:
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            worker.conn.close()
+            for task in worker.in_flight.values():
+                if not task.future.done():
+                    task.future.set_exception(RuntimeError("Worker pool is closed"))
+        if self._zygote is not None:
+            # 制御用の接続を閉じるとzygoteは終了する
+            self._zygote_control.close()
+            self._zygote.join(timeout)
+            if self._zygote.is_alive():
+                self._zygote.terminate()
+        gc.unfreeze()
+
+    def __enter__(self) -> "InferenceWorkerPool":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -9,9 +9,22 @@ import time
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-from src.models.classifier import LogisticRegressionModel
 from src.web.inference import WebInference, validate_file_extension, validate_file_size
-from src.web.model_manager import ModelManager
+from src.web.model_manager import ModelManager, ModelNotReadyError
+from src.web.cache import PredictionCache
+from src.web.cascade import FirstStage
+from src.web.warmup import ModelWarmer, warmup_model_ids, READY, ERROR, SKIPPED
+
+
+# ウォームアップ状態の表示
+WARMUP_STATE_LABELS = {
+    "pending": "⏸️ 待機中",
+    "loading": "📥 読み込み中",
+    "warming": "🔥 ウォームアップ中",
+    READY: "✅ 準備完了",
+    ERROR: "❌ エラー",
+    SKIPPED: "💤 未読み込み（使用時に読み込み）",
+}
 
 
 # ページ設定
@@ -23,19 +36,43 @@ st.set_page_config(
 )
 
 
-@st.cache_resource
 def load_model_info():
-    """モデル情報を読み込み"""
-    with open("models_registry/model_info.json", "r") as f:
-        return json.load(f)
+    """モデル情報を読み込み（ModelManager側でファイル更新時のみ読み直す）"""
+    return get_model_manager().load_model_info()
 
 
 @st.cache_resource
+def get_prediction_cache():
+    """セッション間で共有する推論結果キャッシュ"""
+    return PredictionCache(max_entries=2048, max_bytes=32 * 1024 * 1024)
+
+
+@st.cache_resource
+def get_first_stage():
+    """拡張子・shebang・キーワードで判定できる入力はモデルを省略する前段（集計はセッション間で共有）"""
+    return FirstStage()
+
+
+@st.cache_resource
+def get_model_manager():
+    """セッション間で共有するモデル管理クラス"""
+    return ModelManager(prediction_cache=get_prediction_cache(), max_cache_bytes=512 * 1024 * 1024)
+
+
+@st.cache_resource
+def get_model_warmer():
+    """起動時にバックグラウンドでデフォルトモデルとアクティブなモデルを先読みする"""
+    model_ids = warmup_model_ids(load_model_info())
+    return ModelWarmer(get_model_manager(), model_ids).start()
+
+
 def load_model_and_preprocessor(model_id: str):
-    """モデルと前処理器を読み込み（キャッシュ付き）"""
+    """モデルと前処理器を読み込み（ModelManager側でキャッシュ）"""
     try:
-        model_manager = ModelManager()
-        return model_manager.get_model_and_preprocessor(model_id)
+        return get_model_manager().get_model_and_preprocessor(model_id)
+    except ModelNotReadyError:
+        # 前処理器の再構築中（呼び出し側で進捗を表示）
+        raise
     except Exception as e:
         st.error(f"モデル読み込みエラー: {e}")
         return None, None
@@ -59,6 +96,9 @@ def main():
         st.error(f"モデル情報の読み込みに失敗しました: {e}")
         return
     
+    # モデルの先読みはバックグラウンドで行い、画面はすぐに描画する
+    warmer = get_model_warmer()
+    
     # サイドバー: モデル選択と情報
     with st.sidebar:
         st.header("🤖 モデル選択")
@@ -85,6 +125,37 @@ def main():
         with st.expander("📝 説明"):
             st.write(selected_model['description'])
         
+        st.markdown("---")
+        st.header("🔥 モデルの状態")
+        for model in active_models:
+            status = warmer.status(model["id"])
+            label = WARMUP_STATE_LABELS[status["state"]] if status else "💤 未読み込み"
+            if status and status["state"] == READY:
+                label += f" ({status['load_seconds'] + status['warmup_seconds']:.1f}s)"
+            rebuild = get_model_manager().get_rebuild_status(model["id"])
+            if rebuild is not None and rebuild["stage"] not in ("done", "error"):
+                label += f" — 前処理器を再構築中 {rebuild['progress']:.0%}"
+            st.write(f"**{model['name']}**: {label}")
+            if status and status["state"] == ERROR:
+                st.caption(status["error"])
+        st.button("🔄 状態を更新")
+        
+        with st.expander("📈 モデルキャッシュ"):
+            cache_stats = get_model_manager().get_cache_stats()
+            st.write(f"**使用量**: {cache_stats['cached_bytes'] / (1024 * 1024):.1f} / "
+                     f"{cache_stats['max_cache_bytes'] / (1024 * 1024):.0f} MB")
+            st.write(f"**読み込み**: {cache_stats['loads']}回 ({cache_stats['load_seconds_total']:.1f}s)")
+            st.write(f"**ヒット**: {cache_stats['hits']}回 / **追い出し**: {cache_stats['evictions']}回")
+        
+        with st.expander("⚡ 前段判定"):
+            cascade_stats = get_first_stage().stats()
+            st.write(f"**モデルを省略**: {cascade_stats['skip_rate']:.0%} "
+                     f"({cascade_stats['paths']['prior']['count']} / {cascade_stats['requests']}件)")
+            for path, label in (("prior", "前段のみ"), ("model", "モデル"), ("blended", "モデル＋前段")):
+                path_stats = cascade_stats["paths"][path]
+                if path_stats["count"]:
+                    st.write(f"**{label}**: {path_stats['count']}件 / 平均 {path_stats['mean_ms']:.2f}ms")
+        
         st.markdown("---")
         st.header("⚙️ モデル管理")
         
@@ -153,14 +224,31 @@ def main():
         st.markdown(".py .js .java .cpp .c .h .cs .php .rb .go .rs .swift .kt .scala .r .sql .html .css .xml .json .yaml .md .txt など")
     
     # 選択されたモデルと前処理器読み込み
-    with st.spinner(f"🔄 {selected_model['name']} を読み込み中..."):
-        model, preprocessor = load_model_and_preprocessor(selected_model_id)
-        if model is None or preprocessor is None:
-            st.error("モデルの読み込みに失敗しました")
-            return
-    
-    # 推論エンジン初期化
-    inference_engine = WebInference(model, preprocessor)
+    # ウォームアップ中のモデルは待たずに状態を表示する（対象外・失敗したモデルはここで読み込む）
+    status = warmer.status(selected_model_id)
+    inference_engine = None
+    if status is not None and status["state"] not in (READY, ERROR, SKIPPED):
+        st.info(f"⏳ {selected_model['name']} を準備中です（{WARMUP_STATE_LABELS[status['state']]}）。"
+                "サイドバーの「状態を更新」で最新の状態を確認できます")
+    else:
+        try:
+            with st.spinner(f"🔄 {selected_model['name']} を読み込み中..."):
+                model, preprocessor = load_model_and_preprocessor(selected_model_id)
+        except ModelNotReadyError as e:
+            # 旧形式モデルの前処理器を再構築中（完了後は保存され、次回以降は再利用される）
+            st.info(f"⏳ {selected_model['name']} の前処理器を再構築中です（{e.status['stage']}、"
+                    f"{e.status['elapsed_seconds']:.0f}秒経過）。初回のみ時間がかかります")
+            st.progress(e.status["progress"])
+        else:
+            if model is None or preprocessor is None:
+                st.error("モデルの読み込みに失敗しました")
+                return
+            
+            # 推論エンジン初期化
+            inference_engine = WebInference(
+                model, preprocessor, cache=get_prediction_cache(), model_id=selected_model_id,
+                first_stage=get_first_stage()
+            )
     
     # メインエリア：推論インターフェース
     st.header("🔍 コード分析")
@@ -196,8 +284,9 @@ def main():
                     st.code(content[:1000] + ("..." if len(content) > 1000 else ""), language="text")
                 
                 # 推論実行
-                if st.button("🚀 言語を判定", key="file_predict"):
-                    predict_and_display(inference_engine, content, uploaded_file.name)
+                if st.button("🚀 言語を判定", key="file_predict", disabled=inference_engine is None):
+                    predict_and_display(inference_engine, content, uploaded_file.name,
+                                        filename=uploaded_file.name)
                     
             except UnicodeDecodeError:
                 st.error("❌ ファイルの文字エンコーディングが対応していません（UTF-8のみ対応）")
@@ -213,7 +302,7 @@ def main():
         )
         
         if text_input.strip():
-            if st.button("🚀 言語を判定", key="text_predict"):
+            if st.button("🚀 言語を判定", key="text_predict", disabled=inference_engine is None):
                 predict_and_display(inference_engine, text_input, "テキスト入力")
 
 
@@ -391,6 +480,10 @@ def delete_model(model_id: str):
         if os.path.exists(model_to_delete["file_path"]):
             os.remove(model_to_delete["file_path"])
         
+        # 削除したモデルの推論結果キャッシュを破棄
+        get_prediction_cache().invalidate(model_id)
+        get_model_manager().unload_model(model_id)
+        
         # モデル情報から削除
         model_info["models"] = [model for model in model_info["models"] if model["id"] != model_id]
         
@@ -413,11 +506,15 @@ def delete_model(model_id: str):
         st.error(f"❌ モデル削除エラー: {e}")
 
 
-def predict_and_display(inference_engine: WebInference, code: str, source_name: str):
-    """推論実行と結果表示"""
+def predict_and_display(inference_engine: WebInference, code: str, source_name: str,
+                        filename: str = None):
+    """推論実行と結果表示（filenameがあれば拡張子も判定に使う）"""
     
     with st.spinner("🤖 分析中..."):
-        result = inference_engine.predict_single_text(code)
+        # 全確率マップは作らず、表示に必要な上位20件だけを取得
+        result = inference_engine.predict_single_text(
+            code, top_k=20, return_all_probabilities=False, filename=filename
+        )
     
     if not result["success"]:
         st.error(f"❌ 推論エラー: {result['error']}")
@@ -436,22 +533,25 @@ def predict_and_display(inference_engine: WebInference, code: str, source_name:
     # 上位予測結果（確率付き）
     if "top_predictions" in result:
         st.subheader("🏆 上位予測結果")
-        for i, pred in enumerate(result["top_predictions"], 1):
+        for i, pred in enumerate(result["top_predictions"][:3], 1):
             confidence_percent = pred["confidence"] * 100
             st.write(f"**{i}位**: {pred['language']} ({confidence_percent:.2f}%)")
             st.progress(pred["confidence"])
         
         # 全結果（折りたたみ可能）
         with st.expander("📈 全予測結果を表示"):
-            all_probs = result["all_probabilities"]
-            sorted_probs = sorted(all_probs.items(), key=lambda x: x[1], reverse=True)
-            
-            for lang, prob in sorted_probs[:20]:  # 上位20位まで表示
-                st.write(f"{lang}: {prob*100:.2f}%")
+            for pred in result["top_predictions"]:  # 上位20位まで表示
+                st.write(f"{pred['language']}: {pred['confidence']*100:.2f}%")
     
     # 分析対象情報
     st.markdown("---")
     st.caption(f"📝 分析対象: {source_name}")
+    if "large_input" in result:
+        large_input = result["large_input"]
+        st.caption(f"✂️ 大きな入力のため {large_input['input_chars']:,}文字のうち "
+                   f"{large_input['window_chars']:,}文字 × {large_input['windows']}箇所を分析しました")
+    if result.get("cascade", {}).get("path") == "prior":
+        st.caption("⚡ 拡張子・shebang・キーワードから判定しました（モデルは使用していません）")
 
 
 if __name__ == "__main__":